@@ -0,0 +1,534 @@
+"""
+Fill the database configured in .env with a synthetic catalog, for the load
+test and the other benchmarks:
+
+    python -m benchmarks.catalog [--products 500000] [--variants 4] [--depth 4]
+        [--fanout 6] [--brands 2000] [--tags 5000] [--prefix synthetic]
+
+Categories form a full tree of --depth levels with --fanout children each;
+products go to its leaves. Names are drawn from a small vocabulary so search
+terms match realistic numbers of products, and brands, categories, tags and
+sales follow a Zipf-like skew so a few are far more popular than the rest.
+Every slug starts with --prefix: run again with another prefix to add more.
+
+Rows are inserted in batches of --batch-size, each committed with its
+variants, links and price stats. Afterwards the Redis side (search index,
+suggestions, leaderboards, counts, category index and cached listings) is
+rebuilt, unless --skip-redis. Products need an existing seller, --seller-id.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate, batched
+
+from sqlalchemy import Connection, Table, insert, select
+
+from src import database
+from src.cache.tags import PRODUCT_LIST_TAG, PRODUCT_SEARCH_TAG, invalidate_tags
+from src.common.models import Media, User
+from src.common.utils import generate_public_id
+from src.config import settings
+from src.database import (
+    AsyncSessionLocal,
+    close_redis_pool,
+    engine,
+    get_sync_redis,
+    init_redis_pool,
+)
+from src.product.associations import (
+    ProductAttributeLink,
+    ProductImageLink,
+    ProductTagLink,
+    ProductVariantAttributeVariantLink,
+)
+from src.product.category_tree import CATEGORY_INDEX_VERSION_KEY
+from src.product.counts import refresh_product_counts
+from src.product.enums import (
+    ExchangePolicy,
+    ProductStatus,
+    ProductType,
+    ReturnPolicy,
+    StockStatus,
+)
+from src.product.leaderboards import rebuild_leaderboards
+from src.product.models import (
+    Attribute,
+    AttributeVariant,
+    Brand,
+    Category,
+    Product,
+    ProductVariant,
+    Tag,
+)
+from src.product.price_stats import refresh_price_stats
+from src.product.search_index import SEARCH_READY_KEY, rebuild_search_index
+from src.product.suggest import rebuild_suggestions
+
+ADJECTIVES = [
+    "classic",
+    "slim",
+    "regular",
+    "relaxed",
+    "premium",
+    "essential",
+    "vintage",
+    "modern",
+    "casual",
+    "formal",
+    "lightweight",
+    "heavyweight",
+    "soft",
+    "stretch",
+    "oversized",
+    "cropped",
+    "striped",
+    "printed",
+    "washed",
+    "organic",
+]
+MATERIALS = [
+    "cotton",
+    "linen",
+    "denim",
+    "wool",
+    "silk",
+    "leather",
+    "polyester",
+    "fleece",
+    "jersey",
+    "twill",
+    "corduroy",
+    "cashmere",
+]
+GARMENTS = [
+    "shirt",
+    "t-shirt",
+    "polo",
+    "hoodie",
+    "sweater",
+    "jacket",
+    "coat",
+    "blazer",
+    "jeans",
+    "chinos",
+    "shorts",
+    "trousers",
+    "dress",
+    "skirt",
+    "cardigan",
+    "vest",
+    "joggers",
+    "parka",
+    "overshirt",
+    "sweatshirt",
+]
+COLORS = [
+    "black",
+    "white",
+    "navy",
+    "grey",
+    "olive",
+    "beige",
+    "brown",
+    "red",
+    "blue",
+    "green",
+    "pink",
+]
+ATTRIBUTES = {
+    "Size": ["XS", "S", "M", "L", "XL", "XXL"],
+    "Color": [color.title() for color in COLORS],
+    "Material": [material.title() for material in MATERIALS],
+}
+STATUS_WEIGHTS = {
+    ProductStatus.PUBLISHED: 90,
+    ProductStatus.DRAFT: 5,
+    ProductStatus.PENDING: 3,
+    ProductStatus.ARCHIVED: 2,
+}
+MEDIA_COUNT = 200
+
+
+def zipf_weights(count: int, skew: float = 1.1) -> list[float]:
+    """Cumulative weights of a Zipf-like distribution over `count` ranks"""
+    return list(accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+def common_fields(now: datetime) -> dict:
+    return {
+        "public_id": generate_public_id(),
+        "created_at": now,
+        "updated_at": now,
+        "is_active": True,
+    }
+
+
+def insert_rows(connection: Connection, model: type, rows: list[dict]) -> list[int]:
+    """Insert `rows` in one batch and return their ids, in order"""
+    if not rows:
+        return []
+    table: Table = model.__table__
+    return list(
+        connection.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars()
+    )
+
+
+def insert_links(connection: Connection, model: type, rows: list[dict]) -> None:
+    if rows:
+        connection.execute(insert(model.__table__), rows)
+
+
+def seed_user(connection: Connection, prefix: str, now: datetime) -> int:
+    email = f"{prefix}-catalog@example.com"
+    user_id = connection.scalar(select(User.id).filter(User.email == email))
+    if user_id is None:
+        (user_id,) = insert_rows(
+            connection,
+            User,
+            [
+                {
+                    **common_fields(now),
+                    "email": email,
+                    "password": None,
+                    "is_verified": True,
+                }
+            ],
+        )
+    return user_id
+
+
+def create_media(
+    connection: Connection, prefix: str, user_id: int, now: datetime
+) -> list[int]:
+    return insert_rows(
+        connection,
+        Media,
+        [
+            {
+                **common_fields(now),
+                "name": f"{prefix} image {i}",
+                "alt_text": f"{prefix} image {i}",
+                "s3_key": f"{prefix}/images/{i}.jpg",
+                "created_by_id": user_id,
+                "updated_by_id": user_id,
+            }
+            for i in range(MEDIA_COUNT)
+        ],
+    )
+
+
+def create_categories(
+    connection: Connection,
+    prefix: str,
+    media: list[int],
+    depth: int,
+    fanout: int,
+    now: datetime,
+) -> list[int]:
+    """Build the tree level by level; returns the leaf ids"""
+    level: list[int | None] = [None]
+    for d in range(depth):
+        rows = []
+        for parent_index, parent_id in enumerate(level):
+            for i in range(fanout):
+                number = parent_index * fanout + i
+                garment = GARMENTS[number % len(GARMENTS)]
+                rows.append(
+                    {
+                        **common_fields(now),
+                        "name": f"{garment.title()} {d}.{number}",
+                        "slug": f"{prefix}-category-{d}-{number}",
+                        "image_id": random.choice(media),
+                        "banner_id": random.choice(media),
+                        "parent_id": parent_id,
+                    }
+                )
+        level = insert_rows(connection, Category, rows)
+    return level
+
+
+def create_named(
+    connection: Connection,
+    model: type,
+    prefix: str,
+    count: int,
+    now: datetime,
+    **extra: object,
+) -> list[int]:
+    """`count` brands or tags with vocabulary names and unique slugs"""
+    words = ADJECTIVES + MATERIALS + COLORS
+    ids = []
+    for chunk in batched(range(count), 5000):
+        ids += insert_rows(
+            connection,
+            model,
+            [
+                {
+                    **common_fields(now),
+                    "name": f"{random.choice(words).title()} {i}",
+                    "slug": f"{prefix}-{model.__tablename__}-{i}",
+                    **extra,
+                }
+                for i in chunk
+            ],
+        )
+    return ids
+
+
+def create_attributes(
+    connection: Connection, prefix: str, now: datetime
+) -> dict[int, list[int]]:
+    """Attribute id -> its variant ids"""
+    attributes = {}
+    for name, values in ATTRIBUTES.items():
+        (attribute_id,) = insert_rows(
+            connection,
+            Attribute,
+            [
+                {
+                    **common_fields(now),
+                    "name": f"{name} {prefix}",
+                    "slug": f"{prefix}-{name.lower()}",
+                }
+            ],
+        )
+        attributes[attribute_id] = insert_rows(
+            connection,
+            AttributeVariant,
+            [
+                {**common_fields(now), "name": value, "attribute_id": attribute_id}
+                for value in values
+            ],
+        )
+    return attributes
+
+
+class Catalog:
+    """The shared rows products are drawn from, and the skews to draw with"""
+
+    def __init__(
+        self,
+        args: argparse.Namespace,
+        media: list[int],
+        leaves: list[int],
+        brands: list[int],
+        tags: list[int],
+        attributes: dict[int, list[int]],
+    ) -> None:
+        self.args = args
+        self.media = media
+        self.leaves = leaves
+        self.brands = brands
+        self.tags = tags
+        self.attributes = attributes
+        # Shuffled so the popular ones are not simply the first inserted
+        for ids in (self.leaves, self.brands, self.tags):
+            random.shuffle(ids)
+        self.leaf_weights = zipf_weights(len(leaves), skew=0.8)
+        self.brand_weights = zipf_weights(len(brands))
+        self.tag_weights = zipf_weights(len(tags))
+
+    def product(self, number: int, now: datetime) -> dict:
+        adjective, material, garment = (
+            random.choice(ADJECTIVES),
+            random.choice(MATERIALS),
+            random.choice(GARMENTS),
+        )
+        name = f"{adjective.title()} {material} {garment} {number}"
+        slug = f"{self.args.prefix}-{adjective}-{material}-{garment}-{number}"
+        (status,) = random.choices(list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values()))
+        return {
+            **common_fields(now - timedelta(minutes=random.randrange(525_600))),
+            "name": name,
+            "slug": slug,
+            "product_no": f"{self.args.prefix.upper()}-{number:08d}",
+            "description": f"{name}, made of {material}.",
+            "short_description": f"{adjective.title()} {material} {garment}",
+            "meta_description": None,
+            "video": None,
+            "delivery_time": random.randint(1, 10),
+            "stock_management": True,
+            "rating": Decimal(random.randint(100, 500)) / 100,
+            # Heavy tail: most products sell little, a few sell a lot
+            "total_sold": int(random.paretovariate(1.2) * 10) - 10,
+            "type": ProductType.VARIABLE,
+            "status": status,
+            "return_policy": random.choice(list(ReturnPolicy)),
+            "exchange_policy": random.choice(list(ExchangePolicy)),
+            "stock_status": StockStatus.IN_STOCK,
+            "brand_id": random.choices(self.brands, cum_weights=self.brand_weights)[0]
+            if self.brands
+            else None,
+            "category_id": random.choices(self.leaves, cum_weights=self.leaf_weights)[
+                0
+            ],
+            "seller_id": self.args.seller_id,
+            "size_guide_id": None,
+        }
+
+    def variants(self, product_id: int, now: datetime) -> list[dict]:
+        count = max(1, round(random.gauss(self.args.variants, self.args.variants / 3)))
+        base = Decimal(random.randrange(500, 10_000)).quantize(Decimal("0.01"))
+        rows = []
+        for _ in range(count):
+            regular = base + random.randrange(0, 500)
+            discounted = random.random() < 0.4
+            stock = random.choice((0, *range(1, 100)))
+            rows.append(
+                {
+                    **common_fields(now),
+                    "sku": generate_public_id(),
+                    "description": None,
+                    "image_id": random.choice(self.media),
+                    "product_id": product_id,
+                    "regular_price": regular,
+                    "discount_price": (
+                        regular * Decimal(random.uniform(0.5, 0.95))
+                    ).quantize(Decimal("0.01"))
+                    if discounted
+                    else None,
+                    "discount_start_date": now - timedelta(days=7)
+                    if discounted
+                    else None,
+                    "discount_end_date": now + timedelta(days=random.randint(-3, 30))
+                    if discounted
+                    else None,
+                    "stock_status": StockStatus.IN_STOCK
+                    if stock
+                    else StockStatus.OUT_OF_STOCK,
+                    "stock": stock,
+                    "low_stock_threshold": 5,
+                }
+            )
+        return rows
+
+    def insert_batch(
+        self, connection: Connection, numbers: range, now: datetime
+    ) -> None:
+        product_ids = insert_rows(
+            connection, Product, [self.product(number, now) for number in numbers]
+        )
+        variants = [row for id in product_ids for row in self.variants(id, now)]
+        variant_ids = insert_rows(connection, ProductVariant, variants)
+
+        attribute_links, variant_links, tag_links, image_links = [], [], [], []
+        for product_id in product_ids:
+            for attribute_id in self.attributes:
+                attribute_links.append(
+                    {"product_id": product_id, "attribute_id": attribute_id}
+                )
+            tags = (
+                {
+                    *random.choices(
+                        self.tags,
+                        cum_weights=self.tag_weights,
+                        k=self.args.tags_per_product,
+                    )
+                }
+                if self.tags
+                else set()
+            )
+            tag_links += [{"product_id": product_id, "tag_id": id} for id in tags]
+            images = random.sample(self.media, k=3)
+            image_links += [
+                {"product_id": product_id, "image_id": id, "priority": priority}
+                for priority, id in enumerate(images, start=1)
+            ]
+        for variant_id in variant_ids:
+            variant_links += [
+                {
+                    "product_variant_id": variant_id,
+                    "attribute_variant_id": random.choice(values),
+                }
+                for values in self.attributes.values()
+            ]
+
+        insert_links(connection, ProductAttributeLink, attribute_links)
+        insert_links(connection, ProductVariantAttributeVariantLink, variant_links)
+        insert_links(connection, ProductTagLink, tag_links)
+        insert_links(connection, ProductImageLink, image_links)
+        refresh_price_stats(connection, product_ids)
+
+
+async def refresh_redis() -> None:
+    """Rebuild what Redis derives from the catalog and drop cached listings"""
+    sync_redis = get_sync_redis()
+    sync_redis.incr(CATEGORY_INDEX_VERSION_KEY)
+    invalidate_tags(sync_redis, [PRODUCT_LIST_TAG, PRODUCT_SEARCH_TAG])
+    await init_redis_pool()
+    try:
+        redis = database.redis_pool
+        async with AsyncSessionLocal() as db:
+            await refresh_product_counts(redis, db)
+            await rebuild_suggestions(redis, db)
+            if settings.LEADERBOARDS_ENABLED:
+                await rebuild_leaderboards(redis, db)
+        await redis.delete(SEARCH_READY_KEY)
+        await rebuild_search_index(redis)
+    finally:
+        await close_redis_pool()
+
+
+def main(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    now = datetime.now().replace(microsecond=0)
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        user_id = seed_user(connection, args.prefix, now)
+        media = create_media(connection, args.prefix, user_id, now)
+        leaves = create_categories(
+            connection, args.prefix, media, args.depth, args.fanout, now
+        )
+        brands = create_named(
+            connection,
+            Brand,
+            args.prefix,
+            args.brands,
+            now,
+            description=None,
+            image_id=media[0],
+            seller_id=None,
+        )
+        tags = create_named(connection, Tag, args.prefix, args.tags, now)
+        attributes = create_attributes(connection, args.prefix, now)
+    catalog = Catalog(args, media, leaves, brands, tags, attributes)
+    print(
+        f"{len(leaves)} leaf categories, {len(brands)} brands, {len(tags)} tags "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+    done = 0
+    for numbers in batched(range(args.products), args.batch_size):
+        with engine.begin() as connection:
+            catalog.insert_batch(connection, range(numbers[0], numbers[-1] + 1), now)
+        done += len(numbers)
+        elapsed = time.perf_counter() - start
+        print(f"{done:>9} products  {done / elapsed:8.0f}/s", end="\r", flush=True)
+    print(f"\n{done} products in {time.perf_counter() - start:.1f}s")
+
+    if not args.skip_redis:
+        asyncio.run(refresh_redis())
+        print(f"Redis rebuilt, {time.perf_counter() - start:.1f}s in total")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=500_000)
+    parser.add_argument("--variants", type=int, default=4, help="mean per product")
+    parser.add_argument("--depth", type=int, default=4, help="category levels")
+    parser.add_argument("--fanout", type=int, default=6, help="children per category")
+    parser.add_argument("--brands", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=5000)
+    parser.add_argument("--tags-per-product", type=int, default=4)
+    parser.add_argument("--seller-id", type=int, default=1)
+    parser.add_argument("--prefix", default="synthetic")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-redis", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,259 @@
+"""
+Drive every /product route of a running app with a realistic request mix
+and report throughput and latency percentiles, cold then warm:
+
+    python -m benchmarks.load [--base-url http://localhost:8000]
+        [--duration 30] [--concurrency 32] [--phase both]
+
+Targets are sampled from the database configured in .env (run
+benchmarks.catalog first for a realistic one): product slugs, categories
+and search terms are picked with a Zipf-like skew over their popularity, so
+a few hot keys take most of the traffic, as they do in production. The
+cold phase starts by deleting every cached response in the Redis of .env;
+the warm phase then repeats the run with the cache the cold one filled.
+All traffic comes from one client, so run the app with RATE_LIMIT_ENABLED=false.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from itertools import accumulate
+
+import httpx
+from sqlalchemy import func, select
+
+from src import database
+from src.cache.keys import KeyFamily
+from src.cache.local import INVALIDATION_CHANNEL, invalidation_message
+from src.database import AsyncSessionLocal, close_redis_pool, init_redis_pool
+from src.product.enums import ProductStatus
+from src.product.models import Category, Product
+
+from .search import percentile
+
+# Share of the traffic each route gets
+ROUTE_WEIGHTS = {
+    "product": 40,
+    "list": 18,
+    "search": 15,
+    "suggest": 12,
+    "top_products": 8,
+    "category": 4,
+    "category_tree": 3,
+}
+SAMPLE_SIZE = 5000
+
+
+class Targets:
+    """Request paths for each route, drawn from the sampled catalog"""
+
+    def __init__(
+        self, slugs: list[str], categories: list[str], terms: list[str]
+    ) -> None:
+        self.slugs = slugs
+        self.categories = categories
+        self.terms = terms
+        self.weights = {
+            name: list(accumulate(1 / rank**1.1 for rank in range(1, len(values) + 1)))
+            for name, values in (
+                ("slugs", slugs),
+                ("categories", categories),
+                ("terms", terms),
+            )
+        }
+        self.routes: dict[str, Callable[[], tuple[str, dict]]] = {
+            "product": lambda: (f"/product/{self.pick('slugs')}", {}),
+            "list": lambda: ("/product", {"page": self.page(), "size": 20}),
+            "search": lambda: (
+                "/product/search",
+                {"search": self.pick("terms"), "page": self.page()},
+            ),
+            "suggest": lambda: (
+                "/product/suggest",
+                {"search": self.pick("terms")[: random.randint(1, 5)]},
+            ),
+            "top_products": lambda: (
+                "/product/category/top-products",
+                {"slug": self.pick("categories")},
+            ),
+            "category": lambda: (
+                "/product/category",
+                {"slug": self.pick("categories")},
+            ),
+            "category_tree": lambda: ("/product/category/tree", {}),
+        }
+
+    def pick(self, name: str) -> str:
+        values = getattr(self, name)
+        return random.choices(values, cum_weights=self.weights[name])[0]
+
+    @staticmethod
+    def page() -> int:
+        """Mostly the first pages, now and then a deep one"""
+        return min(int(random.paretovariate(1.5)), 500)
+
+    def request(self) -> tuple[str, str, dict]:
+        (route,) = random.choices(list(ROUTE_WEIGHTS), list(ROUTE_WEIGHTS.values()))
+        return route, *self.routes[route]()
+
+
+async def sample_targets() -> Targets:
+    """Popular products, categories and words first, as the skew expects"""
+    async with AsyncSessionLocal() as db:
+        slugs = list(
+            await db.scalars(
+                select(Product.slug)
+                .filter(Product.is_active, Product.status == ProductStatus.PUBLISHED)
+                .order_by(Product.total_sold.desc())
+                .limit(SAMPLE_SIZE)
+            )
+        )
+        categories = list(
+            await db.scalars(
+                select(Category.slug)
+                .join(Product, Product.category_id == Category.id)
+                .filter(Category.is_active)
+                .group_by(Category.slug)
+                .order_by(func.sum(Product.total_sold).desc())
+            )
+        )
+    words: dict[str, int] = defaultdict(int)
+    for slug in slugs:
+        for word in slug.split("-"):
+            if len(word) > 2 and not word.isdigit():
+                words[word] += 1
+    terms = sorted(words, key=words.get, reverse=True)
+    if not slugs or not categories:
+        raise SystemExit("No published products: run benchmarks.catalog first")
+    return Targets(slugs, categories, terms)
+
+
+async def flush_cached_responses() -> int:
+    """Delete every cached route response; returns how many keys it dropped"""
+    redis = database.redis_pool
+
+    async def drop(keys: list[bytes]) -> int:
+        # Announced like any invalidation, so workers drop their local copies
+        await redis.publish(
+            INVALIDATION_CHANNEL, invalidation_message(key.decode() for key in keys)
+        )
+        return await redis.unlink(*keys)
+
+    deleted = 0
+    for family in KeyFamily:
+        batch = []
+        async for key in redis.scan_iter(match=f"{family.value}:*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                deleted += await drop(batch)
+                batch = []
+        if batch:
+            deleted += await drop(batch)
+    return deleted
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.hits: dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, latency: float, response: httpx.Response) -> None:
+        self.latencies[route].append(latency)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        if response.headers.get("X-Cache") == "HIT":
+            self.hits[route] += 1
+
+    def report(self, label: str, elapsed: float) -> None:
+        total = sum(len(samples) for samples in self.latencies.values())
+        print(
+            f"\n{label}: {total} requests in {elapsed:.1f}s, {total / elapsed:,.0f} req/s"
+        )
+        print(
+            f"{'route':<14} {'reqs':>7} {'req/s':>8} {'errors':>6} {'hit %':>6} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'mean':>8}  ms"
+        )
+        everything = [
+            latency for samples in self.latencies.values() for latency in samples
+        ]
+        for route, samples in [*sorted(self.latencies.items()), ("all", everything)]:
+            if not samples:
+                continue
+            if route == "all":
+                errors, hits = sum(self.errors.values()), sum(self.hits.values())
+            else:
+                errors, hits = self.errors[route], self.hits[route]
+            print(
+                f"{route:<14} {len(samples):>7} {len(samples) / elapsed:>8,.0f} "
+                f"{errors:>6} {hits / len(samples):>6.0%} "
+                f"{percentile(samples, 50):>8.2f} {percentile(samples, 95):>8.2f} "
+                f"{percentile(samples, 99):>8.2f} {statistics.mean(samples):>8.2f}"
+            )
+
+
+async def run_phase(
+    client: httpx.AsyncClient, targets: Targets, duration: float, concurrency: int
+) -> tuple[Stats, float]:
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    async def user() -> None:
+        while time.monotonic() < deadline:
+            route, path, params = targets.request()
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, params=params)
+            except httpx.HTTPError:
+                stats.errors[route] += 1
+                continue
+            stats.record(route, (time.perf_counter() - start) * 1000, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return stats, time.perf_counter() - start
+
+
+async def main(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    await init_redis_pool()
+    try:
+        targets = await sample_targets()
+        print(
+            f"{len(targets.slugs)} products, {len(targets.categories)} categories, "
+            f"{len(targets.terms)} search terms sampled"
+        )
+        limits = httpx.Limits(
+            max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+        )
+        async with httpx.AsyncClient(
+            base_url=args.base_url, limits=limits, timeout=args.timeout
+        ) as client:
+            if args.phase in ("cold", "both"):
+                print(f"flushed {await flush_cached_responses()} cached responses")
+                stats, elapsed = await run_phase(
+                    client, targets, args.duration, args.concurrency
+                )
+                stats.report("cold cache", elapsed)
+            if args.phase in ("warm", "both"):
+                stats, elapsed = await run_phase(
+                    client, targets, args.duration, args.concurrency
+                )
+                stats.report("warm cache", elapsed)
+    finally:
+        await close_redis_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per phase")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--phase", choices=("cold", "warm", "both"), default="both")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,369 @@
+"""
+Microbenchmarks of the hot helpers and serialization paths, in process:
+Redis is a fakeredis instance (`uv sync --extra bench`) and no database
+is needed.
+
+    python -m benchmarks.micro [--rounds 7] [--min-time 0.2] [name ...]
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json [--tolerance 0.15]
+
+Each benchmark is calibrated to run for at least --min-time seconds per
+round with the garbage collector off; the reported ops/sec is the median
+of the rounds and the spread is how far the slowest round fell behind
+the fastest. Allocations are the bytes and blocks one call leaves
+allocated at its peak, traced with tracemalloc outside the timed rounds.
+
+With --compare, exits non-zero when a benchmark lost more than
+--tolerance of its ops/sec or allocates more per call than the baseline.
+"""
+
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import partial
+from types import SimpleNamespace
+from typing import Any, NamedTuple
+
+from fakeredis import FakeAsyncRedis
+
+from src import database
+from src.cache.cache import Cache
+from src.cache.codecs import (
+    CODECS,
+    COMPRESSION_NONE,
+    CacheEntry,
+    pack_entry,
+    unpack_entry,
+)
+from src.cache.keys import CacheKey, product_key
+from src.common.filters import PaginationResponse
+from src.common.response import create_response, render_response
+from src.common.utils import json_serializer
+from src.product.category_tree import (
+    CATEGORY_INDEX_VERSION_KEY,
+    category_index_key,
+)
+from src.product.enums import StockStatus
+from src.product.models import ProductVariant
+from src.product.schemas import ProductVariantShortOut
+from src.product.utlis import get_category_and_descendants, get_response
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable[[], Any]  # plain or async, called with no arguments
+
+
+class Result(NamedTuple):
+    name: str
+    ops: float  # median ops/sec over the rounds
+    spread: float  # (fastest - slowest) / fastest round
+    alloc_bytes: int  # peak bytes allocated by one call
+    alloc_blocks: int  # blocks still allocated by one call at its end
+
+
+# Fixtures, built once so the benchmarks only time the code under test
+
+NOW = datetime(2025, 6, 1, 12, 0)
+PAGE_SIZE = 20
+
+
+def product_rows(count: int = PAGE_SIZE) -> list[tuple]:
+    """Rows shaped like products_query results: product, then price stats"""
+    return [
+        (
+            SimpleNamespace(
+                id=i,
+                name=f"Premium cotton shirt {i}",
+                slug=f"premium-cotton-shirt-{i}",
+                public_id=f"pub{i:08d}",
+                rating=Decimal("4.35"),
+                total_sold=1000 - i,
+            ),
+            None,
+            Decimal("1200.00"),
+            Decimal("1500.00"),
+            Decimal("990.00"),
+            Decimal("1290.00"),
+            Decimal("17.5"),
+        )
+        for i in range(count)
+    ]
+
+
+def variant_data(count: int = 6) -> list[dict]:
+    return [
+        {
+            "public_id": f"var{i:08d}",
+            "regular_price": Decimal("1500.00"),
+            "discount_price": Decimal("1290.00") if i % 2 else None,
+            "stock": 10 * i,
+            "stock_status": StockStatus.IN_STOCK,
+            "attribute_variants": [
+                {
+                    "public_id": f"att{i}",
+                    "name": "XL",
+                    "attribute": {"public_id": "a1", "name": "Size"},
+                }
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def category_rows(depth: int = 4, fanout: int = 6) -> list[list]:
+    """A full tree: `fanout` children per category, `depth` levels"""
+    rows, level, next_id = [], [None], 1
+    for _ in range(depth):
+        children = []
+        for parent in level:
+            for _ in range(fanout):
+                rows.append(
+                    [
+                        next_id,
+                        parent,
+                        f"cat{next_id}",
+                        f"Category {next_id}",
+                        f"category-{next_id}",
+                    ]
+                )
+                children.append(next_id)
+                next_id += 1
+        level = children
+    return rows
+
+
+PAGE = get_response(product_rows())
+PAGINATION = PaginationResponse(page=1, size=PAGE_SIZE, total=5000)
+RESPONSE = create_response(PAGE, pagination=PAGINATION)
+DETAIL = {
+    "name": "Premium cotton shirt",
+    "rating": Decimal("4.35"),
+    "status": StockStatus.IN_STOCK,
+    "created_at": NOW,
+    "variants": variant_data(),
+}
+SHORT_VARIANT = ProductVariantShortOut.model_validate(variant_data(2)[1])
+VARIANTS = [
+    ProductVariant(regular_price=Decimal("1500.00"), discount_price=None),
+    ProductVariant(regular_price=Decimal("1500.00"), discount_price=Decimal("1290.00")),
+    ProductVariant(
+        regular_price=Decimal("1500.00"),
+        discount_price=Decimal("1290.00"),
+        discount_start_date=NOW - timedelta(days=1),
+        discount_end_date=NOW + timedelta(days=1),
+    ),
+    ProductVariant(
+        regular_price=Decimal("1500.00"),
+        discount_price=Decimal("1290.00"),
+        discount_end_date=NOW - timedelta(days=1),
+    ),
+]
+CATEGORY_IDS = [1, 2, 7]
+
+
+def get_prices() -> None:
+    for variant in VARIANTS:
+        variant.get_price(NOW)
+
+
+def pack_page(codec: str) -> bytes:
+    return pack_entry(CacheEntry(PAGE, 0.0, 0.0), CODECS[codec], COMPRESSION_NONE, 0)
+
+
+async def cache_roundtrip(cache: Cache, key: CacheKey) -> None:
+    await cache.set(key, DETAIL, ttl=60)
+    await cache.get(key)
+
+
+def benchmarks(redis: FakeAsyncRedis) -> list[Benchmark]:
+    rows = product_rows()
+    key = product_key("premium-cotton-shirt")
+    codecs = ("json", "msgpack")
+    return [
+        Benchmark("get_response", partial(get_response, rows)),
+        Benchmark(
+            "json_serializer", partial(json.dumps, DETAIL, default=json_serializer)
+        ),
+        Benchmark(
+            "create_response", partial(create_response, PAGE, pagination=PAGINATION)
+        ),
+        Benchmark("render_response", partial(render_response, RESPONSE)),
+        Benchmark("ProductVariant.get_price", get_prices),
+        Benchmark("discount_percentage", lambda: SHORT_VARIANT.discount_percentage),
+        Benchmark(
+            "get_category_and_descendants",
+            partial(get_category_and_descendants, None, CATEGORY_IDS),
+        ),
+        *(
+            Benchmark(f"pack_entry[{codec}]", partial(pack_page, codec))
+            for codec in codecs
+        ),
+        *(
+            Benchmark(f"unpack_entry[{codec}]", partial(unpack_entry, pack_page(codec)))
+            for codec in codecs
+        ),
+        *(
+            Benchmark(
+                f"cache_set_get[{codec}]",
+                partial(cache_roundtrip, Cache(redis, None, codec=CODECS[codec]), key),
+            )
+            for codec in codecs
+        ),
+    ]
+
+
+async def prepare_redis() -> FakeAsyncRedis:
+    """Fake Redis holding the category index, so no database is touched"""
+    redis = FakeAsyncRedis()
+    await redis.set(CATEGORY_INDEX_VERSION_KEY, 1)
+    await redis.set(category_index_key(1), json.dumps(category_rows()))
+    database.redis_pool = redis
+    return redis
+
+
+def timer(func: Callable[[], Any], runner: asyncio.Runner) -> Callable[[int], float]:
+    """A function calling `func` `number` times and returning the seconds taken"""
+    if inspect.iscoroutinefunction(func):
+
+        async def run_async(number: int) -> float:
+            start = time.perf_counter()
+            for _ in range(number):
+                await func()
+            return time.perf_counter() - start
+
+        return lambda number: runner.run(run_async(number))
+
+    def run(number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - start
+
+    return run
+
+
+def calibrate(run: Callable[[int], float], min_time: float) -> int:
+    """Smallest power of ten of calls that takes at least `min_time`"""
+    number = 1
+    while run(number) < min_time:
+        number *= 10
+    return number
+
+
+def measure_allocations(
+    func: Callable[[], Any], runner: asyncio.Runner
+) -> tuple[int, int]:
+    call = (lambda: runner.run(func())) if inspect.iscoroutinefunction(func) else func
+    call()  # warm caches and lazy imports first
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        blocks = len(tracemalloc.take_snapshot().traces)
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = len(tracemalloc.take_snapshot().traces) - blocks
+    finally:
+        tracemalloc.stop()
+    return peak - before, max(blocks, 0)
+
+
+def run_benchmark(
+    benchmark: Benchmark, runner: asyncio.Runner, rounds: int, min_time: float
+) -> Result:
+    run = timer(benchmark.func, runner)
+    number = calibrate(run, min_time)
+    gc.collect()
+    gc.disable()
+    try:
+        timings = [run(number) for _ in range(rounds)]
+    finally:
+        gc.enable()
+    fastest, slowest = min(timings), max(timings)
+    alloc_bytes, alloc_blocks = measure_allocations(benchmark.func, runner)
+    return Result(
+        benchmark.name,
+        number / statistics.median(timings),
+        (slowest - fastest) / fastest,
+        alloc_bytes,
+        alloc_blocks,
+    )
+
+
+def report(result: Result, baseline: dict | None = None) -> str:
+    line = (
+        f"{result.name:<32} {result.ops:>14,.0f} ops/s  +/-{result.spread:6.1%}  "
+        f"{result.alloc_bytes:>9,} B  {result.alloc_blocks:>5} blocks"
+    )
+    if baseline:
+        line += f"  ({result.ops / baseline['ops'] - 1:+.1%} vs baseline)"
+    return line
+
+
+def regressions(
+    results: list[Result], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    failed = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.ops < base["ops"] * (1 - tolerance):
+            failed.append(
+                f"{result.name}: {result.ops:,.0f} ops/s, was {base['ops']:,.0f}"
+            )
+        if result.alloc_bytes > base["alloc_bytes"] * (1 + tolerance):
+            failed.append(
+                f"{result.name}: {result.alloc_bytes:,} B per call, "
+                f"was {base['alloc_bytes']:,}"
+            )
+    return failed
+
+
+def main(args: argparse.Namespace) -> int:
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = []
+    with asyncio.Runner() as runner:
+        redis = runner.run(prepare_redis())
+        for benchmark in benchmarks(redis):
+            if args.names and benchmark.name not in args.names:
+                continue
+            result = run_benchmark(benchmark, runner, args.rounds, args.min_time)
+            print(report(result, baseline.get(result.name)))
+            results.append(result)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {result.name: result._asdict() for result in results}, f, indent=2
+            )
+        print(f"saved to {args.save}")
+
+    failed = regressions(results, baseline, args.tolerance)
+    for line in failed:
+        print(f"regression: {line}")
+    return int(bool(failed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all by default")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    sys.exit(main(parser.parse_args()))
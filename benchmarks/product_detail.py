@@ -0,0 +1,84 @@
+"""
+Time the product page loader against the database configured in .env and
+check how many SQL statements a cache miss costs:
+
+    python -m benchmarks.product_detail [--runs 50] [--max-statements 1] [slug ...]
+
+Without slugs it samples published products. Exits non-zero when a miss
+runs more statements than allowed.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import event, select
+
+from src.cache.tags import collect_tags
+from src.database import AsyncSessionLocal, async_engine
+from src.product import services
+from src.product.enums import ProductStatus
+from src.product.models import Product
+
+from .search import percentile
+
+statements = 0
+
+
+def count_statement(*_args: object) -> None:
+    global statements
+    statements += 1
+
+
+async def sample_slugs(count: int) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        return list(
+            await db.scalars(
+                select(Product.slug)
+                .filter(Product.is_active, Product.status == ProductStatus.PUBLISHED)
+                .order_by(Product.total_sold.desc())
+                .limit(count)
+            )
+        )
+
+
+async def time_detail(slug: str, runs: int) -> tuple[list[float], int]:
+    """Latencies of `runs` misses, and the statements the last one ran"""
+    global statements
+    samples = []
+    for _ in range(runs):
+        async with AsyncSessionLocal() as db:
+            await db.connection()  # keep connection setup out of the count
+            statements = 0
+            start = time.perf_counter()
+            with collect_tags():
+                await services.get_product_by_slug(db, slug)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples, statements
+
+
+async def main(slugs: list[str], runs: int, max_statements: int) -> int:
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    slugs = slugs or await sample_slugs(5)
+    failed = False
+    for slug in slugs:
+        samples, count = await time_detail(slug, runs)
+        print(
+            f"{slug:<40} statements {count}  mean {statistics.mean(samples):8.2f}  "
+            f"p50 {percentile(samples, 50):8.2f}  p95 {percentile(samples, 95):8.2f} ms"
+        )
+        failed |= count > max_statements
+    if failed:
+        print(f"a miss ran more than {max_statements} statement(s)")
+    return int(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("slugs", nargs="*")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--max-statements", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.slugs, args.runs, args.max_statements)))
@@ -0,0 +1,79 @@
+"""
+Compare /product/search with and without the Redis trigram index, against
+the database and Redis configured in .env:
+
+    python -m benchmarks.search [--runs 50] [term ...]
+
+Builds the index first if it is missing. Each term runs the search service
+(count and first page) on both paths and reports latency percentiles.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from src import database
+from src.common.filters import PaginationParams
+from src.config import settings
+from src.database import AsyncSessionLocal, close_redis_pool, init_redis_pool
+from src.product import services
+from src.product.search_index import (
+    SEARCH_READY_KEY,
+    rebuild_search_index,
+    search_candidates,
+)
+
+DEFAULT_TERMS = ["shirt", "cotton", "blue", "xl", "premium slim fit"]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+async def time_search(term: str, runs: int, use_index: bool) -> list[float]:
+    settings.SEARCH_INDEX_ENABLED = use_index
+    pagination = PaginationParams()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await services.get_products_by_search_with_filter(db, term, pagination)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> str:
+    return (
+        f"{label:>6}  mean {statistics.mean(samples):8.2f}  "
+        f"p50 {percentile(samples, 50):8.2f}  p95 {percentile(samples, 95):8.2f}  "
+        f"p99 {percentile(samples, 99):8.2f} ms"
+    )
+
+
+async def main(terms: list[str], runs: int) -> None:
+    await init_redis_pool()
+    try:
+        if not await database.redis_pool.exists(SEARCH_READY_KEY):
+            start = time.perf_counter()
+            await rebuild_search_index(database.redis_pool)
+            print(f"index built in {time.perf_counter() - start:.1f}s")
+
+        for term in terms:
+            settings.SEARCH_INDEX_ENABLED = True
+            candidates = await search_candidates(term)
+            narrowed = "ILIKE fallback" if candidates is None else len(candidates)
+            print(f"\n{term!r} (candidates: {narrowed})")
+            print(report("ilike", await time_search(term, runs, use_index=False)))
+            print(report("index", await time_search(term, runs, use_index=True)))
+    finally:
+        await close_redis_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("terms", nargs="*", default=DEFAULT_TERMS)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.terms, args.runs))
@@ -0,0 +1,456 @@
+import asyncio
+import inspect
+import json
+import math
+import random
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Annotated, Any
+
+from fastapi import Depends, Response
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import database
+from src.common.metrics import SIZE_BUCKETS, Counter, Histogram
+from src.common.response import StandardResponse, render_response
+from src.config import settings
+from src.database import AsyncSessionLocal, get_async_db, get_redis
+
+from .codecs import (
+    RAW_CODEC,
+    CacheEntry,
+    Codec,
+    compression_method,
+    get_codec,
+    pack_entry,
+    unpack_entry,
+)
+from .keys import CacheKey, KeyFamily
+from .local import (
+    INVALIDATION_CHANNEL,
+    WORKER_ID,
+    invalidation_message,
+    local_cache,
+    uses_local_cache,
+)
+from .singleflight import RedisLock, SingleFlight, fill_channel, wait_for_fill
+from .tags import collect_tags, tag_key
+
+Loader = Callable[[AsyncSession], Any | Awaitable[Any]]
+ResponseLoader = Callable[[AsyncSession], Awaitable[StandardResponse]]
+# Loads the missing keys at once: each key found maps to its value and tags
+BatchLoader = Callable[
+    [AsyncSession, list[CacheKey]], Awaitable[dict[CacheKey, tuple[Any, set[str]]]]
+]
+
+# Keys with a background refresh in flight in this worker, and the tasks
+# themselves so they are not garbage collected before finishing.
+_refreshing: set[str] = set()
+_background_tasks: set[asyncio.Task] = set()
+# Concurrent misses on the same key in this worker share one fill
+_flights = SingleFlight()
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache reads by key family and outcome: hit, stale (served while it "
+    "refreshes) or miss",
+    ["family", "result"],
+)
+CACHE_LOCAL_HITS = Counter(
+    "cache_local_hits_total", "Reads answered by the in-process cache", ["family"]
+)
+CACHE_FILL_SECONDS = Histogram(
+    "cache_fill_duration_seconds", "Time spent loading a value to cache", ["family"]
+)
+CACHE_PAYLOAD_BYTES = Histogram(
+    "cache_payload_bytes",
+    "Encoded size of stored entries",
+    ["family"],
+    buckets=SIZE_BUCKETS,
+)
+
+
+class Cache:
+    """
+    Cache-aside helper on top of the shared Redis pool.
+
+    Entries carry a soft expiry next to the hard Redis TTL. Past the soft
+    expiry (or earlier, following XFetch probabilistic early expiration)
+    readers still get the cached value while a single background task
+    reloads it. Misses are coalesced: one fill per key in the worker, and a
+    short Redis lock so only one worker across the deployment hits the
+    database while the others wait for its fill notification.
+
+    Every fill is filed under the dependency tags its loader reported through
+    `add_tags`, so model changes can drop exactly the affected keys.
+
+    Families listed in CACHE_LOCAL_FAMILIES are also kept decoded in the
+    worker's local LRU; writes announce the key on the invalidation channel
+    so the other workers drop their copy.
+
+    Families listed in CACHE_RAW_RESPONSE_FAMILIES cache the rendered JSON
+    body of the whole response instead of its data, see `get_or_set_response`.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        db: AsyncSession,
+        codec: Codec | None = None,
+        jitter: float = settings.CACHE_TTL_JITTER,
+        stale_ratio: float = settings.CACHE_STALE_TTL_RATIO,
+        beta: float = settings.CACHE_XFETCH_BETA,
+        lock_ttl_ms: int = settings.CACHE_LOCK_TTL_MS,
+        lock_wait: float = settings.CACHE_LOCK_WAIT_TIMEOUT,
+        compression: str = settings.CACHE_COMPRESSION,
+        compress_min_bytes: int = settings.CACHE_COMPRESS_MIN_BYTES,
+        reader: Redis | None = None,
+    ) -> None:
+        self.redis = redis
+        # Entries are read from here: a replica, or the primary itself
+        self.reader = reader or redis
+        self.db = db
+        self.codec = codec or get_codec(settings.CACHE_CODEC)
+        self.jitter = jitter
+        self.stale_ratio = stale_ratio
+        self.beta = beta
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait = lock_wait
+        self.compression = compression_method(compression)
+        self.compress_min_bytes = compress_min_bytes
+
+    def ttl_for(self, family: KeyFamily) -> int:
+        """Family TTL spread by +/- jitter so keys filled together expire apart"""
+        ttl = family.ttl
+        if self.jitter:
+            ttl = round(ttl * (1 + random.uniform(-self.jitter, self.jitter)))
+        return max(ttl, 1)
+
+    def should_refresh(self, entry: CacheEntry, now: float) -> bool:
+        """
+        XFetch: recompute early with a probability that grows as the soft
+        expiry approaches and with how long the value took to compute.
+        """
+        if now >= entry.soft_expiry:
+            return True
+        if not self.beta or not entry.delta:
+            return False
+        early = entry.delta * self.beta * math.log(1 - random.random())
+        return now - early >= entry.soft_expiry
+
+    async def get_entry(
+        self, key: CacheKey, primary: bool = False
+    ) -> CacheEntry | None:
+        """
+        The entry of `key`, from the local cache or the reader. `primary`
+        skips the reader when a replica may not have a fresh write yet.
+        """
+        local = uses_local_cache(key.family)
+        if local and (entry := local_cache.get(key.key)) is not None:
+            CACHE_LOCAL_HITS.inc(family=key.family)
+            return entry
+
+        data = await (self.redis if primary else self.reader).get(key.key)
+        if data is None:
+            return None
+        return self.decode_entry(key, data)
+
+    async def get_entries(self, keys: list[CacheKey]) -> list[CacheEntry | None]:
+        """Entries of `keys`, in order: the local ones, the rest in one MGET"""
+        entries: dict[str, CacheEntry | None] = {}
+        remote = []
+        for key in keys:
+            if (
+                uses_local_cache(key.family)
+                and (entry := local_cache.get(key.key)) is not None
+            ):
+                CACHE_LOCAL_HITS.inc(family=key.family)
+                entries[key.key] = entry
+            elif key.key not in entries:
+                entries[key.key] = None
+                remote.append(key)
+        if remote:
+            values = await self.reader.mget([key.key for key in remote])
+            for key, data in zip(remote, values):
+                if data is not None:
+                    entries[key.key] = self.decode_entry(key, data)
+        return [entries[key.key] for key in keys]
+
+    def decode_entry(self, key: CacheKey, data: bytes) -> CacheEntry | None:
+        entry = unpack_entry(data)
+        if entry is not None and uses_local_cache(key.family):
+            local_cache.set(
+                key.key, entry, len(data), ttl=entry.soft_expiry - time.time()
+            )
+        return entry
+
+    async def get(self, key: CacheKey, primary: bool = False) -> Any | None:
+        entry = await self.get_entry(key, primary)
+        return entry.value if entry else None
+
+    async def set(
+        self,
+        key: CacheKey,
+        value: Any,
+        ttl: int | None = None,
+        delta: float = 0,
+        tags: Iterable[str] = (),
+        pipe: Pipeline | None = None,
+    ) -> None:
+        """
+        Store `value`; `ttl` is the soft TTL, the hard TTL adds the stale window.
+        Given a pipeline, the writes are queued on it for the caller to execute.
+        """
+        ttl = ttl or self.ttl_for(key.family)
+        hard_ttl = ttl + math.ceil(ttl * self.stale_ratio)
+        entry = CacheEntry(value, time.time() + ttl, delta)
+        codec = RAW_CODEC if isinstance(value, bytes) else self.codec
+        data = pack_entry(entry, codec, self.compression, self.compress_min_bytes)
+        CACHE_PAYLOAD_BYTES.observe(len(data), family=key.family)
+
+        queued = pipe is not None
+        if pipe is None:
+            pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key.key, data, ex=hard_ttl)
+        for name in tags:
+            # Tag sets live as long as their longest-lived member
+            pipe.sadd(tag_key(name), key.key)
+            pipe.expire(tag_key(name), hard_ttl, nx=True)
+            pipe.expire(tag_key(name), hard_ttl, gt=True)
+        if uses_local_cache(key.family):
+            pipe.publish(
+                INVALIDATION_CHANNEL, invalidation_message([key.key], WORKER_ID)
+            )
+        if not queued:
+            await pipe.execute()
+
+        if uses_local_cache(key.family):
+            local_cache.set(key.key, entry, len(data), ttl=ttl)
+
+    async def delete(self, *keys: CacheKey) -> None:
+        if not keys:
+            return
+        names = [key.key for key in keys]
+        local_cache.delete(*names)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(*names)
+        if settings.CACHE_LOCAL_ENABLED:
+            pipe.publish(INVALIDATION_CHANNEL, invalidation_message(names, WORKER_ID))
+        await pipe.execute()
+
+    def lock(self, key: CacheKey) -> RedisLock:
+        return RedisLock(self.redis, f"{key.key}:lock", self.lock_ttl_ms)
+
+    async def load(
+        self, key: CacheKey, loader: Loader, db: AsyncSession
+    ) -> tuple[Any, float, set]:
+        """Run the loader; returns its value, how long it took and its tags"""
+        start = time.perf_counter()
+        with collect_tags() as tags:
+            value = loader(db)
+            if inspect.isawaitable(value):
+                value = await value
+        delta = time.perf_counter() - start
+        CACHE_FILL_SECONDS.observe(delta, family=key.family)
+        return value, delta, tags
+
+    async def fill(self, key: CacheKey, loader: Loader, db: AsyncSession) -> Any:
+        """
+        Run the loader, timing it for XFetch, store the result and announce
+        it. A failure is announced too, so that waiters stop waiting, find
+        nothing and run the loader themselves.
+        """
+        try:
+            value, delta, tags = await self.load(key, loader, db)
+            await self.set(key, value, delta=delta, tags=tags)
+            return value
+        finally:
+            await self.redis.publish(fill_channel(key.key), 1)
+
+    async def fill_coalesced(self, key: CacheKey, loader: Loader) -> Any:
+        """Fill a missing key, or wait for the worker that holds its lock"""
+        lock = self.lock(key)
+        if not await lock.acquire():
+            value = await wait_for_fill(
+                self.redis, key.key, lambda: self.get(key, primary=True), self.lock_wait
+            )
+            if value is not None:
+                return value
+            # The holder died or is too slow: load it ourselves, uncoordinated
+            return await self.fill(key, loader, self.db)
+
+        try:
+            return await self.fill(key, loader, self.db)
+        finally:
+            await lock.release()
+
+    async def refresh(self, key: CacheKey, loader: Loader) -> None:
+        """Reload `key` outside the request, on a session of its own"""
+        lock = self.lock(key)
+        try:
+            # Only one worker across the deployment refreshes a given key
+            if not await lock.acquire():
+                return
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.fill(key, loader, db)
+            finally:
+                await lock.release()
+        finally:
+            _refreshing.discard(key.key)
+
+    def schedule_refresh(self, key: CacheKey, loader: Loader) -> None:
+        if key.key in _refreshing:
+            return
+        _refreshing.add(key.key)
+        self.run_in_background(self.refresh(key, loader))
+
+    def run_in_background(self, coroutine: Awaitable) -> None:
+        task = asyncio.create_task(coroutine)
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    async def fill_many(
+        self, keys: list[CacheKey], loader: BatchLoader, db: AsyncSession
+    ) -> dict[str, Any]:
+        """
+        Load `keys` with one loader call and store what it found in one
+        pipeline; returns the values by key name.
+        """
+        start = time.perf_counter()
+        loaded = await loader(db, keys)
+        delta = time.perf_counter() - start
+        pipe = self.redis.pipeline(transaction=False)
+        for key, (value, tags) in loaded.items():
+            CACHE_FILL_SECONDS.observe(delta, family=key.family)
+            await self.set(key, value, delta=delta, tags=tags, pipe=pipe)
+        if loaded:
+            await pipe.execute()
+        return {key.key: value for key, (value, _) in loaded.items()}
+
+    async def refresh_many(self, keys: list[CacheKey], loader: BatchLoader) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.fill_many(keys, loader, db)
+        finally:
+            _refreshing.difference_update(key.key for key in keys)
+
+    async def get_many_or_set(
+        self, keys: list[CacheKey], loader: BatchLoader
+    ) -> tuple[list[Any | None], bool]:
+        """
+        Values of `keys` in order, None where the loader found nothing. One
+        MGET reads them all and one loader call fills every miss, so a
+        batch costs a couple of round trips instead of one per key. Stale
+        entries are served and reloaded together in the background. Misses
+        are not coalesced across requests as single keys are. The second
+        element tells whether every value came from the cache.
+        """
+        values: dict[str, Any] = {}
+        missing, stale = [], []
+        now = time.time()
+        for key, entry in zip(keys, await self.get_entries(keys)):
+            if key.key in values or key in missing:
+                continue
+            if entry is None:
+                CACHE_LOOKUPS.inc(family=key.family, result="miss")
+                missing.append(key)
+                continue
+            if self.should_refresh(entry, now) and key.key not in _refreshing:
+                CACHE_LOOKUPS.inc(family=key.family, result="stale")
+                stale.append(key)
+            else:
+                CACHE_LOOKUPS.inc(family=key.family, result="hit")
+            values[key.key] = entry.value
+
+        if stale:
+            _refreshing.update(key.key for key in stale)
+            self.run_in_background(self.refresh_many(stale, loader))
+        if missing:
+            values.update(await self.fill_many(missing, loader, self.db))
+        return [values.get(key.key) for key in keys], not missing
+
+    async def get_or_set(self, key: CacheKey, loader: Loader) -> tuple[Any, bool]:
+        """
+        Return the cached value for `key`, filling it from `loader` on a miss.
+
+        The loader receives a database session and may be a plain or an async
+        callable. The second element of the result tells whether the value
+        came from the cache, fresh or stale.
+        """
+        entry = await self.get_entry(key)
+        if entry is None:
+            CACHE_LOOKUPS.inc(family=key.family, result="miss")
+            value = await _flights.do(key.key, lambda: self.fill_coalesced(key, loader))
+            return value, False
+
+        if self.should_refresh(entry, time.time()):
+            CACHE_LOOKUPS.inc(family=key.family, result="stale")
+            self.schedule_refresh(key, loader)
+        else:
+            CACHE_LOOKUPS.inc(family=key.family, result="hit")
+        return entry.value, True
+
+    async def get_or_set_response(
+        self, key: CacheKey, loader: ResponseLoader, response: Response
+    ) -> StandardResponse | dict | Response:
+        """
+        Cache a whole route response, reporting HIT or MISS in X-Cache.
+
+        By default the response model is cached and FastAPI validates and
+        serializes it on every request. In raw mode the rendered body is
+        cached instead and a hit is returned as is: one Redis GET, no
+        decode, validation or encoding.
+        """
+        if key.family not in settings.CACHE_RAW_RESPONSE_FAMILIES:
+            value, hit = await self.get_or_set(key, loader)
+            response.headers["X-Cache"] = "HIT" if hit else "MISS"
+            return value
+
+        body, hit = await self.get_or_set(key, response_value_loader(key, loader))
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"X-Cache": "HIT" if hit else "MISS"},
+        )
+
+
+def response_value_loader(key: CacheKey, loader: ResponseLoader) -> Loader:
+    """
+    What `get_or_set_response` stores for a route loader: the rendered body
+    in raw mode, the response model otherwise
+    """
+    if key.family not in settings.CACHE_RAW_RESPONSE_FAMILIES:
+        return loader
+
+    async def render(db: AsyncSession) -> bytes:
+        return render_response(await loader(db))
+
+    return render
+
+
+def response_value(
+    key: CacheKey, response: StandardResponse
+) -> StandardResponse | bytes:
+    """The value `get_or_set_response` would store for `response` under `key`"""
+    if key.family in settings.CACHE_RAW_RESPONSE_FAMILIES:
+        return render_response(response)
+    return response
+
+
+def response_data(value: StandardResponse | dict | bytes) -> Any:
+    """The data of a cached route response, whichever form it was read back in"""
+    if isinstance(value, bytes):
+        return json.loads(value)["data"]
+    if isinstance(value, StandardResponse):
+        return value.data
+    return value["data"]
+
+
+async def get_cache(
+    redis: Annotated[Redis, Depends(get_redis)],
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+) -> Cache:
+    return Cache(redis, db, reader=database.redis_replica)
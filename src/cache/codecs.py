@@ -0,0 +1,201 @@
+import importlib
+import json
+import struct
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, NamedTuple, Protocol
+
+import msgpack
+from pydantic import BaseModel
+
+from src.common.utils import json_serializer
+
+try:
+    import lz4.frame as lz4
+except ImportError:  # optional, zlib is always available
+    lz4 = None
+
+
+class Codec(Protocol):
+    id: int
+
+    def encode(self, value: Any) -> bytes: ...
+
+    def decode(self, data: bytes) -> Any: ...
+
+
+class JSONCodec:
+    """Plain JSON text, the format the routes always cached"""
+
+    id = 0
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=json_serializer).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+# msgpack extension type codes
+EXT_DECIMAL = 1
+EXT_DATETIME = 2
+EXT_DATE = 3
+EXT_ENUM = 4
+
+
+def enum_class(path: str) -> type[Enum]:
+    """Resolve "module:QualName"; only the app's own enums are accepted"""
+    module, name = path.split(":", 1)
+    if module != "src" and not module.startswith("src."):
+        raise TypeError(f"Refusing to load enum from {module}")
+    cls = importlib.import_module(module)
+    for part in name.split("."):
+        cls = getattr(cls, part)
+    return cls
+
+
+class MsgpackCodec:
+    """
+    Binary msgpack. Unlike JSON it round-trips Decimal, datetime, date and
+    the app's enums exactly, through extension types.
+    """
+
+    id = 1
+
+    def default(self, obj: Any) -> Any:
+        if isinstance(obj, Decimal):
+            return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+        if isinstance(obj, datetime):
+            return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+        if isinstance(obj, date):
+            return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+        if isinstance(obj, Enum):
+            cls = type(obj)
+            path = f"{cls.__module__}:{cls.__qualname__}"
+            return msgpack.ExtType(EXT_ENUM, self.encode([path, obj.value]))
+        if isinstance(obj, BaseModel):
+            return obj.model_dump()
+        if isinstance(obj, tuple):
+            return list(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+    def ext_hook(self, code: int, data: bytes) -> Any:
+        if code == EXT_DECIMAL:
+            return Decimal(data.decode())
+        if code == EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == EXT_ENUM:
+            path, value = self.decode(data)
+            return enum_class(path)(value)
+        return msgpack.ExtType(code, data)
+
+    def encode(self, value: Any) -> bytes:
+        # strict_types sends str/int subclasses (our StrEnums) through default
+        return msgpack.packb(value, default=self.default, strict_types=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self.ext_hook, strict_map_key=False)
+
+
+class RawCodec:
+    """Bytes stored as they are, such as fully rendered response bodies"""
+
+    id = 2
+
+    def encode(self, value: bytes) -> bytes:
+        return value
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+RAW_CODEC = RawCodec()
+CODECS: dict[str, Codec] = {
+    "json": JSONCodec(),
+    "msgpack": MsgpackCodec(),
+    "raw": RAW_CODEC,
+}
+CODECS_BY_ID: dict[int, Codec] = {codec.id: codec for codec in CODECS.values()}
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown cache codec: {name}") from None
+
+
+# Compression ids, stored in the header next to the codec id
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZ4 = 2
+COMPRESSIONS = {
+    "none": COMPRESSION_NONE,
+    "zlib": COMPRESSION_ZLIB,
+    "lz4": COMPRESSION_LZ4,
+}
+
+
+def compress(data: bytes, method: int) -> bytes:
+    if method == COMPRESSION_ZLIB:
+        return zlib.compress(data)
+    if method == COMPRESSION_LZ4:
+        return lz4.compress(data)
+    return data
+
+
+def decompress(data: bytes, method: int) -> bytes:
+    if method == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if method == COMPRESSION_LZ4:
+        return lz4.decompress(data)
+    return data
+
+
+def compression_method(name: str) -> int:
+    method = COMPRESSIONS.get(name)
+    if method is None:
+        raise ValueError(f"Unknown cache compression: {name}")
+    if method == COMPRESSION_LZ4 and lz4 is None:
+        raise ValueError("lz4 compression requested but the lz4 package is missing")
+    return method
+
+
+# Stored entry layout: format version, flags (codec id in the low nibble,
+# compression id in the high one), soft expiry and fill time, then payload.
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">BBdd")
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    soft_expiry: float  # unix time after which the value is served stale
+    delta: float  # seconds it took to compute, for XFetch
+
+
+def pack_entry(
+    entry: CacheEntry, codec: Codec, compression: int, min_compress_size: int
+) -> bytes:
+    payload = codec.encode(entry.value)
+    if compression != COMPRESSION_NONE and len(payload) >= min_compress_size:
+        payload = compress(payload, compression)
+    else:
+        compression = COMPRESSION_NONE
+    flags = codec.id | compression << 4
+    return HEADER.pack(FORMAT_VERSION, flags, entry.soft_expiry, entry.delta) + payload
+
+
+def unpack_entry(data: bytes) -> CacheEntry | None:
+    """Decode a stored entry; entries from another format version read as misses"""
+    if len(data) < HEADER.size or data[0] != FORMAT_VERSION:
+        return None
+    _, flags, soft_expiry, delta = HEADER.unpack_from(data)
+    codec = CODECS_BY_ID.get(flags & 0x0F)
+    if codec is None:
+        return None
+    payload = decompress(data[HEADER.size :], flags >> 4)
+    return CacheEntry(codec.decode(payload), soft_expiry, delta)
@@ -0,0 +1,87 @@
+import hashlib
+from enum import StrEnum
+from typing import NamedTuple
+
+from src.common.filters import PaginationParams
+from src.config import settings
+from src.constants import RedisMode
+
+
+class KeyFamily(StrEnum):
+    PRODUCT = "product"
+    PRODUCT_LIST = "products:page"
+    PRODUCT_SEARCH = "products:search"
+    CATEGORY_TOP_PRODUCTS = "category:top_products"
+
+    @property
+    def ttl(self) -> int:
+        """Base TTL (seconds) for the family, read from settings"""
+        ttls = {
+            KeyFamily.PRODUCT: settings.PRODUCT_CACHE_TTL,
+            KeyFamily.PRODUCT_LIST: settings.PRODUCT_LIST_CACHE_TTL,
+            KeyFamily.PRODUCT_SEARCH: settings.PRODUCT_SEARCH_CACHE_TTL,
+            KeyFamily.CATEGORY_TOP_PRODUCTS: settings.CATEGORY_TOP_PRODUCTS_CACHE_TTL,
+        }
+        return ttls.get(self, settings.CACHE_TTL)
+
+
+class CacheKey(NamedTuple):
+    family: KeyFamily
+    key: str
+
+    def __str__(self) -> str:
+        return self.key
+
+
+def hash_tag(name: str) -> str:
+    """
+    Key prefix pinning a family of keys to one cluster slot, for the
+    structures read with multi-key commands (SINTER, RENAME, scripts).
+    Outside a cluster it is the plain name, so keys keep their names.
+    Cache families are not tagged: they would all land on one node.
+    """
+    if settings.REDIS_MODE == RedisMode.CLUSTER:
+        return f"{{{name}}}"
+    return name
+
+
+def build_key(family: KeyFamily, *parts: str | int) -> CacheKey:
+    return CacheKey(family, ":".join([family.value, *(str(part) for part in parts)]))
+
+
+def hash_term(term: str) -> str:
+    """
+    Stable digest for free-text key parts. Full length: two terms sharing a
+    key would serve one's cached page for the other
+    """
+    return hashlib.sha256(term.encode()).hexdigest()
+
+
+def product_key(slug: str) -> CacheKey:
+    return build_key(KeyFamily.PRODUCT, slug)
+
+
+def page_parts(pagination: PaginationParams) -> tuple[str | int, ...]:
+    """Key parts for a page: its number, or its cursor, already URL-safe"""
+    if pagination.cursor:
+        return "cursor", pagination.cursor, "size", pagination.size
+    return "page", pagination.page, "size", pagination.size
+
+
+def product_list_key(pagination: PaginationParams) -> CacheKey:
+    parts = page_parts(pagination)
+    # The family name already ends in "page": products:page:1:size:10, but
+    # cursor pages keep their marker so a cursor never reads as a number
+    if not pagination.cursor:
+        parts = parts[1:]
+    return build_key(KeyFamily.PRODUCT_LIST, *parts)
+
+
+def product_search_key(search: str, pagination: PaginationParams) -> CacheKey:
+    return build_key(
+        KeyFamily.PRODUCT_SEARCH, hash_term(search), *page_parts(pagination)
+    )
+
+
+def category_top_products_key(slug: str, limit: int) -> CacheKey:
+    return build_key(KeyFamily.CATEGORY_TOP_PRODUCTS, slug, "limit", limit)
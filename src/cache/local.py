@@ -0,0 +1,104 @@
+import asyncio
+import json
+import secrets
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.config import settings
+
+# Every worker listens here and drops the keys it is told about. Messages are
+# JSON: {"origin": <worker id or null>, "keys": [...]}.
+INVALIDATION_CHANNEL = "cache:invalidate"
+WORKER_ID = secrets.token_hex(8)
+
+
+class LocalCache:
+    """
+    Per-worker LRU cache of decoded entries, bounded by entry count and by
+    the encoded size of what it holds. Entries also expire after a short TTL
+    as a safety net for invalidation messages lost while disconnected.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Any | None:
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        value, _, expires_at = item
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: float | None = None) -> None:
+        if size > self.max_bytes or (ttl is not None and ttl <= 0):
+            return
+        self.delete(key)
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self.entries[key] = (value, size, time.monotonic() + ttl)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            item = self.entries.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+
+local_cache = LocalCache(
+    max_entries=settings.CACHE_LOCAL_MAX_ENTRIES,
+    max_bytes=settings.CACHE_LOCAL_MAX_BYTES,
+    ttl=settings.CACHE_LOCAL_TTL,
+)
+
+
+def uses_local_cache(family: str) -> bool:
+    return settings.CACHE_LOCAL_ENABLED and family in settings.CACHE_LOCAL_FAMILIES
+
+
+def invalidation_message(keys: Iterable[str], origin: str | None = None) -> str:
+    return json.dumps({"origin": origin, "keys": list(keys)})
+
+
+async def listen_for_invalidations(redis: Redis) -> None:
+    """
+    Drop local entries other workers (or model hooks) changed. Runs for the
+    life of the app; whenever the subscription is (re)established the local
+    cache is cleared, since messages sent while away are lost.
+    """
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload["origin"] != WORKER_ID:
+                        local_cache.delete(*payload["keys"])
+        except (RedisConnectionError, OSError):
+            local_cache.clear()
+            await asyncio.sleep(1)
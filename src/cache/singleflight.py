@@ -0,0 +1,100 @@
+import asyncio
+import secrets
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from redis.asyncio import Redis
+
+# Deletes the lock only if it still holds our token, so a filler that
+# outlived its lock never releases somebody else's.
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+# What waiters get when the caller running the flight is cancelled (its
+# client went away): not their failure, so one of them runs it instead.
+LEADER_CANCELLED = object()
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key in this worker into one"""
+
+    def __init__(self) -> None:
+        self.flights: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while (flight := self.flights.get(key)) is not None:
+            result = await asyncio.shield(flight)
+            if result is not LEADER_CANCELLED:
+                return result
+
+        future = asyncio.get_running_loop().create_future()
+        self.flights[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_result(LEADER_CANCELLED)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.flights[key]
+
+
+class RedisLock:
+    """Short-lived lock shared by every worker: SET NX PX plus a token"""
+
+    def __init__(self, redis: Redis, key: str, ttl_ms: int) -> None:
+        self.redis = redis
+        self.key = key
+        self.ttl_ms = ttl_ms
+        self.token = secrets.token_hex(8)
+
+    async def acquire(self) -> bool:
+        return bool(await self.redis.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    async def release(self) -> None:
+        await self.redis.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+
+
+def fill_channel(key: str) -> str:
+    return f"cache:filled:{key}"
+
+
+async def wait_for_fill(
+    redis: Redis,
+    key: str,
+    check: Callable[[], Awaitable[Any]],
+    timeout: float,
+) -> Any | None:
+    """
+    Wait until another worker announces it filled `key`, then return `check()`.
+
+    The check also runs right after subscribing, since the fill may have
+    landed between losing the lock and listening. Returns None on timeout.
+    """
+    async with redis.pubsub() as pubsub:
+        await pubsub.subscribe(fill_channel(key))
+        value = await check()
+        if value is not None:
+            return value
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (remaining := deadline - loop.time()) > 0:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                break
+        return await check()
@@ -0,0 +1,67 @@
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from redis import Redis as SyncRedis
+
+from src.config import settings
+
+from .local import INVALIDATION_CHANNEL, invalidation_message
+
+# Tags raised while a cache fill is running. Loaders (and anything they call)
+# report what the value depends on through `add_tags`; the cache then files
+# the key under each tag so a change to any of them drops the key.
+_collected: ContextVar[set[str] | None] = ContextVar("cache_tags", default=None)
+
+# Membership tags: entries that depend on which products exist at all,
+# not just on the products they happen to contain.
+PRODUCT_LIST_TAG = "products:list"
+PRODUCT_SEARCH_TAG = "products:search"
+
+
+def tag(kind: str, id: int | str | None) -> str:
+    return f"{kind}:{id}"
+
+
+def tag_key(name: str) -> str:
+    return f"cache:tag:{name}"
+
+
+def add_tags(*tags: str) -> None:
+    """Record dependency tags for the cache fill in progress, if any"""
+    collected = _collected.get()
+    if collected is not None:
+        collected.update(tags)
+
+
+@contextmanager
+def collect_tags() -> Iterator[set[str]]:
+    collected: set[str] = set()
+    token = _collected.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected.reset(token)
+
+
+def invalidate_tags(redis: SyncRedis, tags: Iterable[str]) -> list[str]:
+    """Delete every key filed under `tags`, and the tag sets, in two round trips"""
+    tag_keys = [tag_key(name) for name in set(tags)]
+    if not tag_keys:
+        return []
+
+    pipe = redis.pipeline(transaction=False)
+    for key in tag_keys:
+        pipe.smembers(key)
+    keys = set().union(*pipe.execute())
+
+    # One DEL per key, and PUBLISH on its own: cluster pipelines refuse
+    # multi-key DELs across slots and PUBLISH
+    pipe = redis.pipeline(transaction=False)
+    for key in (*keys, *tag_keys):
+        pipe.delete(key)
+    pipe.execute()
+    if keys and settings.CACHE_LOCAL_ENABLED:
+        # No origin: the committing worker must drop its own copies too
+        redis.publish(INVALIDATION_CHANNEL, invalidation_message(keys))
+    return list(keys)
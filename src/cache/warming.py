@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable
+
+from redis.asyncio import Redis
+
+from src.config import settings
+from src.database import AsyncSessionLocal
+
+from .cache import Cache, ResponseLoader, response_value_loader
+from .keys import CacheKey, KeyFamily
+from .local import WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+# Popularity of cached routes, per key family: cache:popularity:<family>
+# scores the members (a slug, a page, ...) that routes report through
+# `record_access`. Hits are counted in the worker and flushed in one
+# pipeline every few seconds; every warm cycle scales the scores by
+# CACHE_POPULARITY_DECAY, so yesterday's bestseller fades out.
+POPULARITY_PREFIX = "cache:popularity"
+WARM_LOCK_KEY = "cache:warm:lock"
+
+# family -> member -> the key and route loader that cache it
+Warmer = Callable[[str], tuple[CacheKey, ResponseLoader]]
+_warmers: dict[KeyFamily, Warmer] = {}
+_hits: Counter[tuple[KeyFamily, str]] = Counter()
+
+
+def popularity_key(family: KeyFamily) -> str:
+    return f"{POPULARITY_PREFIX}:{family}"
+
+
+def register_warmer(family: KeyFamily, warmer: Warmer) -> None:
+    """Let the warmer rebuild keys of `family` from their recorded members"""
+    _warmers[family] = warmer
+
+
+def record_access(family: KeyFamily, member: str) -> None:
+    """Count a request for `member`; free, nothing leaves the worker here"""
+    if settings.CACHE_WARM_INTERVAL and family in _warmers:
+        _hits[family, member] += 1
+
+
+async def flush_access_counts(redis: Redis) -> None:
+    if not _hits:
+        return
+    hits = dict(_hits)
+    _hits.clear()
+    pipe = redis.pipeline(transaction=False)
+    for (family, member), count in hits.items():
+        pipe.zincrby(popularity_key(family), count, member)
+    await pipe.execute()
+
+
+async def decay_popularity(redis: Redis) -> None:
+    """Scale every score down and forget all but the most popular members"""
+    pipe = redis.pipeline(transaction=False)
+    for family in _warmers:
+        key = popularity_key(family)
+        pipe.zunionstore(key, {key: settings.CACHE_POPULARITY_DECAY})
+        pipe.zremrangebyrank(key, 0, -settings.CACHE_POPULARITY_MAX_TRACKED - 1)
+    await pipe.execute()
+
+
+async def warm_cache(redis: Redis) -> int:
+    """
+    Fill the missing keys of the CACHE_WARM_TOP_K most popular members of
+    every family, CACHE_WARM_CONCURRENCY loads at a time, then write them
+    in one pipeline. Returns how many keys it filled.
+    """
+    families = list(_warmers)
+    pipe = redis.pipeline(transaction=False)
+    for family in families:
+        pipe.zrevrange(popularity_key(family), 0, settings.CACHE_WARM_TOP_K - 1)
+    targets = [
+        _warmers[family](member.decode())
+        for family, members in zip(families, await pipe.execute())
+        for member in members
+    ]
+    if not targets:
+        return 0
+
+    pipe = redis.pipeline(transaction=False)
+    for key, _ in targets:
+        pipe.exists(key.key)
+    targets = [
+        target for target, exists in zip(targets, await pipe.execute()) if not exists
+    ]
+
+    semaphore = asyncio.Semaphore(settings.CACHE_WARM_CONCURRENCY)
+    writes = redis.pipeline(transaction=False)
+
+    async def warm(key: CacheKey, loader: ResponseLoader) -> None:
+        async with semaphore, AsyncSessionLocal() as db:
+            cache = Cache(redis, db)
+            value, delta, tags = await cache.load(
+                key, response_value_loader(key, loader), db
+            )
+            await cache.set(key, value, delta=delta, tags=tags, pipe=writes)
+
+    results = await asyncio.gather(
+        *(warm(key, loader) for key, loader in targets), return_exceptions=True
+    )
+    for (key, _), result in zip(targets, results):
+        if isinstance(result, Exception):
+            logger.warning("Cache warming failed for %s: %s", key, result)
+    await writes.execute()
+    return sum(not isinstance(result, Exception) for result in results)
+
+
+async def warm_cache_periodically(redis: Redis, interval: int) -> None:
+    """
+    Flush access counts every CACHE_POPULARITY_FLUSH_INTERVAL seconds and,
+    once per `interval` across all workers, decay the scores and warm the
+    most popular keys, starting right away. Runs as a background task, so
+    the app serves traffic while it warms.
+    """
+    next_warm = 0.0
+    while True:
+        try:
+            await flush_access_counts(redis)
+            if time.monotonic() >= next_warm:
+                next_warm = time.monotonic() + interval
+                if await redis.set(WARM_LOCK_KEY, WORKER_ID, nx=True, ex=interval):
+                    await decay_popularity(redis)
+                    if warmed := await warm_cache(redis):
+                        logger.info("Warmed %d cache keys", warmed)
+        except Exception:
+            logger.exception("Cache warming failed")
+        await asyncio.sleep(settings.CACHE_POPULARITY_FLUSH_INTERVAL)
@@ -1,11 +1,43 @@
+import base64
+import json
+
 from pydantic import BaseModel, Field
 
+from src.common.exceptions import HTTP400
+
+
+def encode_cursor(*values: str | int) -> str:
+    """Opaque, URL-safe cursor for the sort key of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    """Values of a cursor made by `encode_cursor` from values of `types`"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise HTTP400(detail="Invalid cursor") from None
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTP400(detail="Invalid cursor")
+    # bool is an int to isinstance, but never a sort key
+    if any(
+        type(value) is bool or not isinstance(value, expected)
+        for value, expected in zip(values, types)
+    ):
+        raise HTTP400(detail="Invalid cursor")
+    return values
+
 
 class PaginationParams(BaseModel):
     """Pagination parameters"""
 
     page: int = Field(default=1, ge=1, description="Page number")
     size: int = Field(default=10, ge=1, le=100, description="Items per page")
+    cursor: str | None = Field(
+        default=None,
+        description="next_cursor of the previous page; takes precedence over page",
+    )
 
     @property
     def offset(self) -> int:
@@ -16,3 +48,6 @@ class PaginationResponse(PaginationParams):
     """Pagination response"""
 
     total: int = Field(default=0, ge=0, description="Total number of items")
+    next_cursor: str | None = Field(
+        default=None, description="Cursor for the next page, if there is one"
+    )
@@ -0,0 +1,208 @@
+import logging
+import math
+from typing import Annotated, NamedTuple
+
+from fastapi import Depends, HTTPException, Request, status
+from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.common.metrics import Counter
+from src.config import settings
+from src.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Sliding-window counter, in one hash per scope and client:
+# ratelimit:<scope>:<client> holds the index of the current fixed window and
+# the hits counted in it and in the one before. A request is let in while
+#   previous * (share of the previous window still inside the sliding one)
+#   + current
+# stays under the limit, so a burst at a window boundary cannot double the
+# rate. Redis' clock is used, so every worker agrees on the windows.
+# Returns allowed (0/1), requests left, and milliseconds until the next
+# request would be allowed and until the current window resets.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local index = math.floor(now / window)
+local elapsed = now - index * window
+
+local state = redis.call('HMGET', KEYS[1], 'index', 'current', 'previous')
+local stored = tonumber(state[1]) or index
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if stored == index - 1 then
+    previous, current = current, 0
+elseif stored < index - 1 then
+    previous, current = 0, 0
+end
+
+local used = previous * (1 - elapsed / window) + current
+local allowed = 0
+local retry_after = 0
+if used + 1 <= limit then
+    allowed = 1
+    current = current + 1
+    used = used + 1
+elseif current + 1 <= limit then
+    -- wait for enough of the previous window to slide out
+    retry_after = window * (1 - (limit - current - 1) / previous) - elapsed
+else
+    -- this window is full: wait for the next, whose previous is this one
+    retry_after = window - elapsed
+    if current > 0 then
+        retry_after = retry_after + window * math.max(0, 1 - (limit - 1) / current)
+    end
+end
+
+redis.call('HSET', KEYS[1], 'index', index, 'current', current, 'previous', previous)
+redis.call('EXPIRE', KEYS[1], window * 2)
+return {
+    allowed,
+    math.max(0, math.floor(limit - used)),
+    math.ceil(retry_after * 1000),
+    math.ceil((window - elapsed) * 1000),
+}
+"""
+
+RATE_LIMIT_CHECKS = Counter(
+    "rate_limit_requests_total",
+    "Requests checked by the rate limiter, by scope and outcome: allowed, "
+    "rejected, or error (Redis failed and the request was let through)",
+    ["scope", "result"],
+)
+
+
+class RateLimitState(NamedTuple):
+    limit: int
+    remaining: int
+    reset: int  # seconds until the current window resets
+    retry_after: int  # seconds until a rejected client may retry
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if self.retry_after:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def rate_limit_key(scope: str, client: str) -> str:
+    return f"ratelimit:{scope}:{client}"
+
+
+def client_id(request: Request) -> str:
+    """
+    The client's address. Behind RATE_LIMIT_TRUSTED_PROXIES proxies, the
+    entry of RATE_LIMIT_CLIENT_HEADER the outermost one appended: entries to
+    its left come from the client and can be forged.
+    """
+    peer = request.client.host if request.client else "unknown"
+    proxies = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if proxies <= 0:
+        return peer
+    forwarded = request.headers.get(settings.RATE_LIMIT_CLIENT_HEADER, "")
+    addresses = [address.strip() for address in forwarded.split(",")]
+    if len(addresses) < proxies or not addresses[-proxies]:
+        # The request did not come through every trusted proxy
+        return peer
+    return addresses[-proxies]
+
+
+class RateLimit:
+    """
+    Dependency enforcing `requests` per `window` seconds for each client,
+    counted separately per `scope`. Routes take the generous default scope,
+    and expensive ones layer a stricter scope on top. Over the limit it raises
+    429; either way the RateLimit-* headers of the tightest scope are set
+    (see RateLimitHeadersMiddleware). If Redis fails, requests go through.
+    """
+
+    def __init__(
+        self,
+        scope: str = "default",
+        requests: int = settings.RATE_LIMIT_REQUESTS,
+        window: int = settings.RATE_LIMIT_WINDOW,
+    ) -> None:
+        self.scope = scope
+        self.requests = requests
+        self.window = window
+        self.script: AsyncScript | None = None
+
+    async def check(self, redis: Redis, client: str) -> tuple[bool, RateLimitState]:
+        if self.script is None:
+            self.script = redis.register_script(SLIDING_WINDOW_SCRIPT)
+        # EVALSHA: the script body is only sent again when Redis lost it
+        allowed, remaining, retry_after_ms, reset_ms = await self.script(
+            keys=[rate_limit_key(self.scope, client)],
+            args=[self.requests, self.window],
+            client=redis,
+        )
+        return bool(allowed), RateLimitState(
+            self.requests,
+            remaining,
+            math.ceil(reset_ms / 1000),
+            math.ceil(retry_after_ms / 1000) if not allowed else 0,
+        )
+
+    async def __call__(
+        self, request: Request, redis: Annotated[Redis, Depends(get_redis)]
+    ) -> None:
+        if not settings.RATE_LIMIT_ENABLED or not self.requests:
+            return
+        try:
+            allowed, state = await self.check(redis, client_id(request))
+        except Exception:
+            RATE_LIMIT_CHECKS.inc(scope=self.scope, result="error")
+            logger.warning("Rate limit check failed", exc_info=True)
+            return
+
+        previous = getattr(request.state, "rate_limit", None)
+        if previous is None or state.remaining <= previous.remaining:
+            request.state.rate_limit = state
+        if not allowed:
+            RATE_LIMIT_CHECKS.inc(scope=self.scope, result="rejected")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers=state.headers(),
+            )
+        RATE_LIMIT_CHECKS.inc(scope=self.scope, result="allowed")
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Add the RateLimit-* headers a RateLimit dependency recorded to the
+    response, including ones routes build themselves, such as cached raw
+    bodies, which never see the dependency's Response.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            state = scope.get("state", {}).get("rate_limit")
+            if message["type"] == "http.response.start" and state is not None:
+                present = {name.lower() for name, _ in message.get("headers", [])}
+                message["headers"] = [
+                    *message.get("headers", []),
+                    *(
+                        (name.lower().encode(), value.encode())
+                        for name, value in state.headers().items()
+                        if name.lower().encode() not in present
+                    ),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
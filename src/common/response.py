@@ -22,3 +22,8 @@ def create_response(
 ) -> StandardResponse:
     """Create a standardized response"""
     return StandardResponse(detail=message, data=data, pagination=pagination)
+
+
+def render_response(response: StandardResponse) -> bytes:
+    """Serialize a response to the JSON body FastAPI would send for it"""
+    return response.__pydantic_serializer__.to_json(response)
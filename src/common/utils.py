@@ -1,9 +1,12 @@
+import logging
 import secrets
 from datetime import datetime, date
 from decimal import Decimal
 from enum import Enum
 from typing import Any
 
+logger = logging.getLogger(__name__)
+
 
 def generate_public_id() -> str:
     """Generate a unique 11-character public id"""
@@ -25,6 +28,8 @@ def json_serializer(obj: Any) -> Any:  # noqa: ANN401
         # Handle objects with __dict__ (like SQLAlchemy models)
         return obj.__dict__
 
-    # Print the problematic object type for debugging
-    print(f"Cannot serialize object of type: {type(obj).__name__}, value: {obj}")
+    # Log the problematic object type for debugging
+    logger.debug(
+        "Cannot serialize object of type: %s, value: %r", type(obj).__name__, obj
+    )
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
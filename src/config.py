@@ -4,7 +4,7 @@ from typing import Any
 from pydantic import PostgresDsn, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from src.constants import Environment
+from src.constants import Environment, RedisMode
 
 
 class CustomBaseSettings(BaseSettings):
@@ -20,8 +20,11 @@ class Config(CustomBaseSettings):
 
     DATABASE_URL: PostgresDsn
     DATABASE_ASYNC_URL: PostgresDsn
+    # Pool of each engine (sync and async) in each worker
     DATABASE_POOL_SIZE: int = 16
-    DATABASE_POOL_TTL: int = 60 * 20  # 20 minutes
+    DATABASE_MAX_OVERFLOW: int = 4  # opened past the size when busy, closed after
+    DATABASE_POOL_TIMEOUT: float = 5  # seconds to wait for a free connection
+    DATABASE_POOL_TTL: int = 60 * 20  # 20 minutes, then the connection is replaced
     DATABASE_POOL_PRE_PING: bool = True
 
     ENVIRONMENT: Environment = Environment.PRODUCTION
@@ -42,21 +45,126 @@ class Config(CustomBaseSettings):
     REDIS_DB: str
     REDIS_PASSWORD: str
     REDIS_URL: str
+    # STANDALONE connects to REDIS_URL; CLUSTER discovers the cluster from
+    # the node REDIS_URL names; SENTINEL asks REDIS_SENTINELS ("host:port")
+    # for REDIS_SENTINEL_MASTER and logs in with the credentials and db of
+    # REDIS_URL
+    REDIS_MODE: RedisMode = RedisMode.STANDALONE
+    REDIS_SENTINELS: list[str] = []
+    REDIS_SENTINEL_MASTER: str = "mymaster"
+    REDIS_SENTINEL_PASSWORD: str | None = None
+    # Serve cache reads from replicas (CLUSTER and SENTINEL). Replicas lag a
+    # little: a just-invalidated entry may still be read for a moment
+    REDIS_READ_FROM_REPLICAS: bool = False
+    # Pool of each client in each worker (of each node in a cluster)
+    REDIS_MAX_CONNECTIONS: int = 32
+    REDIS_POOL_TIMEOUT: float = 2  # seconds to wait for a free connection
 
     # Cache settings
     CACHE_TTL: int
     PRODUCT_CACHE_TTL: int
+    PRODUCT_LIST_CACHE_TTL: int = 300
+    PRODUCT_SEARCH_CACHE_TTL: int = 600
+    CATEGORY_TOP_PRODUCTS_CACHE_TTL: int = 1800
+    CACHE_TTL_JITTER: float = 0.1  # +/- fraction of the TTL
+    CACHE_CODEC: str = "msgpack"  # json | msgpack
+    CACHE_COMPRESSION: str = "zlib"  # none | zlib | lz4
+    CACHE_COMPRESS_MIN_BYTES: int = 1024
+    # Families cached as fully rendered response bodies (zero-reparse hits)
+    CACHE_RAW_RESPONSE_FAMILIES: list[str] = []
+    CACHE_STALE_TTL_RATIO: float = 0.5  # stale window, as a fraction of the TTL
+    CACHE_XFETCH_BETA: float = 1.0  # > 1 favours earlier recomputation
+    CACHE_LOCK_TTL_MS: int = 10_000  # cross-worker fill lock lifetime
+    CACHE_LOCK_WAIT_TIMEOUT: float = 5.0  # seconds to wait for another filler
+
+    # In-process (L1) cache in front of Redis
+    CACHE_LOCAL_ENABLED: bool = False
+    CACHE_LOCAL_FAMILIES: list[str] = [
+        "product",
+        "products:page",
+        "category:top_products",
+    ]
+    CACHE_LOCAL_MAX_ENTRIES: int = 1024
+    CACHE_LOCAL_MAX_BYTES: int = 32 * 1024 * 1024
+    CACHE_LOCAL_TTL: float = 30
+
+    # Product totals kept in Redis instead of COUNT(*) on every listing miss
+    PRODUCT_COUNTS_REFRESH_INTERVAL: int = 300  # seconds, 0 disables
+    # Search totals above this many rows (per the planner) are estimated; 0 = exact
+    PRODUCT_COUNT_ESTIMATE_THRESHOLD: int = 0
+
+    # Redis trigram index narrowing /product/search (see src/product/search_index.py)
+    SEARCH_INDEX_ENABLED: bool = False
+    SEARCH_INDEX_SYNC_INTERVAL: float = 1.0  # seconds between queue drains
+    SEARCH_INDEX_BATCH_SIZE: int = 500
+    # Seconds between full rebuilds, catching writes the model hooks missed; 0 = never
+    SEARCH_INDEX_REBUILD_INTERVAL: int = 3600
+    # Terms matching more products than this fall back to the plain ILIKE scan
+    SEARCH_INDEX_MAX_CANDIDATES: int = 5000
+
+    # Typeahead index behind /product/suggest (see src/product/suggest.py)
+    SUGGEST_REFRESH_INTERVAL: int = 300  # seconds between rebuilds, 0 disables
+    SUGGEST_LIMIT: int = 10
+    SUGGEST_MAX_LIMIT: int = 50
+    # Prefixes up to this long are ranked over every name at rebuild time;
+    # longer ones rank the first SUGGEST_SCAN_LIMIT names of their range
+    SUGGEST_TOP_PREFIX_LENGTH: int = 3
+    SUGGEST_SCAN_LIMIT: int = 200
+
+    # Per-category Redis leaderboards behind /category/top-products
+    # (see src/product/leaderboards.py)
+    LEADERBOARDS_ENABLED: bool = False
+    LEADERBOARD_SYNC_INTERVAL: float = 1.0  # seconds between queue drains
+    LEADERBOARD_BATCH_SIZE: int = 500
+    CATEGORY_TOP_PRODUCTS_LIMIT: int = 5
+    CATEGORY_TOP_PRODUCTS_MAX_LIMIT: int = 50
+
+    # Most slugs one /product/batch request may ask for
+    PRODUCT_BATCH_MAX_SLUGS: int = 50
+
+    # Popularity-driven cache warming (see src/cache/warming.py)
+    CACHE_WARM_INTERVAL: int = 600  # seconds between warm cycles, 0 disables
+    CACHE_WARM_TOP_K: int = 100  # most popular keys warmed per family
+    CACHE_WARM_CONCURRENCY: int = 8
+    CACHE_POPULARITY_DECAY: float = 0.5  # score multiplier per warm cycle
+    CACHE_POPULARITY_MAX_TRACKED: int = 10_000
+    CACHE_POPULARITY_FLUSH_INTERVAL: float = 5.0
 
     # Session settings
     SESSION_TTL: int
-    # Rate limiting
+    # Rate limiting, per client and route (see src/common/rate_limit.py);
+    # the default budget of the cheap /product routes, e.g. 600 a minute
+    RATE_LIMIT_ENABLED: bool = True
     RATE_LIMIT_REQUESTS: int
     RATE_LIMIT_WINDOW: int
-
-    # Celery
+    # Stricter limit on /product/search, in place of the default one; 0 disables
+    RATE_LIMIT_SEARCH_REQUESTS: int = 30
+    RATE_LIMIT_SEARCH_WINDOW: int = 60
+    # Proxies in front of the app that append the address they received from
+    # to RATE_LIMIT_CLIENT_HEADER; the client is that many entries from the
+    # right. 0 trusts no header and uses the peer address
+    RATE_LIMIT_TRUSTED_PROXIES: int = 0
+    RATE_LIMIT_CLIENT_HEADER: str = "X-Forwarded-For"
+
+    # Celery; an empty broker URL means REDIS_URL (see src/worker.py)
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
 
+    # Product.rating and total_sold recomputed by the worker
+    # (see src/product/aggregates.py), from "table.column" sources kept by
+    # the review and order services in this database; empty disables one
+    AGGREGATES_RATING_SOURCE: str = ""  # e.g. productreview.rating
+    AGGREGATES_TOTAL_SOLD_SOURCE: str = ""  # e.g. orderitem.quantity
+    # Columns of both source tables: the product of a row, its last change
+    AGGREGATES_SOURCE_PRODUCT_COLUMN: str = "product_id"
+    AGGREGATES_SOURCE_UPDATED_AT_COLUMN: str = "updated_at"
+    AGGREGATES_REFRESH_INTERVAL: int = 300  # seconds between runs, 0 disables
+    AGGREGATES_FULL_REFRESH_INTERVAL: int = 24 * 60 * 60  # every product, 0 never
+    AGGREGATES_BATCH_SIZE: int = 1000
+    # Rows updated less than this many seconds ago wait for the next run
+    AGGREGATES_WATERMARK_LAG: int = 60
+    AGGREGATES_LOCK_TTL: int = 60 * 60
+
     APP_VERSION: str = "0.1"
 
     @model_validator(mode="after")
@@ -26,3 +26,9 @@ class Environment(str, Enum):
     @property
     def is_deployed(self) -> bool:
         return self in (self.STAGING, self.PRODUCTION)
+
+
+class RedisMode(str, Enum):
+    STANDALONE = "STANDALONE"
+    CLUSTER = "CLUSTER"
+    SENTINEL = "SENTINEL"
@@ -1,22 +1,105 @@
-from collections.abc import Generator
-from typing import AsyncGenerator
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable, Generator, Iterator
+from contextlib import contextmanager
+from typing import Any, NamedTuple
 
-from sqlalchemy import MetaData, create_engine
+from redis import BlockingConnectionPool as SyncBlockingConnectionPool
+from redis import Redis as SyncRedis
+from redis.asyncio import BlockingConnectionPool, ConnectionPool, Redis
+from redis.asyncio.client import Pipeline, PubSub
+from redis.asyncio.cluster import ClusterPipeline, RedisCluster
+from redis.asyncio.sentinel import Sentinel, SentinelConnectionPool
+from redis.cluster import LoadBalancingStrategy
+from redis.cluster import RedisCluster as SyncRedisCluster
+from redis.connection import parse_url
+from redis.sentinel import Sentinel as SyncSentinel
+from redis.sentinel import SentinelConnectionPool as SyncSentinelConnectionPool
+from sqlalchemy import Engine, MetaData, create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
 from sqlmodel import Session
 
+from src.common.metrics import Gauge, Histogram
 from src.config import settings
-from src.constants import DB_NAMING_CONVENTION
+from src.constants import DB_NAMING_CONVENTION, RedisMode
 
+logger = logging.getLogger(__name__)
 
-from redis.asyncio import Redis
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ["engine"]
+)
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency; a pipeline counts as one PIPELINE command",
+    ["command"],
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time to get a connection from the SQLAlchemy pool, including opening a "
+    "new one; waits reaching DATABASE_POOL_TIMEOUT failed",
+    ["engine"],
+)
+REDIS_POOL_WAIT_SECONDS = Histogram(
+    "redis_pool_checkout_duration_seconds",
+    "Time to get a connection from a Redis pool, including opening a new "
+    "one; waits reaching REDIS_POOL_TIMEOUT failed",
+    ["client"],
+)
+
+
+def async_database_url(url: str) -> str:
+    """Point a plain postgresql:// URL at the asyncpg driver"""
+    scheme, rest = url.split("://", 1)
+    if scheme in ("postgres", "postgresql"):
+        scheme = "postgresql+asyncpg"
+    return f"{scheme}://{rest}"
 
 
 DATABASE_URL = str(settings.DATABASE_URL)
+DATABASE_ASYNC_URL = async_database_url(str(settings.DATABASE_ASYNC_URL))
 REDIS_URL = str(settings.REDIS_URL)
 
 metadata = MetaData(naming_convention=DB_NAMING_CONVENTION)
-engine = create_engine(DATABASE_URL, echo=settings.DEBUG, pool_size=10, max_overflow=5)
+
+
+class TimedCheckout:
+    """Pool mixin observing how long each checkout waits for a connection"""
+
+    engine_name: str
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(
+                time.perf_counter() - start, engine=self.engine_name
+            )
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    engine_name = "sync"
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    engine_name = "async"
+
+
+# Per engine and worker: the database must accept
+# workers * 2 * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) connections
+POOL_OPTIONS = {
+    "pool_size": settings.DATABASE_POOL_SIZE,
+    "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+    "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+    "pool_recycle": settings.DATABASE_POOL_TTL,
+    "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+}
+engine = create_engine(
+    DATABASE_URL, echo=settings.DEBUG, poolclass=TimedQueuePool, **POOL_OPTIONS
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -28,33 +111,315 @@ def get_db() -> Generator[Session]:
         db.close()
 
 
+async_engine = create_async_engine(
+    DATABASE_ASYNC_URL,
+    echo=settings.DEBUG,
+    poolclass=TimedAsyncQueuePool,
+    **POOL_OPTIONS,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+def time_queries(sync_engine: Engine, name: str) -> None:
+    """Observe the latency of every statement `sync_engine` runs"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start(connection: Any, *_args: Any) -> None:
+        connection.info["query_started_at"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop(connection: Any, *_args: Any) -> None:
+        started_at = connection.info.pop("query_started_at", None)
+        if started_at is not None:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started_at, engine=name)
+
+
+time_queries(engine, "sync")
+time_queries(async_engine.sync_engine, "async")
+
+
+def db_pool_stats() -> dict[tuple, float]:
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        stats[name, "max"] = pool.size() + max(pool._max_overflow, 0)
+        stats[name, "size"] = pool.size()
+        stats[name, "checked_out"] = pool.checkedout()
+        stats[name, "idle"] = pool.checkedin()
+        stats[name, "overflow"] = max(pool.overflow(), 0)
+    return stats
+
+
+Gauge(
+    "db_pool_connections",
+    "SQLAlchemy pool connections by state; checked_out near size + max_overflow "
+    "means requests queue for a connection",
+    db_pool_stats,
+    ["engine", "state"],
+)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_concurrently(
+    *queries: Callable[[AsyncSession], Awaitable[Any]],
+) -> list[Any]:
+    """
+    Run independent queries at the same time, each on its own session (an
+    AsyncSession only runs one statement at a time). Each query must load
+    everything it needs before returning, as its session closes right after.
+    Best called before the caller's own session runs anything, so that it
+    does not hold a connection while waiting for these.
+    """
+
+    async def run(query: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        async with AsyncSessionLocal() as db:
+            return await query(db)
+
+    return list(await asyncio.gather(*(run(query) for query in queries)))
+
+
+@contextmanager
+def timed(command: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REDIS_COMMAND_SECONDS.observe(time.perf_counter() - start, command=command)
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        with timed("PIPELINE"):
+            return await super().execute(raise_on_error)
+
+
+class InstrumentedRedis(Redis):
+    """Async client that times every command and pipeline it sends"""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        with timed(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: str | None = None
+    ) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class InstrumentedClusterPipeline(ClusterPipeline):
+    """
+    Timed cluster pipeline that also takes PUBLISH, which cluster pipelines
+    refuse: messages are sent once the other commands ran, and their
+    results come last
+    """
+
+    def __init__(self, client: RedisCluster, transaction: bool | None = None) -> None:
+        super().__init__(client, transaction)
+        self.messages: list[tuple[Any, Any]] = []
+
+    def publish(self, channel: Any, message: Any) -> "InstrumentedClusterPipeline":
+        self.messages.append((channel, message))
+        return self
+
+    async def execute(
+        self, raise_on_error: bool = True, allow_redirections: bool = True
+    ) -> list[Any]:
+        messages, self.messages = self.messages, []
+        with timed("PIPELINE"):
+            results = await super().execute(raise_on_error, allow_redirections)
+            for channel, message in messages:
+                results.append(await self.cluster_client.publish(channel, message))
+        return results
+
+
+class InstrumentedRedisCluster(RedisCluster):
+    """
+    Cluster client that times every command, and behaves like the
+    standalone one where the app relies on it: MGET may span slots (one
+    MGET per slot), pipelines may PUBLISH, and pubsub() works, subscribing
+    through a single node since a cluster forwards PUBLISH to every node
+    """
+
+    subscriber: Redis | None = None
+
+    async def execute_command(self, *args: Any, **kwargs: Any) -> Any:
+        with timed(str(args[0]).upper()):
+            return await super().execute_command(*args, **kwargs)
+
+    async def mget(self, keys: Any, *args: Any) -> list[Any]:
+        return await self.mget_nonatomic(keys, *args)
+
+    def pipeline(
+        self, transaction: bool | None = None, shard_hint: str | None = None
+    ) -> ClusterPipeline:
+        return InstrumentedClusterPipeline(self, transaction)
+
+    def pubsub(self, **kwargs: Any) -> PubSub:
+        if self.subscriber is None:
+            node = self.get_default_node()
+            self.subscriber = InstrumentedRedis.from_pool(
+                ConnectionPool(
+                    connection_class=node.connection_class, **node.connection_kwargs
+                )
+            )
+        return self.subscriber.pubsub(**kwargs)
+
+    async def aclose(self) -> None:
+        if self.subscriber is not None:
+            await self.subscriber.aclose()
+        await super().aclose()
+
+
+class TimedBlockingPool(BlockingConnectionPool):
+    """
+    Pool making commands wait up to REDIS_POOL_TIMEOUT for a free
+    connection, rather than fail, and observing how long they waited
+    """
+
+    async def get_connection(self, *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            REDIS_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, client="async")
+
+
+class TimedSentinelPool(SentinelConnectionPool, TimedBlockingPool):
+    pass
+
+
+class TimedSyncBlockingPool(SyncBlockingConnectionPool):
+    """The blocking client's TimedBlockingPool"""
+
+    def get_connection(self, *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return super().get_connection(*args, **kwargs)
+        finally:
+            REDIS_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, client="sync")
+
+
+class TimedSyncSentinelPool(SyncSentinelConnectionPool, TimedSyncBlockingPool):
+    pass
+
+
+class RedisClasses(NamedTuple):
+    client: type
+    cluster: type
+    sentinel: type
+    pool: type
+    sentinel_pool: type
+
+
+ASYNC_REDIS = RedisClasses(
+    InstrumentedRedis,
+    InstrumentedRedisCluster,
+    Sentinel,
+    TimedBlockingPool,
+    TimedSentinelPool,
+)
+SYNC_REDIS = RedisClasses(
+    SyncRedis,
+    SyncRedisCluster,
+    SyncSentinel,
+    TimedSyncBlockingPool,
+    TimedSyncSentinelPool,
+)
+
+# Per client and worker; in a cluster, per node. Cluster clients do not
+# queue for a connection: past the limit a command fails at once.
+REDIS_OPTIONS = {
+    "max_connections": settings.REDIS_MAX_CONNECTIONS,
+    "socket_connect_timeout": 5,
+    "socket_keepalive": True,
+}
+
+
+def sentinel_nodes() -> list[tuple[str, int]]:
+    nodes = (node.rsplit(":", 1) for node in settings.REDIS_SENTINELS)
+    return [(host, int(port)) for host, port in nodes]
+
+
+def create_redis(classes: RedisClasses, replica: bool = False, **options: Any) -> Any:
+    """
+    Client of `classes` for the REDIS_MODE topology; `replica` gives one
+    reading from replicas instead
+    """
+    options = {**REDIS_OPTIONS, **options}
+    match settings.REDIS_MODE:
+        case RedisMode.CLUSTER:
+            if replica:
+                options["load_balancing_strategy"] = (
+                    LoadBalancingStrategy.ROUND_ROBIN_REPLICAS
+                )
+            return classes.cluster.from_url(REDIS_URL, **options)
+        case RedisMode.SENTINEL:
+            url = parse_url(REDIS_URL)
+            credentials = {
+                name: url[name]
+                for name in ("username", "password", "db")
+                if name in url
+            }
+            sentinel = classes.sentinel(
+                sentinel_nodes(),
+                sentinel_kwargs={
+                    "password": settings.REDIS_SENTINEL_PASSWORD or None,
+                    "socket_connect_timeout": options["socket_connect_timeout"],
+                },
+                **credentials,
+                **options,
+            )
+            connect = sentinel.slave_for if replica else sentinel.master_for
+            return connect(
+                settings.REDIS_SENTINEL_MASTER,
+                redis_class=classes.client,
+                connection_pool_class=classes.sentinel_pool,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+            )
+        case _:
+            return classes.client.from_pool(
+                classes.pool.from_url(
+                    REDIS_URL, timeout=settings.REDIS_POOL_TIMEOUT, **options
+                )
+            )
+
+
 redis_pool: Redis | None = None
+# Cache reads go here when REDIS_READ_FROM_REPLICAS; else None
+redis_replica: Redis | None = None
 
 
 async def init_redis_pool():
     """Initialize Redis connection pool - call at app startup"""
-    global redis_pool
-    redis_pool = Redis.from_url(
-        REDIS_URL,
-        encoding="utf-8",
-        decode_responses=True,
-        max_connections=10,
-        socket_connect_timeout=5,
-        socket_keepalive=True,
-    )
+    global redis_pool, redis_replica
+    # Raw bytes: cache entries are binary (see src/cache/codecs.py)
+    redis_pool = create_redis(ASYNC_REDIS, decode_responses=False)
     await redis_pool.ping()
-    print("Redis connected")
+    if (
+        settings.REDIS_READ_FROM_REPLICAS
+        and settings.REDIS_MODE != RedisMode.STANDALONE
+    ):
+        redis_replica = create_redis(ASYNC_REDIS, replica=True, decode_responses=False)
+    logger.info("Redis connected (%s)", settings.REDIS_MODE.value.lower())
 
 
 async def close_redis_pool():
     """Close Redis connection pool - call at app shutdown"""
-    global redis_pool
+    if redis_replica:
+        await redis_replica.aclose()
     if redis_pool:
         await redis_pool.aclose()
-        print("Redis pool closed")
+        logger.info("Redis pool closed")
 
 
-async def get_redis() -> AsyncGenerator[Redis, None]:
+async def get_redis() -> AsyncGenerator[Redis]:
     if redis_pool is None:
         raise RuntimeError(
             "Redis pool not initialized. Call init_redis_pool() at startup"
@@ -63,3 +428,105 @@ async def get_redis() -> AsyncGenerator[Redis, None]:
         yield redis_pool
     finally:
         pass
+
+
+sync_redis: SyncRedis | None = None
+
+
+def get_sync_redis() -> SyncRedis:
+    """
+    Blocking Redis client for code that runs outside the event loop's reach,
+    such as SQLAlchemy session hooks. Created on first use.
+    """
+    global sync_redis
+    if sync_redis is None:
+        sync_redis = create_redis(SYNC_REDIS, encoding="utf-8", decode_responses=True)
+    return sync_redis
+
+
+_after_commit_tasks: set[asyncio.Task] = set()
+
+
+def log_failure(task: asyncio.Task) -> None:
+    _after_commit_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("After-commit Redis update failed", exc_info=task.exception())
+
+
+def run_after_commit(work: Callable[[SyncRedis], Any]) -> None:
+    """
+    Run `work` with the blocking Redis client from a session hook. When an
+    AsyncSession committed, the hook runs on the event loop's thread: the
+    work goes to a worker thread instead of blocking every request while
+    it waits on Redis. Elsewhere (sync sessions, Celery tasks) it runs now.
+    """
+
+    def run() -> None:
+        work(get_sync_redis())
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        run()
+        return
+    task = loop.create_task(asyncio.to_thread(run))
+    _after_commit_tasks.add(task)
+    task.add_done_callback(log_failure)
+
+
+def pool_usage(client: Any) -> tuple[int, int, int]:
+    """Connections `client` may open, has in use and has idle, over its nodes"""
+    if isinstance(client, RedisCluster):
+        nodes = client.get_nodes()
+        idle = sum(len(node._free) for node in nodes)
+        return (
+            sum(node.max_connections for node in nodes),
+            sum(len(node._connections) for node in nodes) - idle,
+            idle,
+        )
+    if isinstance(client, SyncRedisCluster):
+        pools = [
+            node.redis_connection.connection_pool
+            for node in client.get_nodes()
+            if node.redis_connection is not None
+        ]
+    else:
+        pools = [client.connection_pool]
+    counts = [pool_counts(pool) for pool in pools]
+    return tuple(sum(values) for values in zip(*counts, strict=True)) or (0, 0, 0)
+
+
+def pool_counts(pool: Any) -> tuple[int, int, int]:
+    if isinstance(pool, SyncBlockingConnectionPool):
+        # Its queue holds idle connections and None for ones not opened yet
+        idle = sum(connection is not None for connection in pool.pool.queue)
+        return pool.max_connections, len(pool._connections) - idle, idle
+    return (
+        pool.max_connections,
+        len(pool._in_use_connections),
+        len(pool._available_connections),
+    )
+
+
+def redis_pool_stats() -> dict[tuple, float]:
+    stats = {}
+    for name, client in (
+        ("async", redis_pool),
+        ("async_replica", redis_replica),
+        ("sync", sync_redis),
+    ):
+        if client is None:
+            continue
+        stats[name, "max"], stats[name, "in_use"], stats[name, "idle"] = pool_usage(
+            client
+        )
+    return stats
+
+
+Gauge(
+    "redis_pool_connections",
+    "Redis pool connections by state, summed over the nodes of a cluster; "
+    "in_use at max means commands wait",
+    redis_pool_stats,
+    ["client", "state"],
+)
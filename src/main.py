@@ -1,29 +1,97 @@
+import asyncio
 from collections.abc import AsyncGenerator
-from typing import TYPE_CHECKING
-
-from src.config import app_configs, settings
-
+from contextlib import asynccontextmanager
 
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
 
-from src.database import init_redis_pool, close_redis_pool
-
+from src import database
+from src.cache.local import listen_for_invalidations
+from src.cache.warming import warm_cache_periodically
+from src.common.metrics import render_metrics
+from src.common.rate_limit import RateLimitHeadersMiddleware
+from src.config import app_configs, settings
+from src.database import close_redis_pool, init_redis_pool
+from src.product.category_tree import register_category_tree_tracking
+from src.product.counts import (
+    refresh_product_counts_periodically,
+    register_count_tracking,
+)
+from src.product.invalidation import register_cache_invalidation
+from src.product.leaderboards import (
+    maintain_leaderboards,
+    register_leaderboard_tracking,
+)
+from src.product.price_stats import register_price_stats_tracking
 from src.product.routes import router as product_router
-
-if TYPE_CHECKING:
-    pass
-
-
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from src.product.search_index import (
+    maintain_search_index,
+    register_search_index_tracking,
+)
+from src.product.suggest import refresh_suggestions_periodically
 
 
 @asynccontextmanager
 async def lifespan(_application: FastAPI) -> AsyncGenerator:
     # Startup
     await init_redis_pool()
+    register_cache_invalidation()
+    register_count_tracking()
+    register_category_tree_tracking()
+    register_price_stats_tracking()
+    background_tasks = []
+    if settings.CACHE_LOCAL_ENABLED:
+        background_tasks.append(
+            asyncio.create_task(listen_for_invalidations(database.redis_pool))
+        )
+    if settings.PRODUCT_COUNTS_REFRESH_INTERVAL:
+        background_tasks.append(
+            asyncio.create_task(
+                refresh_product_counts_periodically(
+                    database.redis_pool, settings.PRODUCT_COUNTS_REFRESH_INTERVAL
+                )
+            )
+        )
+    if settings.SEARCH_INDEX_ENABLED:
+        register_search_index_tracking()
+        background_tasks.append(
+            asyncio.create_task(
+                maintain_search_index(
+                    database.redis_pool, settings.SEARCH_INDEX_SYNC_INTERVAL
+                )
+            )
+        )
+    if settings.LEADERBOARDS_ENABLED:
+        register_leaderboard_tracking()
+        background_tasks.append(
+            asyncio.create_task(
+                maintain_leaderboards(
+                    database.redis_pool, settings.LEADERBOARD_SYNC_INTERVAL
+                )
+            )
+        )
+    if settings.SUGGEST_REFRESH_INTERVAL:
+        background_tasks.append(
+            asyncio.create_task(
+                refresh_suggestions_periodically(
+                    database.redis_pool, settings.SUGGEST_REFRESH_INTERVAL
+                )
+            )
+        )
+    if settings.CACHE_WARM_INTERVAL:
+        # In the background: warming must not hold up readiness
+        background_tasks.append(
+            asyncio.create_task(
+                warm_cache_periodically(
+                    database.redis_pool, settings.CACHE_WARM_INTERVAL
+                )
+            )
+        )
     yield
     # Shutdown
+    for task in background_tasks:
+        task.cancel()
     await close_redis_pool()
 
 
@@ -39,6 +107,7 @@ app.include_router(
     tags=["Product"],
 )
 
+app.add_middleware(RateLimitHeadersMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -52,3 +121,8 @@ app.add_middleware(
 @app.get("/healthcheck", include_in_schema=False)
 async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,243 @@
+import logging
+import secrets
+import sys
+from collections.abc import Callable, Iterator
+from datetime import datetime, timedelta
+from itertools import batched
+from typing import NamedTuple
+
+from sqlalchemy import (
+    ColumnClause,
+    ColumnElement,
+    Connection,
+    TableClause,
+    column,
+    exists,
+    func,
+    inspect,
+    select,
+    table,
+    update,
+)
+
+from src.cache.singleflight import RELEASE_SCRIPT
+from src.cache.tags import invalidate_tags, tag
+from src.config import settings
+from src.database import engine, get_sync_redis
+from src.product.leaderboards import LEADERBOARD_DIRTY_KEY
+from src.product.models import Product
+from src.worker import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+class Aggregate(NamedTuple):
+    column: str  # the Product column it maintains
+    # "table.column" it is computed from, in a table kept by another service
+    # in this database (see AGGREGATES_*_SOURCE); empty disables it
+    source: str
+    function: Callable[[ColumnElement], ColumnElement]  # over a product's values
+
+
+AGGREGATES = {
+    "rating": Aggregate(
+        "rating",
+        settings.AGGREGATES_RATING_SOURCE,
+        lambda values: func.round(func.avg(values), 2),
+    ),
+    "total_sold": Aggregate(
+        "total_sold", settings.AGGREGATES_TOTAL_SOLD_SOURCE, func.sum
+    ),
+}
+
+
+class Source(NamedTuple):
+    """The columns of an aggregate's source table read here"""
+
+    table: TableClause
+    product_id: ColumnClause
+    value: ColumnClause
+    updated_at: ColumnClause
+
+
+def source_of(aggregate: Aggregate) -> Source:
+    table_name, value = aggregate.source.split(".")
+    source = table(
+        table_name,
+        column(settings.AGGREGATES_SOURCE_PRODUCT_COLUMN),
+        column(value),
+        column(settings.AGGREGATES_SOURCE_UPDATED_AT_COLUMN),
+    )
+    return Source(source, *source.c)
+
+
+def source_exists(connection: Connection, source: Source) -> bool:
+    """Whether the database has the source table with every column read"""
+    inspector = inspect(connection)
+    if not inspector.has_table(source.table.name):
+        return False
+    present = {info["name"] for info in inspector.get_columns(source.table.name)}
+    return all(read.name in present for read in source.table.c)
+
+
+def watermark_key(name: str) -> str:
+    """Source rows updated up to this time are reflected in the column"""
+    return f"aggregates:{name}:watermark"
+
+
+def lock_key(name: str) -> str:
+    return f"aggregates:{name}:lock"
+
+
+def changed_products(
+    connection: Connection, source: Source, since: datetime, until: datetime
+) -> list[int]:
+    """Products with source rows updated in (since, until]"""
+    return sorted(
+        connection.scalars(
+            select(source.product_id)
+            .filter(source.updated_at > since, source.updated_at <= until)
+            .distinct()
+        )
+    )
+
+
+def all_products(connection: Connection) -> Iterator[list[int]]:
+    last_id = 0
+    while ids := list(
+        connection.scalars(
+            select(Product.id)
+            .filter(Product.id > last_id)
+            .order_by(Product.id)
+            .limit(settings.AGGREGATES_BATCH_SIZE)
+        )
+    ):
+        yield ids
+        last_id = ids[-1]
+
+
+def recompute(
+    connection: Connection,
+    aggregate: Aggregate,
+    source: Source,
+    ids: list[int],
+    rebuild: bool = False,
+) -> list[tuple[int, int | None]]:
+    """
+    Set the column of the given products from their source rows in one
+    UPDATE; returns (id, category_id) of the products whose value moved.
+    Products without source rows are left alone, unless `rebuild` resets
+    them to 0.
+    """
+    of_product = source.product_id == Product.id
+    value = select(aggregate.function(source.value)).filter(of_product)
+    query = update(Product).where(Product.id.in_(ids))
+    if rebuild:
+        value = func.coalesce(value.scalar_subquery(), 0)
+    else:
+        value = value.scalar_subquery()
+        query = query.where(exists().where(of_product))
+    target = getattr(Product, aggregate.column)
+    rows = connection.execute(
+        query.where(target.is_distinct_from(value))
+        .values({aggregate.column: value})
+        .returning(Product.id, Product.category_id)
+    )
+    return [tuple(row) for row in rows]
+
+
+def publish_changes(changes: list[tuple[int, int | None]]) -> None:
+    """
+    What the session hooks would do for these updates, which bypass them:
+    drop the cached pages showing the products, and queue them for the
+    leaderboard maintainer.
+    """
+    if not changes:
+        return
+    redis = get_sync_redis()
+    tags = {tag("product", id) for id, _ in changes}
+    tags |= {tag("category", category_id) for _, category_id in changes}
+    invalidate_tags(redis, tags)
+    if settings.LEADERBOARDS_ENABLED:
+        redis.sadd(LEADERBOARD_DIRTY_KEY, *(id for id, _ in changes))
+
+
+def refresh(
+    aggregate: Aggregate, full: bool = False, rebuild: bool = False
+) -> int | None:
+    """
+    Recompute the column for the products whose source rows changed since
+    the watermark, or for every product when `full` or on the first run,
+    committing batch by batch. Returns how many products changed, None
+    when the source is not configured or not in the database.
+
+    The watermark trails the database clock by AGGREGATES_WATERMARK_LAG, so
+    rows of transactions still open when a run starts are picked up by a
+    later one. Products with no source rows keep their value, so a source
+    that is missing rows never wipes seeded ones: only a `rebuild` resets
+    them, e.g. after their last review or order line was deleted.
+    """
+    redis = get_sync_redis()
+    with engine.connect() as connection:
+        source = source_of(aggregate) if aggregate.source else None
+        if source is None or not source_exists(connection, source):
+            logger.warning(
+                "Product %s source %r not found, refresh skipped",
+                aggregate.column,
+                aggregate.source,
+            )
+            return None
+        until = connection.scalar(select(func.now())) - timedelta(
+            seconds=settings.AGGREGATES_WATERMARK_LAG
+        )
+        since = redis.get(watermark_key(aggregate.column))
+        if since is None or full or rebuild:
+            batches = all_products(connection)
+        else:
+            ids = changed_products(
+                connection, source, datetime.fromisoformat(since), until
+            )
+            batches = batched(ids, settings.AGGREGATES_BATCH_SIZE)
+
+        changed = 0
+        for ids in batches:
+            changes = recompute(connection, aggregate, source, list(ids), rebuild)
+            connection.commit()
+            publish_changes(changes)
+            changed += len(changes)
+    redis.set(watermark_key(aggregate.column), until.isoformat())
+    return changed
+
+
+@celery_app.task(name="product.refresh_aggregate")
+def refresh_aggregate(
+    name: str, full: bool = False, rebuild: bool = False
+) -> int | None:
+    """
+    Refresh Product.<name>; runs on one worker at a time; the others skip
+    and return None.
+    """
+    aggregate = AGGREGATES[name]
+    redis = get_sync_redis()
+    token = secrets.token_hex(8)
+    if not redis.set(lock_key(name), token, nx=True, ex=settings.AGGREGATES_LOCK_TTL):
+        logger.info("Product %s refresh already running, skipped", name)
+        return None
+    try:
+        changed = refresh(aggregate, full=full, rebuild=rebuild)
+        if changed is not None:
+            logger.info("Product %s refreshed, %d products changed", name, changed)
+        return changed
+    finally:
+        redis.eval(RELEASE_SCRIPT, 1, lock_key(name), token)
+
+
+if __name__ == "__main__":
+    # Rebuild, resetting products without source rows to 0:
+    # python -m src.product.aggregates [rating] [total_sold]
+    for name in sys.argv[1:] or AGGREGATES:
+        changed = refresh_aggregate(name, rebuild=True)
+        if changed is None:
+            print(f"Product {name} skipped, see the log")
+        else:
+            print(f"Product {name} rebuilt, {changed} products changed")
@@ -0,0 +1,176 @@
+import json
+from collections.abc import Iterable
+from functools import cached_property
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import database
+from src.database import run_after_commit
+from src.product.models import Category
+
+# Bumped on every committed Category change. The rows of the active
+# categories are stored under a key of their version, so a build racing a
+# change can only ever write an index nobody will read.
+CATEGORY_INDEX_VERSION_KEY = "category:index:version"
+CATEGORY_INDEX_TTL = 24 * 60 * 60
+
+
+def category_index_key(version: int) -> str:
+    return f"category:index:{version}"
+
+
+class CategoryTree:
+    """
+    The active categories with their closure: every category mapped to the
+    set of itself and all its descendants, computed once per change so a
+    descendant lookup is a dict access.
+    """
+
+    def __init__(self, rows: Iterable[tuple], version: int = 0) -> None:
+        self.version = version
+        # (id, parent_id, public_id, name, slug) of every active category
+        self.rows = [tuple(row) for row in rows]
+        self.children: dict[int | None, list[int]] = {}
+        for id, parent_id, *_ in self.rows:
+            self.children.setdefault(parent_id, []).append(id)
+        self.closure = self.build_closure()
+
+    def build_closure(self) -> dict[int, frozenset[int]]:
+        """Post-order walk with an explicit stack, safe on any depth or a cycle"""
+        closure: dict[int, frozenset[int]] = {}
+        nodes = {id for id, *_ in self.rows} | self.children.keys() - {None}
+        for root in nodes:
+            stack = [(root, False)]
+            visiting = set()
+            while stack:
+                node, expanded = stack.pop()
+                if node in closure:
+                    continue
+                children = self.children.get(node, ())
+                if expanded:
+                    closure[node] = frozenset(
+                        {node}.union(*(closure.get(child, ()) for child in children))
+                    )
+                    continue
+                visiting.add(node)
+                stack.append((node, True))
+                stack.extend(
+                    (child, False)
+                    for child in children
+                    if child not in closure and child not in visiting
+                )
+        return closure
+
+    def descendants(self, category_ids: Iterable[int]) -> set[int]:
+        """The categories and all their descendants"""
+        result = set()
+        for id in category_ids:
+            result |= self.closure.get(id, {id})
+        return result
+
+    @cached_property
+    def parents(self) -> dict[int, int | None]:
+        return {id: parent_id for id, parent_id, *_ in self.rows}
+
+    @cached_property
+    def ids_by_slug(self) -> dict[str, int]:
+        return {slug: id for id, *_, slug in self.rows}
+
+    def ancestors(self, category_id: int | None) -> set[int]:
+        """
+        The category and every category above it: those whose descendants
+        include it. Empty for an inactive category, which none of them do.
+        """
+        result = set()
+        while category_id in self.parents and category_id not in result:
+            result.add(category_id)
+            category_id = self.parents[category_id]
+        return result
+
+    @cached_property
+    def nested(self) -> list[dict]:
+        """The whole tree from its roots, built once per version"""
+        nodes = {
+            id: {"public_id": public_id, "name": name, "slug": slug, "children": []}
+            for id, _, public_id, name, slug in self.rows
+        }
+        roots = []
+        for id, parent_id, *_ in self.rows:
+            if parent_id is None:
+                roots.append(nodes[id])
+            elif parent_id in nodes:
+                nodes[parent_id]["children"].append(nodes[id])
+        return roots
+
+
+_tree: CategoryTree | None = None
+
+
+async def load_category_rows(db: AsyncSession) -> list[tuple]:
+    rows = await db.execute(
+        select(
+            Category.id,
+            Category.parent_id,
+            Category.public_id,
+            Category.name,
+            Category.slug,
+        )
+        .filter(Category.is_active)
+        .order_by(Category.name, Category.id)
+    )
+    return [tuple(row) for row in rows]
+
+
+async def get_category_tree(db: AsyncSession) -> CategoryTree:
+    """
+    The current tree: this worker's copy while its version is current, else
+    the index stored in Redis, else a fresh build from the database.
+    """
+    global _tree
+    redis = database.redis_pool
+    version = int(await redis.get(CATEGORY_INDEX_VERSION_KEY) or 0)
+    if _tree is not None and _tree.version == version:
+        return _tree
+
+    key = category_index_key(version)
+    data = await redis.get(key)
+    if data is not None:
+        rows = json.loads(data)
+    else:
+        rows = await load_category_rows(db)
+        await redis.set(key, json.dumps(rows), ex=CATEGORY_INDEX_TTL)
+    _tree = CategoryTree(rows, version)
+    return _tree
+
+
+def collect_category_changes(session: Session, _flush_context: object) -> None:
+    """after_flush: note whether any category was added, changed or removed"""
+    if any(
+        isinstance(obj, Category)
+        for obj in (*session.new, *session.deleted, *session.dirty)
+    ):
+        session.info["category_tree_changed"] = True
+
+
+def apply_category_changes(session: Session) -> None:
+    """after_commit: retire the current index so every worker rebuilds it"""
+    if session.info.pop("category_tree_changed", False):
+        run_after_commit(lambda redis: redis.incr(CATEGORY_INDEX_VERSION_KEY))
+
+
+def discard_category_changes(session: Session) -> None:
+    """after_rollback: nothing was persisted"""
+    session.info.pop("category_tree_changed", None)
+
+
+def register_category_tree_tracking() -> None:
+    """Rebuild the category index whenever a session commits category changes"""
+    for name, listener in (
+        ("after_flush", collect_category_changes),
+        ("after_commit", apply_category_changes),
+        ("after_rollback", discard_category_changes),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
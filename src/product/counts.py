@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from redis.asyncio import Redis
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlmodel import func
+
+from src import database
+from src.config import settings
+from src.database import AsyncSessionLocal, run_after_commit
+from src.product.enums import ProductStatus
+from src.product.models import Product
+
+logger = logging.getLogger(__name__)
+
+# Product totals, one hash field per counter (see `product_counters`), so a
+# listing miss reads its total from Redis instead of running COUNT(*).
+PRODUCT_COUNTS_KEY = "counts:products"
+REFRESHED_AT = "refreshed_at"
+COUNTED_FIELDS = ("status", "stock_status", "is_active")
+
+# Apply deltas only to a hash that exists: a missing one is rebuilt from the
+# database on the next read, and increments would make it look complete.
+INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def product_counters(
+    status: ProductStatus | None, stock_status: str | None, is_active: bool | None
+) -> list[str]:
+    """Counters a product with these values adds one to"""
+    counters = []
+    if status == ProductStatus.PUBLISHED:
+        counters.append("published")  # the public listing, active or not
+    if is_active:
+        counters += ["active", f"active:{status}", f"active:{stock_status}"]
+    return counters
+
+
+def counted_values(product: Product, before: bool) -> list:
+    """Counted column values before or after the pending flush"""
+    values = []
+    for field in COUNTED_FIELDS:
+        history = inspect(product).attrs[field].history
+        changes = history.deleted if before else history.added
+        current = changes or history.unchanged
+        values.append(current[0] if current else None)
+    return values
+
+
+async def refresh_product_counts(redis: Redis, db: AsyncSession) -> Counter:
+    """Recount every counter with one grouped query and replace the hash"""
+    rows = await db.execute(
+        select(
+            Product.status, Product.stock_status, Product.is_active, func.count()
+        ).group_by(Product.status, Product.stock_status, Product.is_active)
+    )
+    counts = Counter()
+    for status, stock_status, is_active, total in rows:
+        for counter in product_counters(status, stock_status, is_active):
+            counts[counter] += total
+
+    pipe = redis.pipeline(transaction=True)
+    pipe.delete(PRODUCT_COUNTS_KEY)
+    pipe.hset(PRODUCT_COUNTS_KEY, mapping={**counts, REFRESHED_AT: int(time.time())})
+    if settings.PRODUCT_COUNTS_REFRESH_INTERVAL:
+        # Outlive a missed refresh or two, not a stopped refresher
+        pipe.expire(PRODUCT_COUNTS_KEY, settings.PRODUCT_COUNTS_REFRESH_INTERVAL * 3)
+    await pipe.execute()
+    return counts
+
+
+async def get_product_counts(db: AsyncSession) -> Counter:
+    """Current product counters; missing ones are zero"""
+    values = await database.redis_pool.hgetall(PRODUCT_COUNTS_KEY)
+    if not values:
+        return await refresh_product_counts(database.redis_pool, db)
+    return Counter(
+        {
+            field.decode(): int(value)
+            for field, value in values.items()
+            if field.decode() != REFRESHED_AT
+        }
+    )
+
+
+async def refresh_product_counts_periodically(redis: Redis, interval: int) -> None:
+    """
+    Recount on a timer for the life of the app, correcting any drift from
+    increments lost to a Redis hiccup or raced by a concurrent refresh.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await refresh_product_counts(redis, db)
+        except Exception:
+            logger.exception("Product count refresh failed")
+
+
+def collect_count_changes(session: Session, _flush_context: object) -> None:
+    """after_flush: turn flushed product changes into counter deltas"""
+    deltas = session.info.setdefault("count_deltas", Counter())
+    for obj in session.new:
+        if isinstance(obj, Product):
+            deltas.update(product_counters(*counted_values(obj, before=False)))
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            deltas.subtract(product_counters(*counted_values(obj, before=True)))
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj):
+            deltas.subtract(product_counters(*counted_values(obj, before=True)))
+            deltas.update(product_counters(*counted_values(obj, before=False)))
+
+
+def apply_count_changes(session: Session) -> None:
+    """after_commit: add the collected deltas to the counters in Redis"""
+    deltas = session.info.pop("count_deltas", None) or {}
+    args = [item for field, delta in deltas.items() if delta for item in (field, delta)]
+    if args:
+        run_after_commit(
+            lambda redis: redis.eval(INCREMENT_SCRIPT, 1, PRODUCT_COUNTS_KEY, *args)
+        )
+
+
+def discard_count_changes(session: Session) -> None:
+    """after_rollback: nothing was persisted"""
+    session.info.pop("count_deltas", None)
+
+
+def register_count_tracking() -> None:
+    """Keep the product counters current as sessions commit product changes"""
+    for name, listener in (
+        ("after_flush", collect_count_changes),
+        ("after_commit", apply_count_changes),
+        ("after_rollback", discard_count_changes),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
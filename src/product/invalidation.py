@@ -0,0 +1,122 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from src.cache.tags import PRODUCT_LIST_TAG, PRODUCT_SEARCH_TAG, invalidate_tags, tag
+from src.database import run_after_commit
+from src.product.associations import ProductTagLink
+from src.product.models import (
+    Attribute,
+    AttributeVariant,
+    Brand,
+    Category,
+    Product,
+    ProductVariant,
+    Tag,
+)
+
+# Product columns that decide whether (and where) a product shows up in
+# listings and search results, as opposed to only what it looks like there.
+PRODUCT_MEMBERSHIP_FIELDS = (
+    "name",
+    "slug",
+    "product_no",
+    "status",
+    "is_active",
+    "brand_id",
+    "category_id",
+)
+# Product columns that decide its place in the category top products
+PRODUCT_RANKING_FIELDS = ("rating", "total_sold", "status", "is_active", "category_id")
+SEARCHABLE_NAME_FIELDS = ("name", "is_active")
+
+
+def changed(obj: object, fields: tuple[str, ...]) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[field].history.has_changes() for field in fields)
+
+
+def values(obj: object, field: str) -> set:
+    """Current and pre-flush values of a column, so moves invalidate both ends"""
+    history = inspect(obj).attrs[field].history
+    return {
+        value
+        for value in (*history.added, *history.unchanged, *history.deleted)
+        if value is not None
+    }
+
+
+def product_tags(product: Product, is_new_or_deleted: bool) -> set[str]:
+    tags = {tag("product", product.id)}
+    if is_new_or_deleted or changed(product, PRODUCT_MEMBERSHIP_FIELDS):
+        tags |= {PRODUCT_LIST_TAG, PRODUCT_SEARCH_TAG}
+    elif changed(product, ("tags",)):
+        tags.add(PRODUCT_SEARCH_TAG)
+    if is_new_or_deleted or changed(product, PRODUCT_RANKING_FIELDS):
+        tags |= {tag("category", id) for id in values(product, "category_id")}
+    return tags
+
+
+def category_tags(category: Category, is_new_or_deleted: bool) -> set[str]:
+    tags = {tag("category", category.id)}
+    tags |= {tag("category", id) for id in values(category, "parent_id")}
+    if is_new_or_deleted or changed(category, SEARCHABLE_NAME_FIELDS):
+        tags.add(PRODUCT_SEARCH_TAG)
+    return tags
+
+
+def tags_for(obj: object, is_new_or_deleted: bool) -> set[str]:
+    """Cache tags affected by a change to `obj`"""
+    match obj:
+        case Product():
+            return product_tags(obj, is_new_or_deleted)
+        case ProductVariant():
+            return {tag("product", id) for id in values(obj, "product_id")}
+        case Category():
+            return category_tags(obj, is_new_or_deleted)
+        case Brand():
+            tags = {tag("brand", obj.id)}
+            if is_new_or_deleted or changed(obj, SEARCHABLE_NAME_FIELDS):
+                tags.add(PRODUCT_SEARCH_TAG)
+            return tags
+        case Tag() | ProductTagLink():
+            return {PRODUCT_SEARCH_TAG}
+        case Attribute():
+            return {tag("attribute", obj.id)}
+        case AttributeVariant():
+            return {tag("attribute", id) for id in values(obj, "attribute_id")}
+    return set()
+
+
+def collect_invalidations(session: Session, _flush_context: object) -> None:
+    """after_flush: note which tags the flushed changes touch"""
+    tags = session.info.setdefault("cache_tags", set())
+    for obj in session.new:
+        tags |= tags_for(obj, is_new_or_deleted=True)
+    for obj in session.deleted:
+        tags |= tags_for(obj, is_new_or_deleted=True)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            tags |= tags_for(obj, is_new_or_deleted=False)
+
+
+def apply_invalidations(session: Session) -> None:
+    """after_commit: drop every cache key filed under the collected tags"""
+    tags = session.info.pop("cache_tags", None)
+    if tags:
+        run_after_commit(lambda redis: invalidate_tags(redis, tags))
+
+
+def discard_invalidations(session: Session) -> None:
+    """after_rollback: nothing was persisted, keep the cache as is"""
+    session.info.pop("cache_tags", None)
+
+
+def register_cache_invalidation() -> None:
+    """Invalidate cached product data whenever a session commits model changes"""
+    for name, listener in (
+        ("after_flush", collect_invalidations),
+        ("after_commit", apply_invalidations),
+        ("after_rollback", discard_invalidations),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+
+from redis.asyncio import Redis
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import database
+from src.cache.tags import invalidate_tags, tag
+from src.config import settings
+from src.database import AsyncSessionLocal, get_sync_redis, run_after_commit
+from src.product.category_tree import CategoryTree, get_category_tree
+from src.product.enums import ProductStatus
+from src.product.invalidation import PRODUCT_RANKING_FIELDS, changed
+from src.product.models import Product
+
+logger = logging.getLogger(__name__)
+
+# Per-category top products: leaderboard:<v>:<category id>:<ranking> scores
+# every published product of the category and its descendants by that
+# column, and leaderboard:<v>:product:<id> lists the categories a product is
+# posted under, to unpost it later. <v> is the category tree version the
+# boards were built for; a reparented category retires them all, and
+# leaderboard:ready names the version that is complete. Model hooks queue
+# changed products in leaderboard:dirty for a background task to apply.
+LEADERBOARD_DIRTY_KEY = "leaderboard:dirty"
+LEADERBOARD_READY_KEY = "leaderboard:ready"
+LEADERBOARD_REBUILD_LOCK_KEY = "leaderboard:rebuild:lock"
+RANKINGS = ("rating", "total_sold")
+
+
+def board_key(version: int, category_id: int, ranking: str) -> str:
+    return f"leaderboard:{version}:{category_id}:{ranking}"
+
+
+def posted_key(version: int, product_id: int) -> str:
+    return f"leaderboard:{version}:product:{product_id}"
+
+
+async def post_products(
+    redis: Redis, db: AsyncSession, tree: CategoryTree, ids: list[int]
+) -> set[int]:
+    """
+    Bring the boards of `ids` in line with the database, in two round trips.
+    Returns the categories whose boards changed.
+    """
+    rows = await db.execute(
+        select(
+            Product.id, Product.category_id, Product.rating, Product.total_sold
+        ).filter(Product.id.in_(ids), Product.status == ProductStatus.PUBLISHED)
+    )
+    products = {id: values for id, *values in rows}
+    pipe = redis.pipeline(transaction=False)
+    for id in ids:
+        pipe.smembers(posted_key(tree.version, id))
+    posted = await pipe.execute()
+
+    touched = set()
+    pipe = redis.pipeline(transaction=False)
+    for id, previous in zip(ids, posted):
+        previous = {int(category_id) for category_id in previous}
+        category_id, rating, total_sold = products.get(id, (None, 0, 0))
+        current = tree.ancestors(category_id)
+        for category_id in previous - current:
+            for ranking in RANKINGS:
+                pipe.zrem(board_key(tree.version, category_id, ranking), id)
+        for category_id in current:
+            pipe.zadd(
+                board_key(tree.version, category_id, "rating"), {id: float(rating)}
+            )
+            pipe.zadd(
+                board_key(tree.version, category_id, "total_sold"), {id: total_sold}
+            )
+        pipe.delete(posted_key(tree.version, id))
+        if current:
+            pipe.sadd(posted_key(tree.version, id), *current)
+        touched |= previous | current
+    await pipe.execute()
+    return touched
+
+
+async def batched_keys(
+    redis: Redis, pattern: str, size: int = 500
+) -> AsyncIterator[list[bytes]]:
+    batch = []
+    async for key in redis.scan_iter(match=pattern, count=size):
+        batch.append(key)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def rebuild_leaderboards(redis: Redis, db: AsyncSession) -> None:
+    """
+    Post every published product for the current tree, then retire the
+    boards of older versions; one worker builds, the others skip.
+    """
+    if not await redis.set(LEADERBOARD_REBUILD_LOCK_KEY, 1, nx=True, ex=600):
+        return
+    try:
+        tree = await get_category_tree(db)
+        last_id = 0
+        while ids := list(
+            await db.scalars(
+                select(Product.id)
+                .filter(Product.id > last_id, Product.status == ProductStatus.PUBLISHED)
+                .order_by(Product.id)
+                .limit(settings.LEADERBOARD_BATCH_SIZE)
+            )
+        ):
+            await post_products(redis, db, tree, ids)
+            last_id = ids[-1]
+        previous = await redis.set(LEADERBOARD_READY_KEY, tree.version, get=True)
+        if previous is not None and int(previous) != tree.version:
+            async for keys in batched_keys(redis, f"leaderboard:{int(previous)}:*"):
+                await redis.delete(*keys)
+        logger.info("Category leaderboards built")
+    finally:
+        await redis.delete(LEADERBOARD_REBUILD_LOCK_KEY)
+
+
+async def sync_leaderboards(redis: Redis, db: AsyncSession) -> set[int]:
+    """Apply one batch of queued changes; returns the categories it touched"""
+    ids = await redis.spop(LEADERBOARD_DIRTY_KEY, settings.LEADERBOARD_BATCH_SIZE)
+    if not ids:
+        return set()
+    try:
+        tree = await get_category_tree(db)
+        return await post_products(redis, db, tree, sorted(int(id) for id in ids))
+    except Exception:
+        await redis.sadd(LEADERBOARD_DIRTY_KEY, *ids)  # retried on the next round
+        raise
+
+
+async def maintain_leaderboards(redis: Redis, interval: float) -> None:
+    """
+    Rebuild the boards when the category tree moved past them and apply
+    queued changes, for the life of the app. Cached top products of the
+    categories a change touched are dropped once it is applied.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                ready = await redis.get(LEADERBOARD_READY_KEY)
+                tree = await get_category_tree(db)
+                if ready is None or int(ready) != tree.version:
+                    await rebuild_leaderboards(redis, db)
+                if touched := await sync_leaderboards(redis, db):
+                    await asyncio.to_thread(
+                        invalidate_tags,
+                        get_sync_redis(),
+                        [tag("category", id) for id in touched],
+                    )
+        except Exception:
+            logger.exception("Leaderboard sync failed")
+        await asyncio.sleep(interval)
+
+
+async def top_products(
+    tree: CategoryTree, category_id: int, limit: int
+) -> tuple[list[int], list[int]] | None:
+    """
+    Ids of the `limit` top-rated and top-sold products of a category and its
+    descendants, best first. None when the boards cannot answer: they are
+    disabled, or not built for this version of the tree yet.
+    """
+    if not settings.LEADERBOARDS_ENABLED:
+        return None
+    pipe = database.redis_pool.pipeline(transaction=False)
+    pipe.get(LEADERBOARD_READY_KEY)
+    for ranking in RANKINGS:
+        pipe.zrevrange(board_key(tree.version, category_id, ranking), 0, limit - 1)
+    ready, top_rated, top_sold = await pipe.execute()
+    if ready is None or int(ready) != tree.version:
+        return None
+    return [int(id) for id in top_rated], [int(id) for id in top_sold]
+
+
+def collect_leaderboard_changes(session: Session, _flush_context: object) -> None:
+    """after_flush: note which products may have moved on a board"""
+    ids = session.info.setdefault("leaderboard_products", set())
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, Product):
+            ids.add(obj.id)
+    for obj in session.dirty:
+        if (
+            isinstance(obj, Product)
+            and session.is_modified(obj)
+            and changed(obj, PRODUCT_RANKING_FIELDS)
+        ):
+            ids.add(obj.id)
+
+
+def apply_leaderboard_changes(session: Session) -> None:
+    """after_commit: queue the products for the leaderboard maintainer"""
+    ids = session.info.pop("leaderboard_products", None)
+    if ids:
+        run_after_commit(lambda redis: redis.sadd(LEADERBOARD_DIRTY_KEY, *ids))
+
+
+def discard_leaderboard_changes(session: Session) -> None:
+    """after_rollback: nothing was persisted"""
+    session.info.pop("leaderboard_products", None)
+
+
+def register_leaderboard_tracking() -> None:
+    """Queue leaderboard updates whenever a session commits ranking changes"""
+    for name, listener in (
+        ("after_flush", collect_leaderboard_changes),
+        ("after_commit", apply_leaderboard_changes),
+        ("after_rollback", discard_leaderboard_changes),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
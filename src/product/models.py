@@ -3,7 +3,7 @@ from decimal import Decimal
 from typing import TYPE_CHECKING, Optional
 
 import sqlalchemy as sa
-from sqlmodel import Field, Relationship
+from sqlmodel import Field, Relationship, SQLModel
 
 from src.common.models import CommonFieldMixin
 
@@ -51,6 +51,9 @@ class Tag(CommonFieldMixin, table=True):
 
 
 class Product(CommonFieldMixin, table=True):
+    # Listing order, also used for keyset pagination
+    __table_args__ = (sa.Index("product_name_id_idx", "name", "id"),)
+
     name: str
     slug: str = Field(sa_column=sa.Column(sa.String, unique=True, nullable=False))
     product_no: str = Field(sa_column=sa.Column(sa.String, unique=True, nullable=False))
@@ -64,7 +67,7 @@ class Product(CommonFieldMixin, table=True):
     )
     stock_management: bool = Field(default=False, nullable=False)
 
-    # TODO: set this values by running cron
+    # Kept current by the worker from reviews and orders (see aggregates.py)
     rating: Decimal = Field(
         sa_column=sa.Column(
             sa.Numeric(precision=3, scale=2), nullable=False, default=0
@@ -176,6 +179,37 @@ class ProductVariant(CommonFieldMixin, table=True):
         return self.discount_price if has_valid_dates else self.regular_price
 
 
+class ProductPriceStats(SQLModel, table=True):
+    """
+    Price range and best discount over a product's variants, kept current by
+    src/product/price_stats.py so listings join one row per product instead
+    of aggregating every variant.
+    """
+
+    product_id: int = Field(
+        sa_column=sa.Column(
+            sa.Integer,
+            sa.ForeignKey("product.id", ondelete="CASCADE"),
+            primary_key=True,
+        )
+    )
+    regular_price_min: Decimal | None = Field(
+        sa_column=sa.Column(sa.Numeric(precision=10, scale=2), nullable=True),
+    )
+    regular_price_max: Decimal | None = Field(
+        sa_column=sa.Column(sa.Numeric(precision=10, scale=2), nullable=True),
+    )
+    discount_price_min: Decimal | None = Field(
+        sa_column=sa.Column(sa.Numeric(precision=10, scale=2), nullable=True),
+    )
+    discount_price_max: Decimal | None = Field(
+        sa_column=sa.Column(sa.Numeric(precision=10, scale=2), nullable=True),
+    )
+    max_discount_percentage: Decimal | None = Field(
+        sa_column=sa.Column(sa.Numeric, nullable=True),
+    )
+
+
 class Category(CommonFieldMixin, table=True):
     name: str = Field(nullable=False)
     slug: str = Field(sa_column=sa.Column(sa.String, unique=True, nullable=False))
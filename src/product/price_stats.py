@@ -0,0 +1,106 @@
+from collections.abc import Iterable
+
+from sqlalchemy import Connection, Select, delete, event, exists, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlmodel import case, func
+
+from src.database import engine
+from src.product.invalidation import values
+from src.product.models import ProductPriceStats, ProductVariant
+
+# Stored per product in ProductPriceStats, in this order; products_query
+# joins the row instead of grouping every variant on each listing.
+STATS_COLUMNS = (
+    "regular_price_min",
+    "regular_price_max",
+    "discount_price_min",
+    "discount_price_max",
+    "max_discount_percentage",
+)
+
+
+def variant_stats_query(product_ids: Iterable[int] | None = None) -> Select:
+    """Stats of the given products (all when None), straight from their variants"""
+    # Zero prices are unset, as the product page always treated them
+    regular_price = func.nullif(ProductVariant.regular_price, 0)
+    discount_price = func.nullif(ProductVariant.discount_price, 0)
+    query = select(
+        ProductVariant.product_id,
+        func.min(regular_price),
+        func.max(regular_price),
+        func.min(discount_price),
+        func.max(discount_price),
+        func.max(
+            case(
+                (
+                    ProductVariant.regular_price > 0,
+                    (
+                        (ProductVariant.regular_price - ProductVariant.discount_price)
+                        / ProductVariant.regular_price
+                    )
+                    * 100,
+                ),
+                else_=None,
+            )
+        ),
+    ).filter(ProductVariant.product_id.is_not(None))
+    if product_ids is not None:
+        query = query.filter(ProductVariant.product_id.in_(product_ids))
+    return query.group_by(ProductVariant.product_id)
+
+
+def refresh_price_stats(
+    connection: Connection, product_ids: Iterable[int] | None = None
+) -> None:
+    """Recompute the stored stats of the given products (all when None)"""
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+    upsert = insert(ProductPriceStats).from_select(
+        ["product_id", *STATS_COLUMNS], variant_stats_query(product_ids)
+    )
+    connection.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[ProductPriceStats.product_id],
+            set_={column: upsert.excluded[column] for column in STATS_COLUMNS},
+        )
+    )
+    # Products left without variants keep no stats, as with the old outer join
+    stale = delete(ProductPriceStats).where(
+        ~exists().where(ProductVariant.product_id == ProductPriceStats.product_id)
+    )
+    if product_ids is not None:
+        stale = stale.where(ProductPriceStats.product_id.in_(product_ids))
+    connection.execute(stale)
+
+
+def update_price_stats(session: Session, _flush_context: object) -> None:
+    """
+    after_flush: recompute the stats of every product whose variants the
+    flush added, changed, moved or removed, in the same transaction, so
+    they commit or roll back with the change.
+    """
+    product_ids = set()
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, ProductVariant):
+            product_ids |= values(obj, "product_id")
+    for obj in session.dirty:
+        if isinstance(obj, ProductVariant) and session.is_modified(obj):
+            product_ids |= values(obj, "product_id")
+    if product_ids:
+        refresh_price_stats(session.connection(), sorted(product_ids))
+
+
+def register_price_stats_tracking() -> None:
+    """Keep ProductPriceStats current as sessions flush variant changes"""
+    if not event.contains(Session, "after_flush", update_price_stats):
+        event.listen(Session, "after_flush", update_price_stats)
+
+
+if __name__ == "__main__":
+    # Backfill: python -m src.product.price_stats
+    with engine.begin() as connection:
+        refresh_price_stats(connection)
+    print("Product price stats refreshed")
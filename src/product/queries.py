@@ -1,11 +1,32 @@
-from sqlalchemy import Subquery, or_
-from sqlalchemy.orm import Query, joinedload, load_only, selectinload
-from sqlmodel import Session, case, func, select
-from src.common.filters import PaginationParams
+import json
+from collections.abc import Iterable
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    Text,
+    cast,
+    literal,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload, load_only, selectinload
+from sqlmodel import func
+from src.cache.tags import add_tags, tag
+from src.common.filters import PaginationParams, decode_cursor, encode_cursor
 from src.common.models import Media
+from src.config import settings
 
 
-from .associations import ProductTagLink
+from . import leaderboards
+from .associations import ProductTagLink, ProductVariantAttributeVariantLink
+from .category_tree import get_category_tree
+from .counts import get_product_counts
 from .enums import ProductStatus, StockStatus
 from .models import (
     Attribute,
@@ -13,18 +34,61 @@ from .models import (
     Brand,
     Category,
     Product,
+    ProductPriceStats,
     ProductVariant,
     Tag,
 )
+from .price_stats import STATS_COLUMNS
 from .utlis import get_category_and_descendants
 
 
-def get_products_with_relationships(  # noqa: C901
-    db: Session,
+async def count_rows(db: AsyncSession, query: Select) -> int:
+    return await db.scalar(
+        select(func.count()).select_from(query.order_by(None).subquery())
+    )
+
+
+async def estimate_rows(db: AsyncSession, query: Select) -> int | None:
+    """The planner's row estimate for `query`; PostgreSQL only"""
+    dialect = db.get_bind().dialect
+    if dialect.name != "postgresql":
+        return None
+    statement = query.order_by(None).compile(
+        dialect=dialect, compile_kwargs={"literal_binds": True}
+    )
+    connection = await db.connection()
+    plan = (
+        await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}")
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_or_estimate(db: AsyncSession, query: Select) -> int:
+    """
+    Exact count, unless the planner expects at least
+    PRODUCT_COUNT_ESTIMATE_THRESHOLD rows: then its estimate is close enough
+    and far cheaper than counting them.
+    """
+    threshold = settings.PRODUCT_COUNT_ESTIMATE_THRESHOLD
+    if threshold:
+        estimate = await estimate_rows(db, query)
+        if estimate is not None and estimate >= threshold:
+            return estimate
+    return await count_rows(db, query)
+
+
+async def fetch_rows(db: AsyncSession, query: Select) -> list:
+    return list((await db.execute(query)).all())
+
+
+async def get_products_with_relationships(  # noqa: C901
+    db: AsyncSession,
     pagination: PaginationParams | None = None,
 ) -> tuple[list[Product], dict]:
     query = (
-        db.query(Product)
+        select(Product)
         .options(
             joinedload(Product.category.and_(Category.is_active)).options(
                 load_only(Category.public_id, Category.name, Category.slug)
@@ -42,97 +106,161 @@ def get_products_with_relationships(  # noqa: C901
             )
             .selectinload(AttributeVariant.attribute.and_(Attribute.is_active))
         )
-        .options(joinedload(Product.attributes.and_(Attribute.is_active)))
-        .options(joinedload(Product.tags.and_(Tag.is_active)))
+        .options(selectinload(Product.attributes.and_(Attribute.is_active)))
+        .options(selectinload(Product.tags.and_(Tag.is_active)))
         .options(selectinload(Product.images.and_(Media.is_active)))
         .filter(Product.is_active)
         .order_by(Product.updated_at.desc())
     )
-    summary_query = query.order_by(None)
-    summary_result = summary_query.with_entities(
-        func.count(Product.id).label("total"),
-        func.sum(case((Product.status == ProductStatus.PUBLISHED, 1), else_=0)).label(
-            "published"
-        ),
-        func.sum(case((Product.status == ProductStatus.PENDING, 1), else_=0)).label(
-            "pending"
-        ),
-        func.sum(
-            case((Product.stock_status == StockStatus.IN_STOCK, 1), else_=0)
-        ).label("in_stock"),
-        func.sum(
-            case((Product.stock_status == StockStatus.OUT_OF_STOCK, 1), else_=0)
-        ).label("stock_out"),
-        func.sum(case((Product.status == ProductStatus.DRAFT, 1), else_=0)).label(
-            "draft"
-        ),
-    ).one()
+    if pagination:
+        query = query.offset(pagination.offset).limit(pagination.size)
+
+    counts = await get_product_counts(db)
+    products = list((await db.scalars(query)).unique().all())
 
     summary = {
-        "total": summary_result.total or 0,
-        "published": summary_result.published or 0,
-        "pending": summary_result.pending or 0,
-        "in_stock": summary_result.in_stock or 0,
-        "stock_out": summary_result.stock_out or 0,
-        "draft": summary_result.draft or 0,
+        "total": counts["active"],
+        "published": counts[f"active:{ProductStatus.PUBLISHED}"],
+        "pending": counts[f"active:{ProductStatus.PENDING}"],
+        "in_stock": counts[f"active:{StockStatus.IN_STOCK}"],
+        "stock_out": counts[f"active:{StockStatus.OUT_OF_STOCK}"],
+        "draft": counts[f"active:{ProductStatus.DRAFT}"],
     }
+    return products, summary
 
-    if pagination:
-        query = query.offset(pagination.offset).limit(pagination.size)
-    return query.all(), summary
 
+def json_list(query: Select, *order_by) -> ColumnElement:
+    """A correlated JSON array of `query`'s single json_build_object column"""
+    (row,) = query.selected_columns
+    return func.coalesce(
+        query.with_only_columns(
+            func.json_agg(aggregate_order_by(row, *order_by))
+        ).scalar_subquery(),
+        literal_column("'[]'::json"),
+    )
+
+
+def product_details_query(slugs: Iterable[str]) -> Select:
+    """
+    Product pages in one statement: each product with its brand, category
+    and stored price stats, and its variants and their attributes as JSON
+    arrays, rendered as text so prices parse back into Decimals.
+    """
+    attribute_variants = json_list(
+        select(
+            func.json_build_object(
+                "public_id",
+                AttributeVariant.public_id,
+                "name",
+                AttributeVariant.name,
+                "attribute",
+                func.json_build_object(
+                    "public_id", Attribute.public_id, "name", Attribute.name
+                ),
+            )
+        )
+        .join(
+            ProductVariantAttributeVariantLink,
+            ProductVariantAttributeVariantLink.attribute_variant_id
+            == AttributeVariant.id,
+        )
+        .join(Attribute, AttributeVariant.attribute_id == Attribute.id)
+        .filter(
+            ProductVariantAttributeVariantLink.product_variant_id == ProductVariant.id
+        ),
+        AttributeVariant.id,
+    )
+    variants = json_list(
+        select(
+            func.json_build_object(
+                "public_id",
+                ProductVariant.public_id,
+                "regular_price",
+                ProductVariant.regular_price,
+                "discount_price",
+                ProductVariant.discount_price,
+                "stock",
+                ProductVariant.stock,
+                "stock_status",
+                ProductVariant.stock_status,
+                "attribute_variants",
+                attribute_variants,
+            )
+        ).filter(ProductVariant.product_id == Product.id),
+        ProductVariant.id,
+    )
+
+    variant = aliased(ProductVariant)
+    used_attribute_ids = (
+        select(AttributeVariant.attribute_id)
+        .join(
+            ProductVariantAttributeVariantLink,
+            ProductVariantAttributeVariantLink.attribute_variant_id
+            == AttributeVariant.id,
+        )
+        .join(
+            variant, ProductVariantAttributeVariantLink.product_variant_id == variant.id
+        )
+        .filter(variant.product_id == Product.id)
+        .correlate(Product)
+    )
+    attribute_variant = aliased(AttributeVariant)
+    attributes = json_list(
+        select(
+            func.json_build_object(
+                "id",
+                Attribute.id,
+                "name",
+                Attribute.name,
+                "slug",
+                Attribute.slug,
+                "public_id",
+                Attribute.public_id,
+                "variants",
+                json_list(
+                    select(
+                        func.json_build_object(
+                            "public_id",
+                            attribute_variant.public_id,
+                            "name",
+                            attribute_variant.name,
+                        )
+                    ).filter(attribute_variant.attribute_id == Attribute.id),
+                    attribute_variant.id,
+                ),
+            )
+        ).filter(Attribute.id.in_(used_attribute_ids)),
+        Attribute.name,
+    )
 
-def get_product_with_product_variants_and_images(db: Session, slug: str) -> Product:
     return (
-        db.query(Product)
-        .options(
-            selectinload(Product.variants).selectinload(
-                ProductVariant.attribute_variants
-            ),
-            selectinload(Product.images),
-            selectinload(Product.brand),
+        select(
+            Product,
+            Brand.name.label("brand_name"),
+            Brand.slug.label("brand_slug"),
+            Category.name.label("category_name"),
+            Category.slug.label("category_slug"),
+            *(getattr(ProductPriceStats, column) for column in STATS_COLUMNS),
+            cast(variants, Text).label("variants"),
+            cast(attributes, Text).label("attributes"),
         )
+        .outerjoin(Brand, Product.brand_id == Brand.id)
+        .outerjoin(Category, Product.category_id == Category.id)
+        .outerjoin(ProductPriceStats, Product.id == ProductPriceStats.product_id)
         .filter(
             Product.is_active,
-            Product.slug == slug,
+            Product.slug.in_(slugs),
             Product.status == ProductStatus.PUBLISHED,
         )
         .order_by(Product.name)
-        .first()
     )
 
 
-def get_variant_stats_subquery(db: Session) -> Subquery:
-    return (
-        db.query(
-            ProductVariant.product_id,
-            func.min(ProductVariant.regular_price).label("regular_price_min"),
-            func.max(ProductVariant.regular_price).label("regular_price_max"),
-            func.min(ProductVariant.discount_price).label("discount_price_min"),
-            func.max(ProductVariant.discount_price).label("discount_price_max"),
-            func.max(
-                case(
-                    (
-                        ProductVariant.regular_price > 0,
-                        (
-                            (
-                                ProductVariant.regular_price
-                                - ProductVariant.discount_price
-                            )
-                            / ProductVariant.regular_price
-                        )
-                        * 100,
-                    ),
-                    else_=None,
-                )
-            ).label("max_discount_percentage"),
-        )
-        .group_by(ProductVariant.product_id)
-        .subquery()
-    )
+def product_detail_query(slug: str) -> Select:
+    return product_details_query([slug]).limit(1)
 
 
-def get_tag_subquery(search_pattern: str) -> Subquery:
+def get_tag_subquery(search_pattern: str) -> Select:
     return (
         select(ProductTagLink.product_id)
         .join(Tag, ProductTagLink.tag_id == Tag.id)
@@ -140,25 +268,45 @@ def get_tag_subquery(search_pattern: str) -> Subquery:
     )
 
 
-def products_query(db: Session) -> Query:
-    variant_stats = get_variant_stats_subquery(db)
+def products_query() -> Select:
     return (
-        (
-            db.query(Product, variant_stats).outerjoin(
-                variant_stats, Product.id == variant_stats.c.product_id
-            )
+        select(
+            Product,
+            ProductPriceStats.product_id,
+            *(getattr(ProductPriceStats, column) for column in STATS_COLUMNS),
         )
+        .outerjoin(ProductPriceStats, Product.id == ProductPriceStats.product_id)
         .filter(Product.status == ProductStatus.PUBLISHED)
         .options(selectinload(Product.images))
-        .order_by(Product.name)
+        .order_by(Product.name, Product.id)
     )
 
 
-def get_products_by_search(
-    db: Session,
-    search: str,
-) -> Query:
-    query = products_query(db)
+def paginate_products(query: Select, pagination: PaginationParams) -> Select:
+    """
+    Page through a products_query. With a cursor, seek past the last
+    (name, id) seen instead of counting rows with OFFSET, so every page costs
+    the same. One extra row is fetched to tell whether another page follows.
+    """
+    if pagination.cursor:
+        name, id = decode_cursor(pagination.cursor, str, int)
+        query = query.filter(tuple_(Product.name, Product.id) > tuple_(name, id))
+    else:
+        query = query.offset(pagination.offset)
+    return query.limit(pagination.size + 1)
+
+
+def split_page(rows: list, pagination: PaginationParams) -> tuple[list, str | None]:
+    """Drop the look-ahead row of `paginate_products`, turning it into a cursor"""
+    if len(rows) <= pagination.size:
+        return rows, None
+    rows = rows[: pagination.size]
+    last = rows[-1][0]
+    return rows, encode_cursor(last.name, last.id)
+
+
+def get_products_by_search(search: str) -> Select:
+    query = products_query()
     search_pattern = f"%{search}%"
 
     tag_subquery = get_tag_subquery(search_pattern)
@@ -180,27 +328,65 @@ def get_products_by_search(
     return query
 
 
-def get_products_base_query(db: Session) -> tuple[Query, int]:
-    query = products_query(db)
-    total_counts = query.count()
-    return query, total_counts
+def get_products_base_query() -> Select:
+    return products_query()
+
+
+async def get_category_base_query(db: AsyncSession, slug: str) -> Select:
+    query = products_query()
+    category_id = await db.scalar(select(Category.id).filter(Category.slug == slug))
+    all_descendents = await get_category_and_descendants(
+        db, [category_id] if category_id else []
+    )
+    add_tags(*(tag("category", id) for id in all_descendents))
+    return query.filter(Product.category_id.in_(all_descendents))
 
 
-def get_category_base_query(db: Session, slug: str) -> tuple[Query, int]:
-    query = products_query(db)
-    category_id = db.query(Category.id).filter(Category.slug == slug).first()
-    all_descendents = get_category_and_descendants(db, category_id)
-    query = query.filter(Product.category_id.in_(all_descendents))
-    total_counts = query.count()
-    return query, total_counts
+async def fetch_ranked_rows(db: AsyncSession, *rankings: list[int]) -> tuple[list, ...]:
+    """products_query rows for ranked ids, in one query, each list in rank order"""
+    ids = {id for ranking in rankings for id in ranking}
+    rows = await fetch_rows(db, products_query().filter(Product.id.in_(ids)))
+    by_id = {row[0].id: row for row in rows}
+    return tuple([by_id[id] for id in ranking if id in by_id] for ranking in rankings)
 
 
-def get_category_top_rated_and_top_sold_products_query(
-    db: Session, slug: str
+def top_products_query(base_query: Select, limit: int) -> Select:
+    """
+    (ranking, id) of the top rated and the top sold products of base_query
+    in one statement, each ranking in order; ranking is the column name
+    """
+    rankings = []
+    for column in (Product.rating, Product.total_sold):
+        order = (column.desc(), Product.id)
+        ranked = (
+            base_query.with_only_columns(
+                Product.id, func.row_number().over(order_by=order).label("position")
+            )
+            .order_by(None)
+            .order_by(*order)
+            .limit(limit)
+            .subquery()
+        )
+        rankings.append(
+            select(literal(column.key).label("ranking"), ranked.c.id, ranked.c.position)
+        )
+    top = union_all(*rankings).subquery()
+    return select(top.c.ranking, top.c.id).order_by(top.c.ranking, top.c.position)
+
+
+async def get_category_top_rated_and_top_sold_products_query(
+    db: AsyncSession, slug: str, limit: int
 ) -> tuple[list, list]:
-    base_query, total_counts = get_category_base_query(db, slug)
-    top_rated = (
-        base_query.order_by(Product.rating.desc()).limit(5).all()
-    )  # adjust with your requirements
-    top_sold = base_query.order_by(Product.total_sold.desc()).limit(5).all()
-    return top_rated, top_sold
+    tree = await get_category_tree(db)
+    category_id = tree.ids_by_slug.get(slug)
+    if category_id is not None:
+        ranked = await leaderboards.top_products(tree, category_id, limit)
+        if ranked is not None:
+            add_tags(*(tag("category", id) for id in tree.descendants([category_id])))
+            return await fetch_ranked_rows(db, *ranked)
+
+    base_query = await get_category_base_query(db, slug)
+    ranked = {"rating": [], "total_sold": []}
+    for ranking, id in await db.execute(top_products_query(base_query, limit)):
+        ranked[ranking].append(id)
+    return await fetch_ranked_rows(db, ranked["rating"], ranked["total_sold"])
@@ -1,15 +1,26 @@
-import json
 from typing import Annotated
-from fastapi import APIRouter, Depends
-from sqlmodel import Session
-import hashlib
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database import get_redis, get_db
+from src.cache import keys
+from src.cache.cache import (
+    BatchLoader,
+    Cache,
+    ResponseLoader,
+    get_cache,
+    response_data,
+    response_value,
+)
+from src.cache.keys import CacheKey, KeyFamily
+from src.cache.warming import record_access, register_warmer
+from src.common.exceptions import HTTP400
+from src.common.rate_limit import RateLimit
+from src.config import settings
+from src.database import get_async_db, get_redis
 from redis.asyncio import Redis
-from . import services
+from . import services, suggest
 from ..common.filters import PaginationParams, PaginationResponse
 from ..common.response import StandardResponse, create_response
-from ..common.utils import json_serializer
 
 router = APIRouter()
 
@@ -31,147 +42,231 @@ async def set_products(redis: Annotated[Redis, Depends(get_redis)], name: str):
 
 """The following APIs demonstrate how to implement production-level caching using Redis in FastAPI.
 You’ll see how product information is fetched efficiently from cache and how updated product details are
- refreshed automatically to ensure data consistency."""
+ refreshed automatically to ensure data consistency: every cached value is filed under the products,
+ categories, brands and attributes it was built from (see src/product/invalidation.py)."""
 
 
-@router.get("")
-async def get_products(
-    db: Annotated[Session, Depends(get_db)],
-    pagination: Annotated[PaginationParams, Depends(PaginationParams)],
-    redis: Annotated[Redis, Depends(get_redis)],
-) -> StandardResponse:
-    cache_key = f"products:page:{pagination.page}:size:{pagination.size}"
-    cached_data = await redis.get(cache_key)
-    if cached_data:
-        print("Calling from Redis - Products List")
-        cached_result = json.loads(cached_data)
-        response = cached_result["data"]
-        total_counts = cached_result["total"]
-
-        pagination_response = PaginationResponse(
-            page=pagination.page, size=pagination.size, total=total_counts
+def product_list_loader(pagination: PaginationParams) -> ResponseLoader:
+    async def load(db: AsyncSession) -> StandardResponse:
+        products, total_counts, next_cursor = await services.get_products(
+            db=db, pagination=pagination
         )
         return create_response(
-            data=response,
-            message="Returned products data successfully (from cache)",
-            pagination=pagination_response,
+            data=products,
+            message="Returned products data successfully",
+            pagination=PaginationResponse(
+                **pagination.model_dump(), total=total_counts, next_cursor=next_cursor
+            ),
         )
-    response, total_counts = services.get_products(db=db, pagination=pagination)
 
-    cache_payload = {"data": response, "total": total_counts}
+    return load
 
-    await redis.setex(
-        cache_key, 300, json.dumps(cache_payload, default=json_serializer)
-    )
 
-    pagination_response = PaginationResponse(
-        page=pagination.page, size=pagination.size, total=total_counts
-    )
-    return create_response(
-        data=response,
-        message="Returned products data successfully",
-        pagination=pagination_response,
+def product_response(product: dict) -> StandardResponse:
+    return create_response(product, message="Returned products data successfully")
+
+
+def product_loader(slug: str) -> ResponseLoader:
+    async def load(db: AsyncSession) -> StandardResponse:
+        return product_response(await services.get_product_by_slug(db=db, slug=slug))
+
+    return load
+
+
+def products_loader(slugs: list[str]) -> BatchLoader:
+    """/product/batch misses, stored as /product/{slug} would store them"""
+    slug_by_key = {keys.product_key(slug): slug for slug in slugs}
+
+    async def load(
+        db: AsyncSession, missing: list[CacheKey]
+    ) -> dict[CacheKey, tuple[StandardResponse | bytes, set[str]]]:
+        products = await services.get_products_by_slugs(
+            db, [slug_by_key[key] for key in missing]
+        )
+        loaded = {}
+        for key in missing:
+            if (found := products.get(slug_by_key[key])) is not None:
+                product, tags = found
+                loaded[key] = (response_value(key, product_response(product)), tags)
+        return loaded
+
+    return load
+
+
+def category_top_products_loader(slug: str, limit: int) -> ResponseLoader:
+    async def load(db: AsyncSession) -> StandardResponse:
+        return create_response(
+            await services.get_category_top_products(db, slug, limit),
+            message="Returned category top product data successfully",
+        )
+
+    return load
+
+
+def warm_product_list(member: str) -> tuple[CacheKey, ResponseLoader]:
+    page, size = member.split(":")
+    pagination = PaginationParams(page=int(page), size=int(size))
+    return keys.product_list_key(pagination), product_list_loader(pagination)
+
+
+def warm_category_top_products(member: str) -> tuple[CacheKey, ResponseLoader]:
+    limit, slug = member.split(":", 1)
+    return (
+        keys.category_top_products_key(slug, int(limit)),
+        category_top_products_loader(slug, int(limit)),
     )
 
 
-@router.get("/search")
-async def get_products_by_search(
-    db: Annotated[Session, Depends(get_db)],
-    search: str,
+# Popular pages are refilled after a deploy or flush (see src/cache/warming.py)
+register_warmer(KeyFamily.PRODUCT_LIST, warm_product_list)
+register_warmer(
+    KeyFamily.PRODUCT, lambda slug: (keys.product_key(slug), product_loader(slug))
+)
+register_warmer(KeyFamily.CATEGORY_TOP_PRODUCTS, warm_category_top_products)
+
+
+# Per-client budgets, per route: a generous one for the routes served from
+# the caches, so typeahead and page views never run into it, and a tight one
+# for search, whose every miss scans products
+rate_limit = RateLimit()
+search_rate_limit = RateLimit(
+    "search", settings.RATE_LIMIT_SEARCH_REQUESTS, settings.RATE_LIMIT_SEARCH_WINDOW
+)
+
+
+@router.get("", dependencies=[Depends(rate_limit)])
+async def get_products(
     pagination: Annotated[PaginationParams, Depends(PaginationParams)],
-    redis: Annotated[Redis, Depends(get_redis)],
+    cache: Annotated[Cache, Depends(get_cache)],
+    response: Response,
 ) -> StandardResponse:
-    search_hash = hashlib.md5(search.encode()).hexdigest()[:8]
-    cache_key = (
-        f"products:search:{search_hash}:page:{pagination.page}:size:{pagination.size}"
+    if not pagination.cursor:
+        record_access(KeyFamily.PRODUCT_LIST, f"{pagination.page}:{pagination.size}")
+    return await cache.get_or_set_response(
+        keys.product_list_key(pagination), product_list_loader(pagination), response
     )
-    cached_data = await redis.get(cache_key)
 
-    if cached_data:
-        print(f"Calling from Redis - Search: {search}")
-        cached_result = json.loads(cached_data)
-        response = cached_result["data"]
-        total_counts = cached_result["total"]
 
-        pagination_response = PaginationResponse(
-            page=pagination.page, size=pagination.size, total=total_counts
+@router.get("/search", dependencies=[Depends(search_rate_limit)])
+async def get_products_by_search(
+    search: str,
+    pagination: Annotated[PaginationParams, Depends(PaginationParams)],
+    cache: Annotated[Cache, Depends(get_cache)],
+    response: Response,
+) -> StandardResponse:
+    async def load(db: AsyncSession) -> StandardResponse:
+        (
+            products,
+            total_counts,
+            next_cursor,
+        ) = await services.get_products_by_search_with_filter(
+            db=db,
+            search=search,
+            pagination=pagination,
         )
         return create_response(
-            data=response,
-            message="Returned products data successfully (from cache)",
-            pagination=pagination_response,
+            data=products,
+            message="Returned products data successfully",
+            pagination=PaginationResponse(
+                **pagination.model_dump(), total=total_counts, next_cursor=next_cursor
+            ),
         )
 
-    print(f"Not Calling Redis - Search: {search}")
-    response, total_counts = services.get_products_by_search_with_filter(
-        db=db,
-        search=search,
-        pagination=pagination,
+    return await cache.get_or_set_response(
+        keys.product_search_key(search, pagination),
+        load,
+        response,
     )
-    cache_payload = {"data": response, "total": total_counts}
-    await redis.setex(
-        cache_key, 600, json.dumps(cache_payload, default=json_serializer)
+
+
+@router.get("/suggest", dependencies=[Depends(rate_limit)])
+async def get_suggestions(
+    search: Annotated[str, Query(min_length=1, max_length=100)],
+    limit: Annotated[
+        int, Query(ge=1, le=settings.SUGGEST_MAX_LIMIT)
+    ] = settings.SUGGEST_LIMIT,
+) -> StandardResponse[list]:
+    """Typeahead: product, brand, category and tag names, straight from Redis"""
+    return create_response(
+        data=await suggest.get_suggestions(search, limit),
+        message="Returned suggestions successfully",
     )
-    pagination_response = PaginationResponse(
-        page=pagination.page, size=pagination.size, total=total_counts
+
+
+@router.get("/batch", dependencies=[Depends(rate_limit)])
+async def get_products_batch(
+    slugs: Annotated[list[str], Query(min_length=1)],
+    cache: Annotated[Cache, Depends(get_cache)],
+    response: Response,
+) -> StandardResponse[list]:
+    """
+    Several product pages at once, in request order, null for unknown
+    slugs. Takes ?slugs=a&slugs=b or ?slugs=a,b; shares its cache entries
+    with /product/{slug}.
+    """
+    slugs = [slug for value in slugs for slug in value.split(",") if slug]
+    if not slugs or len(slugs) > settings.PRODUCT_BATCH_MAX_SLUGS:
+        raise HTTP400(
+            detail=f"Between 1 and {settings.PRODUCT_BATCH_MAX_SLUGS} slugs allowed"
+        )
+    for slug in slugs:
+        record_access(KeyFamily.PRODUCT, slug)
+    values, hit = await cache.get_many_or_set(
+        [keys.product_key(slug) for slug in slugs], products_loader(slugs)
     )
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
     return create_response(
-        data=response,
+        data=[None if value is None else response_data(value) for value in values],
         message="Returned products data successfully",
-        pagination=pagination_response,
     )
 
 
-@router.get("/{slug}")
-async def get_product(
-    db: Annotated[Session, Depends(get_db)],
-    slug: str,
-    redis: Annotated[Redis, Depends(get_redis)],
-) -> StandardResponse[dict]:
-    cache_key = f"product:{slug}"
-    cached_data = await redis.get(cache_key)
-    if cached_data:
-        response = json.loads(cached_data)
-        return create_response(response, message="Returned products data successfully")
-    response = services.get_product_by_slug(db=db, slug=slug)
-    print("Not Calling Redis")
-    await redis.setex(cache_key, 3600, json.dumps(response, default=json_serializer))
-    return create_response(response, message="Returned products data successfully")
-
-
-@router.get("/category")
-def get_category(
-    db: Annotated[Session, Depends(get_db)],
+@router.get("/category", dependencies=[Depends(rate_limit)])
+async def get_category(
+    db: Annotated[AsyncSession, Depends(get_async_db)],
     slug: str,
 ) -> StandardResponse[dict]:
     return create_response(
-        data=services.get_category(db, slug),
+        data=await services.get_category(db, slug),
         message="Returned category data successfully",
     )
 
 
-@router.get("/category/top-products")
+@router.get("/category/top-products", dependencies=[Depends(rate_limit)])
 async def get_category_top_products(
-    db: Annotated[Session, Depends(get_db)],
     slug: str,
-    redis: Annotated[Redis, Depends(get_redis)],
+    cache: Annotated[Cache, Depends(get_cache)],
+    response: Response,
+    limit: Annotated[
+        int, Query(ge=1, le=settings.CATEGORY_TOP_PRODUCTS_MAX_LIMIT)
+    ] = settings.CATEGORY_TOP_PRODUCTS_LIMIT,
 ) -> StandardResponse[dict]:
-    cache_key = f"category:top_products:{slug}"
+    record_access(KeyFamily.CATEGORY_TOP_PRODUCTS, f"{limit}:{slug}")
+    return await cache.get_or_set_response(
+        keys.category_top_products_key(slug, limit),
+        category_top_products_loader(slug, limit),
+        response,
+    )
 
-    cached_data = await redis.get(cache_key)
 
-    if cached_data:
-        print(f"Calling from Redis - Category Top Products: {slug}")
-        response = json.loads(cached_data)
-        return create_response(
-            response,
-            message="Returned category top product data successfully (from cache)",
-        )
-    response = services.get_category_top_products(
-        db,
-        slug,
-    )
-    await redis.setex(cache_key, 1800, json.dumps(response, default=json_serializer))
+@router.get("/category/tree", dependencies=[Depends(rate_limit)])
+async def get_category_tree(
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+) -> StandardResponse[list]:
     return create_response(
-        response, message="Returned category top product data successfully"
+        data=await services.get_category_tree(db),
+        message="Returned category tree successfully",
+    )
+
+
+# Last, so the catch-all does not shadow /category and the other fixed paths
+@router.get("/{slug}", dependencies=[Depends(rate_limit)])
+async def get_product(
+    slug: str,
+    cache: Annotated[Cache, Depends(get_cache)],
+    response: Response,
+) -> StandardResponse[dict]:
+    record_access(KeyFamily.PRODUCT, slug)
+    return await cache.get_or_set_response(
+        keys.product_key(slug), product_loader(slug), response
     )
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+from collections.abc import Iterable
+from itertools import batched
+
+from redis.asyncio import Redis
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import database
+from src.cache.keys import hash_tag
+from src.cache.tags import PRODUCT_SEARCH_TAG, invalidate_tags, tag
+from src.config import settings
+from src.database import AsyncSessionLocal, get_sync_redis, run_after_commit
+from src.product.associations import ProductTagLink
+from src.product.enums import ProductStatus
+from src.product.invalidation import SEARCHABLE_NAME_FIELDS, changed
+from src.product.models import Brand, Category, Product, Tag
+
+logger = logging.getLogger(__name__)
+
+# Trigram inverted index of the text /product/search matches with ILIKE:
+# search:gram:<gram> is the set of published product ids with that trigram in
+# their name, slug, product_no, brand, category or tag names, and
+# search:doc:<id> the grams a product is posted under, to unpost them later.
+# Model hooks queue what changed in search:dirty ("product:1", "brand:2",
+# ...); a background task drains the queue and rewrites those postings.
+# Writes that skip the hooks (raw SQL, other apps) are caught by a full
+# rebuild each time search:ready expires; searches scan with ILIKE meanwhile.
+SEARCH_DIRTY_KEY = "search:dirty"
+SEARCH_READY_KEY = "search:ready"
+SEARCH_REBUILD_LOCK_KEY = "search:rebuild:lock"
+GRAM_SIZE = 3
+PRODUCT_SEARCH_FIELDS = (
+    "name",
+    "slug",
+    "product_no",
+    "status",
+    "brand_id",
+    "category_id",
+    "tags",
+)
+
+
+def gram_key(gram: str) -> str:
+    # One hash tag for every gram: a search intersects any of them
+    return f"{hash_tag('search')}:gram:{gram}"
+
+
+def doc_key(product_id: int) -> str:
+    return f"search:doc:{product_id}"
+
+
+def grams(text: str) -> set[str]:
+    text = text.lower()
+    return {text[i : i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+async def load_documents(db: AsyncSession, ids: Iterable[int]) -> dict[int, set[str]]:
+    """Grams of each published product among `ids`"""
+    rows = await db.execute(
+        select(
+            Product.id,
+            Product.name,
+            Product.slug,
+            Product.product_no,
+            Brand.name,
+            Category.name,
+        )
+        .outerjoin(Product.brand)
+        .outerjoin(Product.category)
+        .filter(Product.id.in_(ids), Product.status == ProductStatus.PUBLISHED)
+    )
+    docs = {
+        id: set().union(*(grams(value) for value in values if value))
+        for id, *values in rows
+    }
+    tag_names = await db.execute(
+        select(ProductTagLink.product_id, Tag.name)
+        .join(Tag, ProductTagLink.tag_id == Tag.id)
+        .filter(ProductTagLink.product_id.in_(docs))
+    )
+    for id, name in tag_names:
+        docs[id] |= grams(name)
+    return docs
+
+
+async def index_products(redis: Redis, db: AsyncSession, ids: list[int]) -> None:
+    """Bring the postings of `ids` in line with the database, in two round trips"""
+    docs = await load_documents(db, ids)
+    pipe = redis.pipeline(transaction=False)
+    for id in ids:
+        pipe.smembers(doc_key(id))
+    posted = await pipe.execute()
+
+    pipe = redis.pipeline(transaction=False)
+    for id, previous in zip(ids, posted):
+        previous = {gram.decode() for gram in previous}
+        current = docs.get(id, set())
+        for gram in previous - current:
+            pipe.srem(gram_key(gram), id)
+        for gram in current - previous:
+            pipe.sadd(gram_key(gram), id)
+        pipe.delete(doc_key(id))
+        if current:
+            pipe.sadd(doc_key(id), *current)
+    await pipe.execute()
+
+
+async def resolve_products(db: AsyncSession, markers: Iterable[str]) -> set[int]:
+    """Product ids behind queued markers; a renamed brand stands for its products"""
+    ids: dict[str, set[int]] = {
+        kind: set() for kind in ("product", "brand", "category", "tag")
+    }
+    for marker in markers:
+        kind, id = marker.split(":", 1)
+        ids[kind].add(int(id))
+
+    product_ids = ids["product"]
+    for column, owners in (
+        (Product.brand_id, ids["brand"]),
+        (Product.category_id, ids["category"]),
+    ):
+        if owners:
+            product_ids |= set(
+                await db.scalars(select(Product.id).filter(column.in_(owners)))
+            )
+    if ids["tag"]:
+        product_ids |= set(
+            await db.scalars(
+                select(ProductTagLink.product_id).filter(
+                    ProductTagLink.tag_id.in_(ids["tag"])
+                )
+            )
+        )
+    return product_ids
+
+
+async def sync_search_index(redis: Redis) -> int:
+    """Reindex one batch of queued changes; returns how many products it touched"""
+    markers = await redis.spop(SEARCH_DIRTY_KEY, settings.SEARCH_INDEX_BATCH_SIZE)
+    if not markers:
+        return 0
+    try:
+        async with AsyncSessionLocal() as db:
+            ids = await resolve_products(db, (m.decode() for m in markers))
+            for batch in batched(sorted(ids), settings.SEARCH_INDEX_BATCH_SIZE):
+                await index_products(redis, db, list(batch))
+    except Exception:
+        await redis.sadd(SEARCH_DIRTY_KEY, *markers)  # retried on the next round
+        raise
+    return len(ids)
+
+
+async def rebuild_search_index(redis: Redis) -> None:
+    """Index every published product; one worker builds, the others skip"""
+    if not await redis.set(SEARCH_REBUILD_LOCK_KEY, 1, nx=True, ex=600):
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            last_id = 0
+            while ids := list(
+                await db.scalars(
+                    select(Product.id)
+                    .filter(
+                        Product.id > last_id, Product.status == ProductStatus.PUBLISHED
+                    )
+                    .order_by(Product.id)
+                    .limit(settings.SEARCH_INDEX_BATCH_SIZE)
+                )
+            ):
+                await index_products(redis, db, ids)
+                last_id = ids[-1]
+        await redis.set(
+            SEARCH_READY_KEY, 1, ex=settings.SEARCH_INDEX_REBUILD_INTERVAL or None
+        )
+        logger.info("Search index built")
+    finally:
+        await redis.delete(SEARCH_REBUILD_LOCK_KEY)
+
+
+async def maintain_search_index(redis: Redis, interval: float) -> None:
+    """
+    Build the index when it is missing or due a rebuild and apply queued
+    changes, for the life of the app. Search results cached while a change was still queued
+    are dropped once it is applied.
+    """
+    while True:
+        try:
+            if not await redis.exists(SEARCH_READY_KEY):
+                await rebuild_search_index(redis)
+            if await sync_search_index(redis):
+                await asyncio.to_thread(
+                    invalidate_tags, get_sync_redis(), [PRODUCT_SEARCH_TAG]
+                )
+        except Exception:
+            logger.exception("Search index sync failed")
+        await asyncio.sleep(interval)
+
+
+async def search_candidates(search: str) -> list[int] | None:
+    """
+    Ids of the products whose indexed text has every trigram of `search`.
+    None when the index cannot narrow the search: it is disabled or not
+    built yet, the term is shorter than a trigram or has LIKE wildcards
+    (the search pattern does not escape them), or it matches too much.
+    """
+    needed = grams(search)
+    if (
+        not settings.SEARCH_INDEX_ENABLED
+        or not needed
+        or "%" in search
+        or "_" in search
+    ):
+        return None
+    pipe = database.redis_pool.pipeline(transaction=False)
+    pipe.exists(SEARCH_READY_KEY)
+    pipe.sinter([gram_key(gram) for gram in needed])
+    ready, ids = await pipe.execute()
+    if not ready or len(ids) > settings.SEARCH_INDEX_MAX_CANDIDATES:
+        return None
+    return [int(id) for id in ids]
+
+
+def search_markers(obj: object, is_new_or_deleted: bool) -> set[str]:
+    match obj:
+        case Product():
+            if is_new_or_deleted or changed(obj, PRODUCT_SEARCH_FIELDS):
+                return {tag("product", obj.id)}
+        case Brand() | Category() | Tag():
+            if not is_new_or_deleted and changed(obj, SEARCHABLE_NAME_FIELDS):
+                return {tag(type(obj).__name__.lower(), obj.id)}
+        case ProductTagLink():
+            return {tag("product", obj.product_id)}
+    return set()
+
+
+def collect_search_changes(session: Session, _flush_context: object) -> None:
+    """after_flush: note which products need reindexing"""
+    markers = session.info.setdefault("search_markers", set())
+    for obj in (*session.new, *session.deleted):
+        markers |= search_markers(obj, is_new_or_deleted=True)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            markers |= search_markers(obj, is_new_or_deleted=False)
+
+
+def apply_search_changes(session: Session) -> None:
+    """after_commit: queue the products for the index maintainer"""
+    markers = session.info.pop("search_markers", None)
+    if markers:
+        run_after_commit(lambda redis: redis.sadd(SEARCH_DIRTY_KEY, *markers))
+
+
+def discard_search_changes(session: Session) -> None:
+    """after_rollback: nothing was persisted"""
+    session.info.pop("search_markers", None)
+
+
+def register_search_index_tracking() -> None:
+    """Queue product reindexing whenever a session commits searchable changes"""
+    for name, listener in (
+        ("after_flush", collect_search_changes),
+        ("after_commit", apply_search_changes),
+        ("after_rollback", discard_search_changes),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -1,22 +1,41 @@
 from __future__ import annotations
 
+import json
+from collections.abc import Iterable
+from decimal import Decimal
+
 from redis.asyncio import Redis
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
-from sqlmodel import Session
 
+from src.cache.tags import (
+    PRODUCT_LIST_TAG,
+    PRODUCT_SEARCH_TAG,
+    add_tags,
+    collect_tags,
+    tag,
+)
 from src.common.exceptions import HTTP400
 from src.common.filters import PaginationParams
 from src.common.schemas import MediaOut
-from src.product import schemas
-from src.product.models import Category, Attribute
+from src.database import run_concurrently
+from src.product import category_tree
+from src.product.counts import get_product_counts
+from src.product.models import Category, Product
 from src.product.queries import (
+    count_or_estimate,
+    fetch_rows,
     get_category_top_rated_and_top_sold_products_query,
     get_products_base_query,
-    get_product_with_product_variants_and_images,
     get_products_by_search,
+    paginate_products,
+    product_detail_query,
+    product_details_query,
+    split_page,
 )
-from src.product.schemas import ProductVariantShortOut
-from src.product.utlis import get_response
+from src.product.search_index import search_candidates
+from src.product.utlis import get_response, price
 
 
 async def set_product(redis: Redis, name: str):
@@ -25,78 +44,78 @@ async def set_product(redis: Redis, name: str):
     return {"product": value}
 
 
-def get_products(
-    db: Session,
+async def get_products(
+    db: AsyncSession,
     pagination: PaginationParams | None = None,
-) -> tuple[list, int]:
-    base_query, total_counts = get_products_base_query(db)
+) -> tuple[list, int, str | None]:
+    base_query = get_products_base_query()
+    add_tags(PRODUCT_LIST_TAG)
+    page_query = base_query
     if pagination:
-        base_query = base_query.offset(pagination.offset).limit(pagination.size)
-    return get_response(base_query.all()), total_counts
+        page_query = paginate_products(base_query, pagination)
+    total_counts = (await get_product_counts(db))["published"]
+    results = await fetch_rows(db, page_query)
+    next_cursor = None
+    if pagination:
+        results, next_cursor = split_page(results, pagination)
+    return get_response(results), total_counts, next_cursor
 
 
-def get_product_by_slug(db: Session, slug: str) -> dict:
-    product = get_product_with_product_variants_and_images(db, slug)
-    if product is None:
-        raise HTTP400(detail="Product not found")
-    if product.variants:
-        variants = product.variants
-
-        regular_prices = [v.regular_price for v in variants if v.regular_price]
-        discount_prices = [v.discount_price for v in variants if v.discount_price]
-
-        regular_price_min = int(min(regular_prices)) if regular_prices else None
-        regular_price_max = int(max(regular_prices)) if regular_prices else None
-        discount_price_min = int(min(discount_prices)) if discount_prices else None
-        discount_price_max = int(max(discount_prices)) if discount_prices else None
-
-        if not discount_price_min:
-            discount_price_min = None
-        if not discount_price_max:
-            discount_price_max = None
-
-        if discount_price_min is None and discount_price_max is None:
-            max_discount_percentage = None
-        else:
-            discount_percentages = [
-                ((v.regular_price - v.discount_price) / v.regular_price) * 100
-                for v in variants
-                if v.discount_price is not None and v.regular_price > 0
-            ]
-            max_discount_percentage = (
-                max(discount_percentages) if discount_percentages else None
-            )
-
-    else:
-        regular_price_min = regular_price_max = None
-        discount_price_min = discount_price_max = None
-        max_discount_percentage = None
-
-    variants = [
-        ProductVariantShortOut.model_validate(variant, from_attributes=True)
-        for variant in product.variants
-    ]
-
-    attribute_ids = list(
-        {
-            attr_variant.attribute_id
-            for p_variant in product.variants
-            for attr_variant in p_variant.attribute_variants
-        }
+def variant_out(variant: dict) -> dict:
+    """A variant as ProductVariantShortOut renders it"""
+    regular_price, discount_price = variant["regular_price"], variant["discount_price"]
+    variant["discount_percentage"] = (
+        round(((regular_price - discount_price) / regular_price) * 100)
+        if discount_price
+        else None
     )
-    attributes = (
-        db.query(Attribute)
-        .options(joinedload(Attribute.variants))
-        .filter(Attribute.id.in_(attribute_ids))
-        .order_by(Attribute.name)
-        .all()
+    return variant
+
+
+async def get_product_by_slug(db: AsyncSession, slug: str) -> dict:
+    row = (await db.execute(product_detail_query(slug))).first()
+    if row is None:
+        raise HTTP400(detail="Product not found")
+    return product_detail(row)
+
+
+async def get_products_by_slugs(
+    db: AsyncSession, slugs: Iterable[str]
+) -> dict[str, tuple[dict, set[str]]]:
+    """
+    The pages of the published products among `slugs` in one statement, by
+    slug, each with the cache tags it depends on. Unknown slugs are left out.
+    """
+    details = {}
+    for row in await db.execute(product_details_query(slugs)):
+        with collect_tags() as tags:
+            detail = product_detail(row)
+        details[row.Product.slug] = (detail, tags)
+    return details
+
+
+def product_detail(row: Row) -> dict:
+    """A product page from a product_details_query row"""
+    product = row.Product
+    variants = json.loads(row.variants, parse_float=Decimal)
+    attributes = json.loads(row.attributes, parse_float=Decimal)
+    add_tags(
+        tag("product", product.id),
+        tag("brand", product.brand_id),
+        tag("category", product.category_id),
+        *(tag("attribute", attribute.pop("id")) for attribute in attributes),
     )
 
-    brand = (
-        {"name": product.brand.name, "slug": product.brand.slug}
-        if product.brand_id
+    discount_price_min = price(row.discount_price_min)
+    discount_price_max = price(row.discount_price_max)
+    max_discount_percentage = (
+        row.max_discount_percentage
+        if discount_price_min is not None or discount_price_max is not None
         else None
     )
+    brand = (
+        {"name": row.brand_name, "slug": row.brand_slug} if product.brand_id else None
+    )
     return {
         "name": product.name,
         "public_id": product.public_id,
@@ -104,19 +123,12 @@ def get_product_by_slug(db: Session, slug: str) -> dict:
         "stock_status": product.stock_status,
         "slug": product.slug,
         "rating": product.rating,
-        "variants": variants,
+        "variants": [variant_out(variant) for variant in variants],
         "brand": brand,
-        "category": schemas.CategoryBase.model_validate(
-            product.category, from_attributes=True
-        ),
-        "attributes": [
-            schemas.AttributeWithVariantsOut.model_validate(
-                attribute, from_attributes=True
-            )
-            for attribute in attributes
-        ],
-        "regular_price_min": regular_price_min,
-        "regular_price_max": regular_price_max,
+        "category": {"name": row.category_name, "slug": row.category_slug},
+        "attributes": attributes,
+        "regular_price_min": price(row.regular_price_min),
+        "regular_price_max": price(row.regular_price_max),
         "discount_price_min": discount_price_min,
         "discount_price_max": discount_price_max,
         "discount": round(max_discount_percentage) if max_discount_percentage else None,
@@ -127,27 +139,39 @@ def get_product_by_slug(db: Session, slug: str) -> dict:
     }
 
 
-def get_products_by_search_with_filter(
-    db: Session,
+async def get_products_by_search_with_filter(
+    db: AsyncSession,
     search: str,
     pagination: PaginationParams | None = None,
-) -> tuple[dict, int]:
-    base_query = get_products_by_search(db, search)
-    total_counts = base_query.count()
+) -> tuple[dict, int, str | None]:
+    base_query = get_products_by_search(search)
+    candidates = await search_candidates(search)
+    if candidates is not None:
+        # The index narrows the scan; the ILIKE predicates still decide matches
+        base_query = base_query.filter(Product.id.in_(candidates))
+    add_tags(PRODUCT_SEARCH_TAG)
+    page_query = base_query
+    if pagination:
+        page_query = paginate_products(base_query, pagination)
+    total_counts, results = await run_concurrently(
+        lambda db: count_or_estimate(db, base_query),
+        lambda db: fetch_rows(db, page_query),
+    )
+    next_cursor = None
     if pagination:
-        base_query = base_query.offset(pagination.offset).limit(pagination.size)
+        results, next_cursor = split_page(results, pagination)
     result = {
-        "products": get_response(base_query.all()),
+        "products": get_response(results),
     }
-    return result, total_counts
+    return result, total_counts, next_cursor
 
 
-def get_category(db: Session, slug: str) -> dict:
-    category = (
-        db.query(Category)
-        .options(joinedload(Category.image))
+async def get_category(db: AsyncSession, slug: str) -> dict:
+    category = await db.scalar(
+        select(Category)
+        .options(joinedload(Category.image), joinedload(Category.banner))
         .filter(Category.slug == slug, Category.is_active)
-        .first()
+        .limit(1)
     )
 
     if not category:
@@ -159,8 +183,14 @@ def get_category(db: Session, slug: str) -> dict:
     }
 
 
-def get_category_top_products(db: Session, slug: str) -> dict:
-    top_rated, top_sold = get_category_top_rated_and_top_sold_products_query(db, slug)
+async def get_category_tree(db: AsyncSession) -> list[dict]:
+    return (await category_tree.get_category_tree(db)).nested
+
+
+async def get_category_top_products(db: AsyncSession, slug: str, limit: int) -> dict:
+    top_rated, top_sold = await get_category_top_rated_and_top_sold_products_query(
+        db, slug, limit
+    )
     return {
         "top_rated": get_response(top_rated),
         "top_sold": get_response(top_sold),
@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import json
+import logging
+import unicodedata
+from collections import defaultdict
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import func
+
+from src import database
+from src.cache.keys import hash_tag
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.product.associations import ProductTagLink
+from src.product.enums import ProductStatus
+from src.product.models import Brand, Category, Product, Tag
+
+logger = logging.getLogger(__name__)
+
+# Typeahead index for /product/suggest, rebuilt on a timer:
+# suggest:lex holds "<normalized name>\0<kind>:<slug>" at score 0 so that
+# ZRANGEBYLEX finds every name starting with a prefix, once per word start
+# ("slim fit" is reachable from "premium slim fit"); suggest:weights ranks the
+# matches and suggest:labels holds what the endpoint returns for each.
+# Short prefixes match too many names to rank per keystroke: suggest:top
+# maps each one to its SUGGEST_MAX_LIMIT heaviest entries, ranked when the
+# index is built. The index keys share a hash tag: the script and the swap
+# touch all of them.
+SUGGEST_LEX_KEY = f"{hash_tag('suggest')}:lex"
+SUGGEST_WEIGHTS_KEY = f"{hash_tag('suggest')}:weights"
+SUGGEST_LABELS_KEY = f"{hash_tag('suggest')}:labels"
+SUGGEST_TOP_KEY = f"{hash_tag('suggest')}:top"
+SUGGEST_KEYS = (
+    SUGGEST_LEX_KEY,
+    SUGGEST_WEIGHTS_KEY,
+    SUGGEST_LABELS_KEY,
+    SUGGEST_TOP_KEY,
+)
+SUGGEST_REBUILD_LOCK_KEY = "suggest:rebuild:lock"
+SEPARATOR = "\0"
+
+# Return the labels of the ARGV[4] heaviest entries for a prefix, in one
+# round trip per keystroke. A short prefix (ARGV[5]) reads its ranking from
+# suggest:top; a longer one scans the first ARGV[3] names in its range, keeps
+# each entry once and ranks them.
+SUGGEST_SCRIPT = """
+if ARGV[5] ~= '' then
+    local top = redis.call('HGET', KEYS[4], ARGV[5])
+    if not top then
+        return {}
+    end
+    local refs, start = {}, 1
+    while #refs < tonumber(ARGV[4]) do
+        local stop = string.find(top, '\\0', start, true)
+        refs[#refs + 1] = string.sub(top, start, (stop or 0) - 1)
+        if not stop then
+            break
+        end
+        start = stop + 1
+    end
+    return redis.call('HMGET', KEYS[3], unpack(refs))
+end
+
+local members = redis.call(
+    'ZRANGEBYLEX', KEYS[1], ARGV[1], ARGV[2], 'LIMIT', 0, tonumber(ARGV[3])
+)
+local refs, seen = {}, {}
+for _, member in ipairs(members) do
+    local ref = string.sub(member, string.find(member, '\\0', 1, true) + 1)
+    if not seen[ref] then
+        seen[ref] = true
+        refs[#refs + 1] = ref
+    end
+end
+if #refs == 0 then
+    return {}
+end
+local weights = redis.call('HMGET', KEYS[2], unpack(refs))
+local ranked = {}
+for i, ref in ipairs(refs) do
+    ranked[i] = {ref, tonumber(weights[i]) or 0}
+end
+table.sort(ranked, function(a, b)
+    return a[2] > b[2] or (a[2] == b[2] and a[1] < b[1])
+end)
+local top = {}
+for i = 1, math.min(tonumber(ARGV[4]), #ranked) do
+    top[i] = ranked[i][1]
+end
+return redis.call('HMGET', KEYS[3], unpack(top))
+"""
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-insensitive form of a name, single-spaced"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+def word_starts(name: str) -> set[str]:
+    words = normalize(name).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+def top_by_prefix(
+    suggestions: list[tuple[str, str, str, float]],
+) -> dict[str, str]:
+    """
+    For every prefix of up to SUGGEST_TOP_PREFIX_LENGTH characters of a word
+    start, its SUGGEST_MAX_LIMIT heaviest entries, joined by SEPARATOR
+    """
+    length = settings.SUGGEST_TOP_PREFIX_LENGTH
+    weights = {}
+    matches: dict[str, set[str]] = defaultdict(set)
+    for kind, name, slug, weight in suggestions:
+        ref = f"{kind}:{slug}"
+        weights[ref] = weight
+        for start in word_starts(name):
+            for end in range(1, min(length, len(start)) + 1):
+                matches[start[:end]].add(ref)
+    return {
+        prefix: SEPARATOR.join(
+            heapq.nsmallest(
+                settings.SUGGEST_MAX_LIMIT, refs, key=lambda ref: (-weights[ref], ref)
+            )
+        )
+        for prefix, refs in matches.items()
+    }
+
+
+async def load_suggestions(db: AsyncSession) -> list[tuple[str, str, str, float]]:
+    """
+    (kind, name, slug, weight) of every suggestible name. Published products
+    weigh their total_sold, with rating breaking ties; brands, categories and
+    tags weigh what their published products sold together.
+    """
+    published = (Product.status == ProductStatus.PUBLISHED) & Product.is_active
+    sold = func.coalesce(func.sum(Product.total_sold), 0)
+    queries = {
+        "product": select(
+            Product.name,
+            Product.slug,
+            Product.total_sold + Product.rating / 10,
+        ).filter(published),
+        "brand": select(Brand.name, Brand.slug, sold)
+        .outerjoin(Product, (Product.brand_id == Brand.id) & published)
+        .filter(Brand.is_active)
+        .group_by(Brand.id),
+        "category": select(Category.name, Category.slug, sold)
+        .outerjoin(Product, (Product.category_id == Category.id) & published)
+        .filter(Category.is_active)
+        .group_by(Category.id),
+        "tag": select(Tag.name, Tag.slug, sold)
+        .outerjoin(ProductTagLink, ProductTagLink.tag_id == Tag.id)
+        .outerjoin(Product, (Product.id == ProductTagLink.product_id) & published)
+        .filter(Tag.is_active)
+        .group_by(Tag.id),
+    }
+    suggestions = []
+    for kind, query in queries.items():
+        for name, slug, weight in await db.execute(query):
+            suggestions.append((kind, name, slug, float(weight or 0)))
+    return suggestions
+
+
+async def rebuild_suggestions(redis: Redis, db: AsyncSession) -> int:
+    """
+    Build the index under temporary keys and swap it in atomically, so a
+    keystroke never sees it half built. Returns how many names it holds.
+    """
+    suggestions = await load_suggestions(db)
+    building = [f"{key}:building" for key in SUGGEST_KEYS]
+    pipe = redis.pipeline(transaction=False)
+    pipe.delete(*building)
+    for kind, name, slug, weight in suggestions:
+        ref = f"{kind}:{slug}"
+        pipe.zadd(
+            building[0], {f"{start}{SEPARATOR}{ref}": 0 for start in word_starts(name)}
+        )
+        pipe.hset(building[1], ref, weight)
+        pipe.hset(
+            building[2], ref, json.dumps({"type": kind, "name": name, "slug": slug})
+        )
+    if top := top_by_prefix(suggestions):
+        pipe.hset(building[3], mapping=top)
+    await pipe.execute()
+
+    pipe = redis.pipeline(transaction=True)
+    for key, live in zip(building, SUGGEST_KEYS):
+        # A key left empty was never created: nothing of it stays live
+        if suggestions and (live != SUGGEST_TOP_KEY or top):
+            pipe.rename(key, live)
+        else:
+            pipe.delete(live)
+    await pipe.execute()
+    return len(suggestions)
+
+
+async def refresh_suggestions_periodically(redis: Redis, interval: int) -> None:
+    """
+    Rebuild the index now and then every `interval` seconds, for the life of
+    the app. The lock outlives a rebuild by design: whichever worker takes it
+    rebuilds for all of them that round.
+    """
+    while True:
+        try:
+            if await redis.set(SUGGEST_REBUILD_LOCK_KEY, 1, nx=True, ex=interval):
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await rebuild_suggestions(redis, db)
+                except Exception:
+                    await redis.delete(SUGGEST_REBUILD_LOCK_KEY)
+                    raise
+        except Exception:
+            logger.exception("Suggestion index rebuild failed")
+        await asyncio.sleep(interval)
+
+
+async def get_suggestions(prefix: str, limit: int) -> list[dict]:
+    """
+    The `limit` heaviest names starting with `prefix` at a word boundary,
+    from Redis alone. Prefixes up to SUGGEST_TOP_PREFIX_LENGTH characters
+    were ranked over every name when the index was built; longer ones, which
+    match few names, rank the first SUGGEST_SCAN_LIMIT names of their range.
+    """
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    start = b"[" + prefix.encode()
+    short = prefix if len(prefix) <= settings.SUGGEST_TOP_PREFIX_LENGTH else ""
+    labels = await database.redis_pool.eval(
+        SUGGEST_SCRIPT,
+        len(SUGGEST_KEYS),
+        *SUGGEST_KEYS,
+        start,
+        start + b"\xff",
+        settings.SUGGEST_SCAN_LIMIT,
+        limit,
+        short,
+    )
+    return [json.loads(label) for label in labels if label]
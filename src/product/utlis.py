@@ -1,10 +1,19 @@
-from sqlmodel import Session
+from decimal import Decimal
 
-from src.product.models import Category
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache.tags import add_tags, tag
+from src.product.category_tree import get_category_tree
+
+
+def price(value: Decimal | None) -> int | None:
+    """Whole-unit price, None for a missing or zero price"""
+    return int(value) if value else None
 
 
 def get_response(results: list) -> list:
     processed = []
+    add_tags(*(tag("product", result[0].id) for result in results))
 
     for result in results:
         product = result[0]
@@ -14,8 +23,8 @@ def get_response(results: list) -> list:
             "slug": product.slug,
             "public_id": product.public_id,
             "rating": product.rating,
-            "regular_price_min": int(result[2]) if len(result) > 2 else None,  # noqa: PLR2004
-            "regular_price_max": int(result[3]) if len(result) > 3 else None,  # noqa: PLR2004
+            "regular_price_min": price(result[2]) if len(result) > 2 else None,  # noqa: PLR2004
+            "regular_price_max": price(result[3]) if len(result) > 3 else None,  # noqa: PLR2004
             "discount_price_min": result[4] if len(result) > 4 else None,  # noqa: PLR2004
             "discount_price_max": result[5] if len(result) > 5 else None,  # noqa: PLR2004
             "discount": round(result[6]) if len(result) > 6 and result[6] else None,  # noqa: PLR2004
@@ -26,7 +35,9 @@ def get_response(results: list) -> list:
     return processed
 
 
-def get_category_and_descendants(db: Session, category_ids: list[int]) -> list[int]:
+async def get_category_and_descendants(
+    db: AsyncSession, category_ids: list[int]
+) -> list[int]:
     """
     Get the specified categories AND all their descendant category IDs.
 
@@ -39,25 +50,5 @@ def get_category_and_descendants(db: Session, category_ids: list[int]) -> list[i
     if not category_ids:
         return []
 
-    all_categories = (
-        db.query(Category.id, Category.parent_id).filter(Category.is_active).all()
-    )
-
-    children_map = {}
-    for cat_id, parent_id in all_categories:
-        if parent_id not in children_map:
-            children_map[parent_id] = []
-        children_map[parent_id].append(cat_id)
-
-    def get_all_descendants(cat_id: int) -> list[int]:
-        descendants = [cat_id]
-        if cat_id in children_map:
-            for child_id in children_map[cat_id]:
-                descendants.extend(get_all_descendants(child_id))
-        return descendants
-
-    all_descendants = []
-    for cat_id in category_ids:
-        all_descendants.extend(get_all_descendants(cat_id))
-
-    return list(set(all_descendants))
+    tree = await get_category_tree(db)
+    return list(tree.descendants(category_ids))
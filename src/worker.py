@@ -0,0 +1,45 @@
+from celery import Celery
+
+from src.config import settings
+
+# Background jobs: celery -A src.worker worker, plus celery -A src.worker beat
+# for the periodic ones. The broker defaults to the app's Redis.
+celery_app = Celery(
+    "redis_python",
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL,
+    backend=settings.CELERY_RESULT_BACKEND or None,
+    include=["src.product.aggregates"],
+)
+celery_app.conf.update(
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    task_ignore_result=not settings.CELERY_RESULT_BACKEND,
+)
+
+# Only the aggregates whose source is configured
+aggregates = [
+    name
+    for name, source in (
+        ("rating", settings.AGGREGATES_RATING_SOURCE),
+        ("total_sold", settings.AGGREGATES_TOTAL_SOLD_SOURCE),
+    )
+    if source
+]
+if settings.AGGREGATES_REFRESH_INTERVAL:
+    celery_app.conf.beat_schedule = {
+        f"refresh-product-{name}": {
+            "task": "product.refresh_aggregate",
+            "schedule": settings.AGGREGATES_REFRESH_INTERVAL,
+            "args": (name,),
+        }
+        for name in aggregates
+    } | {
+        f"recompute-product-{name}": {
+            "task": "product.refresh_aggregate",
+            "schedule": settings.AGGREGATES_FULL_REFRESH_INTERVAL,
+            "args": (name,),
+            "kwargs": {"full": True},
+        }
+        for name in aggregates
+        if settings.AGGREGATES_FULL_REFRESH_INTERVAL
+    }
@@ -0,0 +1,40 @@
+import asyncio
+import random
+
+import pytest
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from src.cache.cache import Cache
+from src.cache.codecs import CacheEntry
+from src.cache.keys import product_key
+
+
+def test_fill_coalesced_reads_the_fill_from_the_primary():
+    primary = FakeAsyncRedis(server=FakeServer())
+    # A replica that has not caught up with the fill yet
+    replica = FakeAsyncRedis(server=FakeServer())
+    leader = Cache(primary, db=None)
+    waiter = Cache(primary, db=None, reader=replica)
+    key = product_key("shirt")
+
+    def load_again(db):
+        raise AssertionError("the waiter loaded the key itself")
+
+    async def run():
+        lock = leader.lock(key)
+        assert await lock.acquire()
+        waiting = asyncio.create_task(waiter.fill_coalesced(key, load_again))
+        await asyncio.sleep(0.05)
+        await leader.fill(key, lambda db: {"slug": "shirt"}, db=None)
+        await lock.release()
+        return await waiting
+
+    assert asyncio.run(run()) == {"slug": "shirt"}
+
+
+@pytest.mark.parametrize(("draw", "refresh"), [(0.0, False), (0.9999, True)])
+def test_should_refresh_takes_every_random_draw(monkeypatch, draw, refresh):
+    cache = Cache(FakeAsyncRedis(), db=None, beta=1.0)
+    entry = CacheEntry(value=None, soft_expiry=100.0, delta=1.0)
+    monkeypatch.setattr(random, "random", lambda: draw)
+    assert cache.should_refresh(entry, now=95.0) is refresh
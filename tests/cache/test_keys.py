@@ -0,0 +1,40 @@
+import hashlib
+
+from src.cache.keys import product_list_key, product_search_key
+from src.common.filters import PaginationParams, encode_cursor
+
+
+def test_product_list_key_for_a_page_number():
+    key = product_list_key(PaginationParams(page=2, size=10))
+
+    assert key.key == "products:page:2:size:10"
+
+
+def test_product_list_key_keeps_the_cursor_marker():
+    cursor = encode_cursor("Shirt", 42)
+    key = product_list_key(PaginationParams(cursor=cursor, size=10))
+
+    assert key.key == f"products:page:cursor:{cursor}:size:10"
+    assert key != product_list_key(PaginationParams(page=2, size=10))
+
+
+def test_product_search_key_separates_cursor_and_page():
+    cursor = encode_cursor("Shirt", 42)
+
+    assert (
+        ":cursor:" in product_search_key("shirt", PaginationParams(cursor=cursor)).key
+    )
+    assert ":page:1:" in product_search_key("shirt", PaginationParams()).key
+
+
+def test_every_cursor_has_its_own_key():
+    cursors = [encode_cursor(f"Product {id}", id) for id in range(10_000)]
+    keys = {product_list_key(PaginationParams(cursor=cursor)) for cursor in cursors}
+
+    assert len(keys) == len(cursors)
+
+
+def test_product_search_key_digests_the_whole_term():
+    key = product_search_key("blue shirt", PaginationParams())
+
+    assert key.key.split(":")[2] == hashlib.sha256(b"blue shirt").hexdigest()
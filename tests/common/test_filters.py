@@ -0,0 +1,35 @@
+import base64
+import json
+
+import pytest
+
+from src.common.exceptions import HTTP400
+from src.common.filters import decode_cursor, encode_cursor
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("Shirt", 42), str, int) == ["Shirt", 42]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        raw_cursor({"name": "Shirt", "id": 42}),
+        raw_cursor(["Shirt"]),
+        raw_cursor(["Shirt", 42, 1]),
+        raw_cursor([42, "Shirt"]),
+        raw_cursor(["Shirt", "42"]),
+        raw_cursor(["Shirt", 4.2]),
+        raw_cursor(["Shirt", True]),
+        raw_cursor([None, 42]),
+        raw_cursor([["Shirt"], 42]),
+    ],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTP400):
+        decode_cursor(cursor, str, int)
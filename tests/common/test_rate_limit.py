@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis
+from fastapi import Request
+
+from src.common.rate_limit import RateLimit, client_id
+from src.config import settings
+from src.product.routes import rate_limit, router, search_rate_limit
+
+
+def request(forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": ("10.0.0.2", 51000)})
+
+
+def test_without_trusted_proxies_the_header_is_ignored(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_TRUSTED_PROXIES", 0)
+
+    assert client_id(request("203.0.113.7")) == "10.0.0.2"
+
+
+@pytest.mark.parametrize(
+    ("proxies", "forwarded", "client"),
+    [
+        (1, "203.0.113.7", "203.0.113.7"),
+        # The client sent its own header: the proxy appended the real address
+        (1, "198.51.100.1, 203.0.113.7", "203.0.113.7"),
+        (2, "198.51.100.1, 203.0.113.7, 10.0.0.1", "203.0.113.7"),
+        # Fewer entries than proxies: not every proxy was passed through
+        (2, "203.0.113.7", "10.0.0.2"),
+        (1, None, "10.0.0.2"),
+    ],
+)
+def test_client_is_counted_from_the_right(monkeypatch, proxies, forwarded, client):
+    monkeypatch.setattr(settings, "RATE_LIMIT_TRUSTED_PROXIES", proxies)
+
+    assert client_id(request(forwarded)) == client
+
+
+def test_check_counts_with_the_cached_script():
+    redis = FakeAsyncRedis()
+    limit = RateLimit("test", requests=2, window=60)
+
+    async def run():
+        results = [await limit.check(redis, "10.0.0.2") for _ in range(3)]
+        return results, await redis.script_exists(limit.script.sha)
+
+    results, loaded = asyncio.run(run())
+
+    assert [allowed for allowed, _ in results] == [True, True, False]
+    assert [state.remaining for _, state in results] == [1, 0, 0]
+    assert loaded == [True]
+
+
+def test_routes_carry_their_own_limits():
+    limits = {
+        route.path: [dependency.dependency for dependency in route.dependencies]
+        for route in router.routes
+    }
+
+    assert limits["/search"] == [search_rate_limit]
+    for path in ("", "/suggest", "/batch", "/{slug}", "/category/top-products"):
+        assert limits[path] == [rate_limit]
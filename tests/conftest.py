@@ -0,0 +1,8 @@
+import os
+from pathlib import Path
+
+from dotenv import dotenv_values
+
+# Settings are read on import; without a .env the example values will do
+for name, value in dotenv_values(Path(__file__).parent.parent / ".env.example").items():
+    os.environ.setdefault(name, value or "")
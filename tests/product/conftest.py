@@ -0,0 +1,137 @@
+import os
+from datetime import UTC, datetime
+
+import pytest
+import sqlalchemy as sa
+from sqlmodel import SQLModel
+
+import src.common.models  # noqa: F401
+from src.product.enums import (
+    ExchangePolicy,
+    ProductStatus,
+    ProductType,
+    ReturnPolicy,
+    StockStatus,
+)
+from src.product.models import Product, ProductVariant
+
+# Owned by apps outside this repository; the product tables point at them
+EXTERNAL_TABLES = ("seller", "customer", "employee", "sizeguide")
+
+
+def metadata() -> sa.MetaData:
+    """Every table of the models, with the external ones they point at"""
+    metadata = SQLModel.metadata
+    for name in EXTERNAL_TABLES:
+        if name not in metadata.tables:
+            sa.Table(name, metadata, sa.Column("id", sa.Integer, primary_key=True))
+    return metadata
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    # Newer SQLModel releases only store aware datetimes, and the models
+    # stamp updates with naive local time
+    for table in metadata().tables.values():
+        for column in table.c:
+            if column.onupdate is not None and column.onupdate.is_callable:
+                monkeypatch.setattr(
+                    column.onupdate, "arg", lambda context: datetime.now(UTC)
+                )
+    engine = sa.create_engine("sqlite://")
+    metadata().create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def postgres_url() -> str:
+    """
+    TEST_DATABASE_URL, an asyncpg URL of an empty database the tests create
+    and drop the tables in, for the queries only Postgres runs
+    """
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    return url
+
+
+def timestamps() -> dict:
+    # Aware only where the installed SQLModel stores datetimes with a zone
+    aware = Product.__table__.c.created_at.type.timezone
+    now = datetime.now(UTC) if aware else datetime.now()
+    return {"created_at": now, "updated_at": now, "is_active": True}
+
+
+def insert_product(connection: sa.Connection, id: int, **values) -> None:
+    defaults = {
+        "id": id,
+        "public_id": f"p{id}",
+        "name": f"Product {id}",
+        "slug": f"product-{id}",
+        "product_no": f"P{id}",
+        "description": "",
+        "stock_management": False,
+        "rating": 0,
+        "total_sold": 0,
+        "type": next(iter(ProductType)),
+        "status": ProductStatus.PUBLISHED,
+        "return_policy": next(iter(ReturnPolicy)),
+        "exchange_policy": next(iter(ExchangePolicy)),
+        "stock_status": StockStatus.IN_STOCK,
+        "category_id": 1,
+        "seller_id": 1,
+    }
+    connection.execute(
+        sa.insert(Product.__table__).values(defaults | timestamps() | values)
+    )
+
+
+def insert_variant(connection: sa.Connection, product_id: int, **values) -> None:
+    defaults = {
+        "public_id": f"v{product_id}-{values.get('regular_price')}",
+        "product_id": product_id,
+        "stock_status": StockStatus.IN_STOCK,
+    }
+    connection.execute(
+        sa.insert(ProductVariant.__table__).values(defaults | timestamps() | values)
+    )
+
+
+def insert_category(connection: sa.Connection, id: int = 1) -> None:
+    """A category, with the user and image rows its foreign keys need"""
+    tables = metadata().tables
+    if connection.scalar(sa.select(sa.func.count()).select_from(tables["user"])) == 0:
+        connection.execute(
+            sa.insert(tables["user"]).values(
+                id=1,
+                public_id="u1",
+                email="owner@example.com",
+                is_verified=True,
+                **timestamps(),
+            )
+        )
+        connection.execute(sa.insert(tables["seller"]).values(id=1))
+        connection.execute(
+            sa.insert(tables["media"]).values(
+                id=1,
+                public_id="m1",
+                name="image",
+                alt_text="",
+                s3_key="image",
+                created_by_id=1,
+                updated_by_id=1,
+                **timestamps(),
+            )
+        )
+    connection.execute(
+        sa.insert(tables["category"]).values(
+            id=id,
+            public_id=f"c{id}",
+            name=f"Category {id}",
+            slug=f"category-{id}",
+            image_id=1,
+            banner_id=1,
+            **timestamps(),
+        )
+    )
@@ -0,0 +1,111 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from fakeredis import FakeRedis
+
+from src.product import aggregates
+from src.product.aggregates import Aggregate, refresh
+from src.product.models import Product
+
+from .conftest import insert_product
+
+RATING = Aggregate(
+    "rating",
+    "productreview.rating",
+    lambda values: sa.func.round(sa.func.avg(values), 2),
+)
+TOTAL_SOLD = Aggregate("total_sold", "orderitem.quantity", sa.func.sum)
+
+
+@pytest.fixture
+def source_tables(engine):
+    # As the review and order services create them, next to the products
+    metadata = sa.MetaData()
+    reviews = sa.Table(
+        "productreview",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("product_id", sa.Integer, nullable=False),
+        sa.Column("rating", sa.Integer, nullable=False),
+        sa.Column("updated_at", sa.DateTime, nullable=False),
+    )
+    metadata.create_all(engine)
+    return reviews
+
+
+@pytest.fixture
+def redis(engine, monkeypatch):
+    redis = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(aggregates, "engine", engine)
+    monkeypatch.setattr(aggregates, "get_sync_redis", lambda: redis)
+    return redis
+
+
+def seeded_products(engine) -> None:
+    with engine.begin() as connection:
+        for id in (1, 2, 3):
+            insert_product(connection, id, rating=4, total_sold=10)
+
+
+def values(engine, column: str) -> dict[int, object]:
+    with engine.connect() as connection:
+        rows = connection.execute(sa.select(Product.id, getattr(Product, column)))
+        return {id: float(value) for id, value in rows}
+
+
+def utcnow() -> datetime:
+    # SQLite's clock, which the watermark follows, is naive UTC
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def add_review(engine, reviews, product_id: int, rating: int, age: int = 3600):
+    updated_at = utcnow() - timedelta(seconds=age)
+    with engine.begin() as connection:
+        connection.execute(
+            sa.insert(reviews).values(
+                product_id=product_id, rating=rating, updated_at=updated_at
+            )
+        )
+
+
+def test_missing_source_is_skipped(engine, redis):
+    seeded_products(engine)
+
+    assert refresh(TOTAL_SOLD) is None
+    assert values(engine, "total_sold") == {1: 10, 2: 10, 3: 10}
+    assert redis.get(aggregates.watermark_key("total_sold")) is None
+
+
+def test_first_run_keeps_products_without_source_rows(engine, redis, source_tables):
+    seeded_products(engine)
+    add_review(engine, source_tables, 1, 5)
+    add_review(engine, source_tables, 1, 2)
+
+    assert refresh(RATING) == 1
+    assert values(engine, "rating") == {1: 3.5, 2: 4, 3: 4}
+    assert redis.get(aggregates.watermark_key("rating")) is not None
+
+
+def test_incremental_run_follows_new_source_rows(engine, redis, source_tables):
+    seeded_products(engine)
+    add_review(engine, source_tables, 1, 5)
+    refresh(RATING)
+    # As if the last run was two hours ago
+    watermark = utcnow() - timedelta(hours=2)
+    redis.set(aggregates.watermark_key("rating"), watermark.isoformat())
+
+    add_review(engine, source_tables, 2, 1)
+    # Too recent for this run: it may belong to a transaction still open
+    add_review(engine, source_tables, 3, 1, age=0)
+
+    assert refresh(RATING) == 1
+    assert values(engine, "rating") == {1: 5, 2: 1, 3: 4}
+
+
+def test_rebuild_resets_products_without_source_rows(engine, redis, source_tables):
+    seeded_products(engine)
+    add_review(engine, source_tables, 1, 5)
+
+    assert refresh(RATING, rebuild=True) == 3
+    assert values(engine, "rating") == {1: 5, 2: 0, 3: 0}
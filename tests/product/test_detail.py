@@ -0,0 +1,179 @@
+import asyncio
+import json
+from decimal import Decimal
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.cache.tags import collect_tags
+from src.product import services
+from src.product.associations import ProductVariantAttributeVariantLink
+from src.product.models import Attribute, AttributeVariant
+from src.product.price_stats import refresh_price_stats
+
+from .conftest import (
+    insert_category,
+    insert_product,
+    insert_variant,
+    metadata,
+    timestamps,
+)
+
+# As Postgres renders the JSON arrays of product_details_query
+VARIANTS = [
+    {
+        "public_id": "v1",
+        "regular_price": 100.00,
+        "discount_price": 80.00,
+        "stock": 5,
+        "stock_status": "IN_STOCK",
+        "attribute_variants": [
+            {
+                "public_id": "av1",
+                "name": "Red",
+                "attribute": {"public_id": "a1", "name": "Color"},
+            }
+        ],
+    },
+    {
+        "public_id": "v2",
+        "regular_price": 120.00,
+        "discount_price": None,
+        "stock": 0,
+        "stock_status": "OUT_OF_STOCK",
+        "attribute_variants": [],
+    },
+]
+ATTRIBUTES = [
+    {
+        "id": 7,
+        "name": "Color",
+        "slug": "color",
+        "public_id": "a1",
+        "variants": [{"public_id": "av1", "name": "Red"}],
+    }
+]
+
+
+def assert_detail_shape(detail: dict) -> None:
+    assert [variant["public_id"] for variant in detail["variants"]] == ["v1", "v2"]
+    first, second = detail["variants"]
+    assert first["regular_price"] == Decimal("100.00")
+    assert first["discount_percentage"] == 20
+    assert first["attribute_variants"][0]["attribute"]["name"] == "Color"
+    assert second["discount_percentage"] is None
+    assert detail["attributes"] == [
+        {
+            "name": "Color",
+            "slug": "color",
+            "public_id": "a1",
+            "variants": [{"public_id": "av1", "name": "Red"}],
+        }
+    ]
+    assert detail["regular_price_min"] == 100
+    assert detail["regular_price_max"] == 120
+    assert detail["discount_price_min"] == 80
+    assert detail["discount_price_max"] == 80
+    assert detail["discount"] == 20
+
+
+def test_product_detail_renders_a_row():
+    product = SimpleNamespace(
+        id=1,
+        name="Shirt",
+        public_id="p1",
+        description="",
+        stock_status="IN_STOCK",
+        slug="shirt",
+        rating=Decimal("4.50"),
+        brand_id=None,
+        category_id=1,
+        return_policy="INSTANT",
+        exchange_policy="NOT_EXCHANGEABLE",
+        delivery_time=0,
+        total_sold=3,
+    )
+    row = SimpleNamespace(
+        Product=product,
+        brand_name=None,
+        brand_slug=None,
+        category_name="Shirts",
+        category_slug="shirts",
+        regular_price_min=Decimal("100.00"),
+        regular_price_max=Decimal("120.00"),
+        discount_price_min=Decimal("80.00"),
+        discount_price_max=Decimal("80.00"),
+        max_discount_percentage=Decimal(20),
+        variants=json.dumps(VARIANTS),
+        attributes=json.dumps(ATTRIBUTES),
+    )
+
+    with collect_tags() as tags:
+        detail = services.product_detail(row)
+
+    assert_detail_shape(detail)
+    assert detail["brand"] is None
+    assert detail["delivery_time"] is None
+    assert {"product:1", "category:1", "attribute:7"} <= tags
+
+
+def seed(connection: sa.Connection) -> None:
+    insert_category(connection)
+    insert_product(connection, 1, slug="shirt")
+    insert_variant(connection, 1, id=1, regular_price=100, discount_price=80, stock=5)
+    insert_variant(
+        connection,
+        1,
+        id=2,
+        regular_price=120,
+        stock=0,
+        stock_status="OUT_OF_STOCK",
+    )
+    connection.execute(
+        sa.insert(Attribute.__table__).values(
+            id=7, public_id="a1", name="Color", slug="color", **timestamps()
+        )
+    )
+    connection.execute(
+        sa.insert(AttributeVariant.__table__).values(
+            id=1, public_id="av1", name="Red", attribute_id=7, **timestamps()
+        )
+    )
+    connection.execute(
+        sa.insert(ProductVariantAttributeVariantLink.__table__).values(
+            product_variant_id=1, attribute_variant_id=1
+        )
+    )
+    refresh_price_stats(connection, [1])
+
+
+def test_detail_miss_is_one_statement(postgres_url):
+    async def run() -> tuple[dict, int]:
+        engine = create_async_engine(postgres_url, poolclass=NullPool)
+        async with engine.begin() as connection:
+            await connection.run_sync(metadata().create_all)
+            await connection.run_sync(seed)
+        statements = []
+        sa.event.listen(
+            engine.sync_engine,
+            "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+        try:
+            async with AsyncSession(engine) as db:
+                await db.connection()  # keep connection setup out of the count
+                statements.clear()
+                with collect_tags():
+                    detail = await services.get_product_by_slug(db, "shirt")
+            return detail, len(statements)
+        finally:
+            async with engine.begin() as connection:
+                await connection.run_sync(metadata().drop_all)
+            await engine.dispose()
+
+    detail, statements = asyncio.run(run())
+
+    assert statements == 1
+    assert_detail_shape(detail)
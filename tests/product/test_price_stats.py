@@ -0,0 +1,20 @@
+from decimal import Decimal
+
+from src.product.price_stats import variant_stats_query
+
+from .conftest import insert_product, insert_variant
+
+
+def test_zero_prices_are_left_out_of_the_stats(engine):
+    with engine.begin() as connection:
+        insert_product(connection, 1)
+        insert_variant(connection, 1, regular_price=0, discount_price=0)
+        insert_variant(connection, 1, regular_price=50, discount_price=40)
+        insert_variant(connection, 1, regular_price=80, discount_price=None)
+        insert_product(connection, 2)
+        insert_variant(connection, 2, regular_price=0, discount_price=0)
+
+        stats = {row[0]: row[1:5] for row in connection.execute(variant_stats_query())}
+
+    assert stats[1] == (Decimal(50), Decimal(80), Decimal(40), Decimal(40))
+    assert stats[2] == (None, None, None, None)
@@ -0,0 +1,35 @@
+from src.product.models import Product
+from src.product.queries import products_query, top_products_query
+
+from .conftest import insert_product
+
+
+def test_top_products_rank_by_rating_and_total_sold(engine):
+    with engine.begin() as connection:
+        for id, rating, total_sold in [
+            (1, 3, 50),
+            (2, 5, 10),
+            (3, 4, 50),
+            (4, 5, 0),
+            (5, 1, 90),
+        ]:
+            insert_product(
+                connection,
+                id,
+                name=f"Product {9 - id}",
+                rating=rating,
+                total_sold=total_sold,
+            )
+        # products_query still orders by name: ranking must replace that order
+        query = products_query().filter(Product.id != 5)
+
+        rows = connection.execute(top_products_query(query, 3)).all()
+
+    assert rows == [
+        ("rating", 2),
+        ("rating", 4),
+        ("rating", 3),
+        ("total_sold", 1),
+        ("total_sold", 3),
+        ("total_sold", 2),
+    ]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+from fakeredis import FakeAsyncRedis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src import database
+from src.config import settings
+from src.product import search_index
+from src.product.search_index import (
+    SEARCH_READY_KEY,
+    gram_key,
+    grams,
+    rebuild_search_index,
+    search_candidates,
+)
+
+from .conftest import insert_category, insert_product, metadata
+
+
+@pytest.fixture
+def index(monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(database, "redis_pool", redis)
+    monkeypatch.setattr(settings, "SEARCH_INDEX_ENABLED", True)
+
+    async def build():
+        for gram in grams("blue shirt"):
+            await redis.sadd(gram_key(gram), 1)
+        await redis.set(SEARCH_READY_KEY, 1)
+
+    asyncio.run(build())
+    return redis
+
+
+def test_search_candidates_narrow_a_plain_term(index):
+    assert asyncio.run(search_candidates("shirt")) == [1]
+    assert asyncio.run(search_candidates("trousers")) == []
+
+
+@pytest.mark.parametrize("search", ["sh_rt", "blue%shirt", "%shirt"])
+def test_search_candidates_skip_like_wildcards(index, search):
+    assert asyncio.run(search_candidates(search)) is None
+
+
+def test_rebuild_reaches_writes_that_skipped_the_hooks(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'shop.db'}"
+    engine = sa.create_engine(url)
+    metadata().create_all(engine)
+    with engine.begin() as connection:
+        insert_category(connection)
+        insert_product(connection, 1, name="Blue shirt")
+    engine.dispose()
+    async_engine = create_async_engine(url.replace("sqlite", "sqlite+aiosqlite"))
+    monkeypatch.setattr(
+        search_index,
+        "AsyncSessionLocal",
+        async_sessionmaker(async_engine, class_=AsyncSession),
+    )
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(database, "redis_pool", redis)
+    monkeypatch.setattr(settings, "SEARCH_INDEX_ENABLED", True)
+
+    async def rebuild():
+        await rebuild_search_index(redis)
+        await async_engine.dispose()
+        return await redis.ttl(SEARCH_READY_KEY), await search_candidates("shirt")
+
+    ttl, candidates = asyncio.run(rebuild())
+    assert 0 < ttl <= settings.SEARCH_INDEX_REBUILD_INTERVAL
+    assert candidates == [1]
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from src import database
+from src.config import settings
+from src.product import suggest
+
+SUGGESTIONS = [
+    # More light names in the "a" range than one keystroke scans
+    *(("product", f"Aaron {i:03}", f"aaron-{i:03}", 1.0) for i in range(300)),
+    ("product", "Azure Shirt", "azure-shirt", 100.0),
+    ("brand", "Atlas", "atlas", 50.0),
+    # Reachable from "a" twice, listed once
+    ("tag", "Arctic Alpine", "arctic-alpine", 20.0),
+]
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(database, "redis_pool", redis)
+    monkeypatch.setattr(settings, "SUGGEST_SCAN_LIMIT", 200)
+
+    async def load_suggestions(db):
+        return SUGGESTIONS
+
+    monkeypatch.setattr(suggest, "load_suggestions", load_suggestions)
+    asyncio.run(suggest.rebuild_suggestions(redis, None))
+    return redis
+
+
+def slugs(prefix: str, limit: int) -> list[str]:
+    return [
+        label["slug"] for label in asyncio.run(suggest.get_suggestions(prefix, limit))
+    ]
+
+
+def test_short_prefixes_rank_every_name(redis):
+    assert slugs("a", 4) == ["azure-shirt", "atlas", "arctic-alpine", "aaron-000"]
+    assert slugs("A", 2) == ["azure-shirt", "atlas"]
+    assert slugs("s", 5) == ["azure-shirt"]
+
+
+def test_longer_prefixes_scan_their_range(redis):
+    assert slugs("aaron 01", 3) == ["aaron-010", "aaron-011", "aaron-012"]
+    assert slugs("azure s", 5) == ["azure-shirt"]
+    assert slugs("zzzz", 5) == []
+
+
+def test_unknown_short_prefix(redis):
+    assert slugs("q", 5) == []
@@ -0,0 +1,33 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+from src.product.utlis import get_response
+
+
+def product(id: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=id,
+        name="Shirt",
+        slug="shirt",
+        public_id="abc",
+        rating=Decimal("4.5"),
+        total_sold=3,
+    )
+
+
+def test_get_response_without_price_stats():
+    # products_query outer joins the stats: a product without a row has None
+    (item,) = get_response([(product(1), None, None, None, None, None, None)])
+
+    assert item["regular_price_min"] is None
+    assert item["regular_price_max"] is None
+    assert item["discount"] is None
+
+
+def test_get_response_with_price_stats():
+    row = (product(1), 1, Decimal("50.00"), Decimal("80.00"), Decimal(40), None, 20)
+    (item,) = get_response([row])
+
+    assert item["regular_price_min"] == 50
+    assert item["regular_price_max"] == 80
+    assert item["discount"] == 20